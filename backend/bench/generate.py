@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Générateur déterministe de données synthétiques pour le schéma en étoile
+(dim_date, dim_client, dim_employe, dim_produit, faits_ventes) et la table `logs`.
+
+- Même graine + mêmes paramètres => mêmes fichiers / mêmes lignes en base.
+- Produits et clients suivent une loi de Zipf (quelques best-sellers et gros
+  clients concentrent la majorité des ventes), les lignes sont regroupées en tickets.
+- Deux sorties possibles :
+    * classeurs Excel au format attendu par `etl_from_excel` / `load_logs_from_excel`
+      (limités à ~1M de lignes par feuille, contrainte Excel) ;
+    * chargement direct en base par COPY, par paquets, pour les grandes échelles
+      (jusqu'à 50M de faits en mémoire constante).
+
+Usage :
+    python -m backend.bench.generate --facts 100000 --out backend/data/bench
+    python -m backend.bench.generate --facts 50000000 --db --truncate
+"""
+import argparse
+import io
+import os
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+# Nombre max de lignes de données dans une feuille Excel (en-tête exclu)
+EXCEL_MAX_ROWS = 1_048_575
+EXCEL_ORIGIN = pd.Timestamp("1899-12-30")
+
+# Préfixe EAN-13 « France » : les codes restent réalistes et tiennent en BIGINT
+EAN_BASE = 3_560_000_000_000
+
+RAYONS = {
+    "Frais": ["Crèmerie", "Boucherie", "Traiteur"],
+    "Épicerie": ["Épicerie salée", "Épicerie sucrée", "Petit-déjeuner"],
+    "Boissons": ["Eaux", "Sodas", "Vins"],
+    "Hygiène": ["Soins", "Entretien"],
+    "Fruits et légumes": ["Fruits", "Légumes"],
+}
+PRENOMS = ["Camille", "Léa", "Hugo", "Louis", "Manon", "Jules", "Inès", "Nathan", "Chloé", "Lucas"]
+NOMS = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau"]
+
+# Tables vidées par --truncate (ordre indifférent grâce à TRUNCATE ... CASCADE)
+TABLES = ["faits_ventes", "dim_date", "dim_client", "dim_employe", "dim_produit", "logs", "logs_stats_jour",
+          "logs_changes", "etl_rejects", "etl_files", "client_rfm", "hll_sketches", "basket_pairs", "basket_items",
+          "basket_meta"]
+
+
+@dataclass(frozen=True)
+class Scale:
+    facts: int
+    products: int
+    clients: int
+    employes: int
+    days: int
+    log_events: int
+    ticket_size: float = 4.0
+    skew: float = 1.1
+    start: str = "2024-01-01"
+    seed: int = 42
+
+
+def scale_for(facts: int, **overrides) -> Scale:
+    """
+    Dérive des cardinalités plausibles à partir du nombre de faits voulu
+    (10k → 50M). Chaque valeur peut être forcée via `overrides`.
+    """
+    base = Scale(
+        facts=int(facts),
+        products=int(min(100_000, max(200, facts // 200))),
+        clients=int(min(5_000_000, max(100, facts // 25))),
+        employes=int(min(2_000, max(5, facts // 50_000))),
+        days=366,
+        log_events=int(min(200_000, max(100, facts // 100))),
+    )
+    return replace(base, **{k: v for k, v in overrides.items() if v is not None})
+
+
+def _zipf_weights(n: int, s: float, rng: np.random.Generator) -> np.ndarray:
+    """Probabilités de Zipf tronquées à n éléments, rangs mélangés."""
+    w = 1.0 / np.power(np.arange(1, n + 1, dtype=np.float64), s)
+    w /= w.sum()
+    return rng.permutation(w)
+
+
+def _to_serial(dates: pd.DatetimeIndex) -> np.ndarray:
+    """Dates -> numéro de série Excel (origine 1899-12-30)."""
+    return (dates - EXCEL_ORIGIN).days.to_numpy()
+
+
+def build_dimensions(scale: Scale) -> dict:
+    """Construit les quatre dimensions sous forme de DataFrames (colonnes = schéma SQL)."""
+    rng = np.random.default_rng(scale.seed)
+    start = pd.Timestamp(scale.start)
+
+    days = pd.date_range(start, periods=scale.days, freq="D")
+    dates = pd.DataFrame({
+        "id_date": days.strftime("%Y%m%d").astype(int),
+        "annee": days.year,
+        "mois": days.month,
+        "jour": days.day,
+        "mois_nom": days.strftime("%B"),
+        "annee_mois": days.strftime("%Y%m").astype(int),
+        "jour_semaine": days.day_name(),
+        "trimestre": "Q" + days.quarter.astype(str),
+    })
+
+    insc = start - pd.to_timedelta(rng.integers(0, 5 * 365, scale.clients), unit="D")
+    clients = pd.DataFrame({
+        "id_client": [f"C{i:08d}" for i in range(scale.clients)],
+        "date_inscription": insc.date,
+    })
+
+    prenoms = rng.choice(PRENOMS, scale.employes)
+    noms = rng.choice(NOMS, scale.employes)
+    debut = start - pd.to_timedelta(rng.integers(0, 10 * 365, scale.employes), unit="D")
+    employes = pd.DataFrame({
+        "id_employe": [f"E{i:05d}" for i in range(scale.employes)],
+        "employe": [f"{p[0].lower()}{n.lower()}{i}" for i, (p, n) in enumerate(zip(prenoms, noms))],
+        "prenom": prenoms,
+        "nom": noms,
+        "date_debut": debut.date,
+        "hash_mdp": [f"{h:064x}" for h in rng.integers(0, 2 ** 62, scale.employes)],
+        "mail": [f"e{i:05d}@supersmartmarket.fr" for i in range(scale.employes)],
+    })
+
+    rayon_names = np.array(list(RAYONS))
+    rayon_idx = rng.integers(0, len(rayon_names), scale.products)
+    categories = [RAYONS[r][k % len(RAYONS[r])]
+                  for r, k in zip(rayon_names[rayon_idx], rng.integers(0, 3, scale.products))]
+    produits = pd.DataFrame({
+        "ean": EAN_BASE + np.arange(scale.products, dtype=np.int64),
+        "category": categories,
+        "rayon": rayon_names[rayon_idx],
+        "libelle": [f"Produit {i}" for i in range(scale.products)],
+        "prix": np.round(rng.lognormal(mean=1.0, sigma=0.8, size=scale.products), 2).clip(0.1, 500),
+    })
+
+    return {"dates": dates, "clients": clients, "emps": employes, "prods": produits}
+
+
+def iter_faits(scale: Scale, dims: dict, chunk_size: int = 1_000_000, first: int = 0, count: int = None):
+    """
+    Génère les lignes de faits par paquets de `chunk_size` (mémoire constante).
+    Chaque paquet a son propre générateur (graine, n° de paquet) : le résultat
+    ne dépend que de la graine et de la taille de paquet.
+    """
+    count = scale.facts if count is None else count
+    rng0 = np.random.default_rng(scale.seed)
+    p_prod = _zipf_weights(scale.products, scale.skew, rng0)
+    p_client = _zipf_weights(scale.clients, scale.skew, rng0)
+
+    id_dates = dims["dates"]["id_date"].to_numpy()
+    clients = dims["clients"]["id_client"].to_numpy()
+    emps = dims["emps"]["id_employe"].to_numpy()
+    eans = dims["prods"]["ean"].to_numpy()
+    prix = dims["prods"]["prix"].to_numpy()
+
+    next_ticket = first
+    for chunk_no, offset in enumerate(range(0, count, chunk_size)):
+        n = min(chunk_size, count - offset)
+        rng = np.random.default_rng([scale.seed, first, chunk_no])
+
+        # Tailles de tickets géométriques, tronquées pour couvrir exactement n lignes
+        sizes = rng.geometric(1.0 / scale.ticket_size, size=n)
+        sizes = sizes[: np.searchsorted(np.cumsum(sizes), n) + 1]
+        sizes[-1] -= sizes.sum() - n
+        n_tickets = len(sizes)
+        ticket_of_line = np.repeat(np.arange(n_tickets), sizes)
+
+        t_client = rng.choice(len(clients), n_tickets, p=p_client)
+        t_emp = rng.integers(0, len(emps), n_tickets)
+        t_date = rng.integers(0, len(id_dates), n_tickets)
+
+        ids = np.arange(first + offset, first + offset + n)
+        prod = rng.choice(len(eans), n, p=p_prod)
+        quantite = 1 + rng.poisson(0.3, n)
+        yield pd.DataFrame({
+            "id_fait": np.char.add("F", np.char.zfill(ids.astype(str), 10)),
+            "id_date": id_dates[t_date][ticket_of_line],
+            "id_client": clients[t_client][ticket_of_line],
+            "id_employe": emps[t_emp][ticket_of_line],
+            "ean": eans[prod],
+            "id_ticket": np.char.add("T", np.char.zfill((next_ticket + ticket_of_line).astype(str), 10)),
+            "quantite": quantite,
+            "montant": np.round(prix[prod] * quantite, 2),
+        })
+        next_ticket += n_tickets
+
+
+def build_logs(scale: Scale, dims: dict) -> pd.DataFrame:
+    """
+    Journal d'audit au format de la feuille « Logs » :
+      - 60 % d'INSERT Ventes (une ligne par champ, ventes postérieures aux faits de base),
+      - 30 % d'UPDATE Produits.prix,
+      - 10 % d'INSERT Client.
+    """
+    rng = np.random.default_rng([scale.seed, 1])
+    start = pd.Timestamp(scale.start)
+    n = scale.log_events
+    kinds = rng.choice(3, n, p=[0.6, 0.3, 0.1])
+    times = start + pd.to_timedelta(np.sort(rng.integers(0, scale.days * 86_400, n)), unit="s")
+    users = rng.integers(1, 21, n)
+    prods = dims["prods"]
+
+    ventes_idx = np.flatnonzero(kinds == 0)
+    ventes = next(iter_faits(scale, dims, chunk_size=max(1, len(ventes_idx)),
+                             first=scale.facts, count=len(ventes_idx)), None)
+    ventes = list(ventes.itertuples(index=False)) if ventes is not None else []
+
+    rows = []
+    n_vente = 0
+    n_client = scale.clients
+    for i, kind in enumerate(kinds):
+        user, when = f"U{users[i]:03d}", times[i]
+        if kind == 0:
+            v = ventes[n_vente]
+            n_vente += 1
+            day = pd.to_datetime(str(v.id_date), format="%Y%m%d").strftime("%Y-%m-%d")
+            for champ, detail in [("customer_id", v.id_client), ("id_employe", v.id_employe),
+                                  ("ean", str(v.ean)), ("date", day), ("id_ticket", v.id_ticket),
+                                  ("quantite", str(v.quantite))]:
+                rows.append((user, when, "INSERT", "Ventes", v.id_fait, champ, detail))
+        elif kind == 1:
+            k = rng.integers(0, len(prods))
+            new_price = round(float(prods["prix"].iat[k]) * rng.uniform(0.8, 1.25), 2)
+            rows.append((user, when, "UPDATE", "Produits", str(prods["ean"].iat[k]), "prix", new_price))
+        else:
+            rows.append((user, when, "INSERT", "Client", f"C{n_client:08d}",
+                         "date_inscription", when.strftime("%d/%m/%Y")))
+            n_client += 1
+
+    return pd.DataFrame(rows, columns=["id_user", "date", "action", "table_insert", "id_ligne", "champs", "detail"])
+
+
+def write_workbook(path: str, scale: Scale) -> str:
+    """Écrit un classeur au format de l'extraction 2024 (feuilles lues par `etl_from_excel`)."""
+    if scale.facts > EXCEL_MAX_ROWS:
+        raise ValueError(f"{scale.facts} faits > {EXCEL_MAX_ROWS} lignes max par feuille Excel : utiliser --db")
+    dims = build_dimensions(scale)
+    faits = pd.concat(iter_faits(scale, dims), ignore_index=True)
+    day = pd.to_datetime(faits["id_date"].astype(str), format="%Y%m%d")
+    prods = dims["prods"]
+    emps = dims["emps"]
+
+    with pd.ExcelWriter(path, engine="openpyxl") as xw:
+        pd.DataFrame({"DATE": _to_serial(pd.to_datetime(dims["dates"]["id_date"].astype(str), format="%Y%m%d"))}) \
+            .to_excel(xw, sheet_name="Calendrier", index=False)
+        pd.DataFrame({
+            "CUSTOMER_ID": dims["clients"]["id_client"],
+            "DATE_INSCRIPTION": pd.to_datetime(dims["clients"]["date_inscription"]).dt.strftime("%d/%m/%Y"),
+        }).to_excel(xw, sheet_name="Clients", index=False)
+        pd.DataFrame({
+            "ID_EMPLOYE": emps["id_employe"],
+            "EMPLOYE": emps["employe"],
+            "PRENOM": emps["prenom"],
+            "NOM": emps["nom"],
+            "DATE_DEBUT": _to_serial(pd.to_datetime(emps["date_debut"])),
+            "HASH_MDP": emps["hash_mdp"],
+            "MAIL": emps["mail"],
+        }).to_excel(xw, sheet_name="Employé", index=False)
+        pd.DataFrame({
+            "EAN": prods["ean"],
+            "CATEGORIE": prods["category"],
+            "RAYON": prods["rayon"],
+            "LIBELLE": prods["libelle"],
+            "PRIX": prods["prix"],
+        }).to_excel(xw, sheet_name="Produits", index=False)
+        pd.DataFrame({
+            "ID_BDD": faits["id_fait"],
+            "DATE": _to_serial(pd.DatetimeIndex(day)),
+            "CUSTOMER_ID": faits["id_client"],
+            "ID_EMPLOYE": faits["id_employe"],
+            "EAN": faits["ean"],
+            "ID_TICKET": faits["id_ticket"],
+            "QUANTITE": faits["quantite"],
+        }).to_excel(xw, sheet_name="Vente Détail", index=False)
+    return path
+
+
+def write_logs_workbook(path: str, scale: Scale) -> str:
+    """Écrit le classeur de logs (feuille « Logs ») lu par `load_logs_from_excel`."""
+    logs = build_logs(scale, build_dimensions(scale))
+    logs["date"] = logs["date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    with pd.ExcelWriter(path, engine="openpyxl") as xw:
+        logs.to_excel(xw, sheet_name="Logs", index=False)
+    return path
+
+
+def _copy_frame(cursor, table: str, df: pd.DataFrame):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def load_into_db(scale: Scale, truncate: bool = False, chunk_size: int = 1_000_000) -> dict:
+    """
+    Charge dimensions + faits directement par COPY (sans passer par Excel), puis construit
+    les index dérivés que l'ETL aurait tenus à jour : sketches HLL et rollups partagés.
+    Retourne le nombre de lignes chargées par table.
+    """
+    from backend.database import SessionLocal, engine
+    from backend.olap.hll import rebuild_sketches
+    from backend.olap.shared import build_aggregates
+
+    if truncate:
+        truncate_all()
+    dims = build_dimensions(scale)
+    counts = {}
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        for table, key in [("dim_date", "dates"), ("dim_client", "clients"),
+                           ("dim_employe", "emps"), ("dim_produit", "prods")]:
+            _copy_frame(cur, table, dims[key])
+            counts[table] = len(dims[key])
+        conn.commit()
+
+        counts["faits_ventes"] = 0
+        for chunk in iter_faits(scale, dims, chunk_size=chunk_size):
+            _copy_frame(cur, "faits_ventes", chunk)
+            conn.commit()
+            counts["faits_ventes"] += len(chunk)
+    finally:
+        conn.close()
+
+    session = SessionLocal()
+    try:
+        counts["hll_sketches"] = rebuild_sketches(session)
+        session.commit()
+    finally:
+        session.close()
+    build_aggregates()
+    return counts
+
+
+def truncate_all():
+    """Vide les tables du jeu et retire les rollups partagés (sinon servis pour l'échelle précédente)."""
+    from backend.database import engine
+    from backend.olap.shared import invalidate
+
+    conn = engine.raw_connection()
+    try:
+        conn.cursor().execute(f"TRUNCATE {', '.join(TABLES)} CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Générateur de données synthétiques (schéma en étoile + logs)")
+    parser.add_argument("--facts", type=int, required=True, help="nombre de lignes de faits (10k → 50M)")
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--clients", type=int)
+    parser.add_argument("--employes", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--log-events", type=int)
+    parser.add_argument("--skew", type=float, help="exposant de Zipf produits/clients (défaut 1.1)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", help="dossier de sortie des classeurs Excel")
+    parser.add_argument("--db", action="store_true", help="charge directement en base par COPY")
+    parser.add_argument("--truncate", action="store_true", help="vide les tables avant chargement (--db)")
+    args = parser.parse_args()
+
+    scale = scale_for(args.facts, products=args.products, clients=args.clients, employes=args.employes,
+                      days=args.days, log_events=args.log_events, skew=args.skew, seed=args.seed)
+    print(f"→ {scale}")
+
+    if args.db:
+        print(f"→ Chargé en base : {load_into_db(scale, truncate=args.truncate)}")
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        if not args.db:
+            print(f"→ {write_workbook(os.path.join(args.out, f'olap-{scale.facts}.xlsx'), scale)}")
+        print(f"→ {write_logs_workbook(os.path.join(args.out, f'logs-{scale.facts}.xlsx'), scale)}")
+    if not args.db and not args.out:
+        parser.error("préciser --out et/ou --db")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Test de charge HTTP concurrent contre une application lancée localement.
+
+Des clients virtuels (coroutines httpx) rejouent en boucle un mélange pondéré de
+routes `/analytics/*`, `/logs/*` et d'ingestion (`POST /faits/faits/ventes`), par paliers
+de concurrence croissante (`--ramp 1 5 10 25 50`, `--duration` secondes par palier).
+Pour chaque palier et chaque route : débit (req/s), latences p50 / p95 / p99 et taux
+d'erreur (HTTP >= 400 ou exception).
+
+Le rapport JSON (et sa version Markdown) se compare entre deux versions :
+    python -m backend.bench.loadtest run --url http://localhost:8001 --facts 100000 --seed-db \\
+        --ramp 1 10 50 --output load-v1.json --markdown load-v1.md
+    python -m backend.bench.loadtest compare load-v1.json load-v2.json
+
+`--seed-db` vide les tables puis charge le jeu synthétique de `generate.py` (faits par
+COPY, logs par load_logs_from_frame puis application) : à lancer uniquement sur une
+base PostgreSQL locale. Sans `--seed-db`, `--facts` / `--seed` doivent décrire le jeu
+déjà chargé (les paramètres des requêtes en sont dérivés).
+
+Paramètres tirés : par défaut, clients et EAN uniformes dans le jeu synthétique. Une
+partie n'a aucune vente : /analytics/rfm/{client} et /basket/associations répondent
+alors 404, compté comme attendu (cf. `expect`) mais plus rapide qu'une vraie lecture.
+`--sample-db` tire plutôt clients et EAN parmi ceux qui ont des ventes (lecture en base
+au lancement, accès PostgreSQL requis depuis la machine de test).
+
+Écritures : `POST /faits/faits/ventes` recalcule le jour de la vente dans les rollups
+partagés (update_aggregates), qui restent servis pendant l'ingestion. `--no-ingest` retire
+les écritures du mélange, `--rebuild` reconstruit les rollups
+(POST /analytics/aggregates/rebuild) avant chaque palier.
+
+Mélange personnalisé : `--mix mix.json`, liste d'objets
+    {"name": ..., "method": "GET", "path": ..., "params": {...}, "json": {...}, "weight": 1,
+     "expect": [200]}
+où les chaînes peuvent contenir {start}, {end}, {id_date}, {ean}, {client}, {employe}, {seq} ;
+`expect` liste les statuts HTTP normaux de la route (défaut : tout statut < 400).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from itertools import count
+
+import numpy as np
+
+from backend.bench.generate import EAN_BASE, scale_for
+
+# (nom, méthode, chemin, paramètres, corps JSON, poids[, statuts attendus]) : tableau de bord surtout en lecture
+DEFAULT_MIX = [
+    ("revenue_by_month", "GET", "/analytics/revenue_by_month", {"from": "{start}", "to": "{end}"}, None, 10),
+    ("monthly_revenue", "GET", "/analytics/monthly_revenue", {}, None, 8),
+    ("revenue_by_date", "GET", "/analytics/revenue_by_date/{id_date}", {}, None, 8),
+    ("top_clients", "GET", "/analytics/top_clients", {"limit": 10, "from": "{start}", "to": "{end}"}, None, 8),
+    ("revenue_share_by_employee", "GET", "/analytics/revenue_share_by_employee", {}, None, 6),
+    ("distinct_clients_approx", "GET", "/analytics/distinct_counts", {"by": "employe", "approx": "true"}, None, 4),
+    ("basket_associations", "GET", "/analytics/basket/associations", {"ean": "{ean}"}, None, 6, [200, 404]),
+    ("rfm_client", "GET", "/analytics/rfm/{client}", {}, None, 4, [200, 404]),
+    ("logs", "GET", "/logs/", {"limit": 100}, None, 6),
+    ("logs_par_plage", "GET", "/logs/par‐plage", {"date_debut": "{start}", "date_fin": "{end}"}, None, 4),
+    ("logs_stats", "GET", "/logs/stats", {"by": "jour", "date_debut": "{start}", "date_fin": "{end}"}, None, 4),
+    ("logs_corrections_ventes", "GET", "/logs/corrections‐ventes", {"date_debut": "{start}"}, None, 2),
+    ("ingest_vente", "POST", "/faits/faits/ventes", {}, {
+        "id_fait": "LT{seq}", "id_date": "{id_date}", "id_client": "{client}", "id_employe": "{employe}",
+        "ean": "{ean}", "id_ticket": "LT{seq}", "quantite": 1,
+    }, 4),
+]
+
+
+def load_mix(path: str = None, ingest: bool = True) -> list:
+    if path is None:
+        mix = [dict(zip(["name", "method", "path", "params", "json", "weight", "expect"], r)) for r in DEFAULT_MIX]
+    else:
+        with open(path, encoding="utf-8") as f:
+            mix = json.load(f)
+    for route in mix:
+        route.setdefault("method", "GET")
+        route.setdefault("params", {})
+        route.setdefault("json", None)
+        route.setdefault("weight", 1)
+        route.setdefault("expect", None)
+    if not ingest:
+        mix = [r for r in mix if r["method"] == "GET"]
+    return mix
+
+
+def sample_entities(limit: int = 10_000) -> dict:
+    """Clients et EAN ayant au moins une vente, tirés en base (pour --sample-db)."""
+    from sqlalchemy import text
+
+    from backend.database import engine
+
+    with engine.connect() as conn:
+        clients = [r[0] for r in conn.execute(
+            text("SELECT id_client FROM client_rfm ORDER BY random() LIMIT :n"), {"n": limit})]
+        eans = [r[0] for r in conn.execute(
+            text("SELECT ean FROM (SELECT DISTINCT ean FROM faits_ventes) e ORDER BY random() LIMIT :n"),
+            {"n": limit})]
+    return {"clients": clients, "eans": eans}
+
+
+def _fill(template, values: dict):
+    """Remplace les {clés} dans les chaînes d'un gabarit (dict / liste / chaîne)."""
+    if isinstance(template, str):
+        return template.format(**values)
+    if isinstance(template, dict):
+        return {k: _fill(v, values) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_fill(v, values) for v in template]
+    return template
+
+
+class Workload:
+    """Tirage des requêtes : route pondérée et valeurs du jeu synthétique (clients, EAN, jours…)."""
+
+    def __init__(self, mix: list, facts: int, seed: int, tag: str, entities: dict = None):
+        self.mix = mix
+        self.weights = [r["weight"] for r in mix]
+        self.scale = scale_for(facts, seed=seed)
+        self.start = datetime.date.fromisoformat(self.scale.start)
+        self.tag = tag
+        self.seq = count()
+        entities = entities or {}
+        self.clients = entities.get("clients") or None  # None : tirage uniforme dans le jeu
+        self.eans = entities.get("eans") or None
+
+    def next(self, rng: random.Random):
+        route = rng.choices(self.mix, weights=self.weights)[0]
+        day = self.start + datetime.timedelta(days=rng.randrange(self.scale.days))
+        values = {
+            "start": day.isoformat(),
+            "end": (day + datetime.timedelta(days=30)).isoformat(),
+            "id_date": day.strftime("%Y%m%d"),
+            "ean": rng.choice(self.eans) if self.eans else EAN_BASE + rng.randrange(self.scale.products),
+            "client": rng.choice(self.clients) if self.clients else f"C{rng.randrange(self.scale.clients):08d}",
+            "employe": f"E{rng.randrange(self.scale.employes):05d}",
+            "seq": f"{self.tag}{next(self.seq):08d}",
+        }
+        return route, _fill(route["path"], values), _fill(route["params"], values), _fill(route["json"], values)
+
+
+async def _client_loop(client, workload: Workload, rng: random.Random, deadline: float, samples: list):
+    while time.perf_counter() < deadline:
+        route, path, params, body = workload.next(rng)
+        t0 = time.perf_counter()
+        try:
+            resp = await client.request(route["method"], path, params=params, json=body)
+            status = resp.status_code
+            ok = status in route["expect"] if route["expect"] else status < 400
+        except Exception as e:  # délai dépassé, connexion refusée…
+            status, ok = type(e).__name__, False
+        samples.append((route["name"], time.perf_counter() - t0, status, ok))
+
+
+def _percentiles(latencies) -> dict:
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2),
+            "max_ms": round(max(latencies) * 1000, 2)}
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """`samples` : (route, latence, statut, statut attendu) ; erreur = statut inattendu ou exception."""
+    by_route = defaultdict(list)
+    for name, latency, status, ok in samples:
+        by_route[name].append((latency, status, ok))
+
+    def stats(rows):
+        latencies = [r[0] for r in rows]
+        statuses = Counter(str(r[1]) for r in rows)
+        errors = sum(1 for r in rows if not r[2])
+        return {
+            "requests": len(rows),
+            "rps": round(len(rows) / elapsed, 2),
+            **_percentiles(latencies),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4),
+            "statuses": dict(statuses),
+        }
+
+    return {
+        "duration_s": round(elapsed, 2),
+        **(stats([r[1:] for r in samples]) if samples else {"requests": 0}),
+        "routes": {name: stats(rows) for name, rows in sorted(by_route.items())},
+    }
+
+
+async def run_stage(url: str, workload: Workload, concurrency: int, duration: float, warmup: float,
+                    timeout: float, seed: int, rebuild: bool = False) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        if rebuild:  # rollups republiés : les écritures du palier précédent les avaient retirés
+            (await client.post("/analytics/aggregates/rebuild", timeout=max(timeout, 300))).raise_for_status()
+        rngs = [random.Random(seed * 100_003 + concurrency * 1_009 + i) for i in range(concurrency)]
+        if warmup > 0:  # connexions ouvertes et caches chauds, non comptés
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(_client_loop(client, workload, r, deadline, []) for r in rngs))
+        samples = []
+        t0 = time.perf_counter()
+        deadline = t0 + duration
+        await asyncio.gather(*(_client_loop(client, workload, r, deadline, samples) for r in rngs))
+        elapsed = time.perf_counter() - t0
+    return {"concurrency": concurrency, **summarize(samples, elapsed)}
+
+
+def seed_database(facts: int, seed: int) -> dict:
+    """Vide les tables et charge le jeu synthétique (faits par COPY, logs chargés puis appliqués)."""
+    from backend.bench.generate import build_dimensions, build_logs, load_into_db, truncate_all
+    from backend.etl.apply_logs import apply_pending_logs
+    from backend.etl.load_logs import load_logs_from_frame
+    from backend.etl.rfm import refresh_rfm
+
+    scale = scale_for(facts, seed=seed)
+    truncate_all()
+    counts = load_into_db(scale)
+    logs = build_logs(scale, build_dimensions(scale))
+    logs["date"] = logs["date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    counts["logs"] = load_logs_from_frame(logs)["inseres"]
+    counts["apply"] = apply_pending_logs()
+    refresh_rfm()
+    return counts
+
+
+def _meta(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "url": args.url,
+        "facts": args.facts,
+        "seed": args.seed,
+        "duration_s": args.duration,
+        "mix": args.mix or "default",
+        "ingest": not args.no_ingest,
+        "sample_db": args.sample_db,
+        "rebuild": args.rebuild,
+    }
+
+
+def to_markdown(report: dict) -> str:
+    meta = report["meta"]
+    lines = [
+        f"# Test de charge — {meta['commit'] or '?'} ({meta['timestamp']})",
+        "",
+        f"{meta['url']}, {meta['facts']} faits, {meta['duration_s']} s par palier, mélange {meta['mix']}"
+        f"{'' if meta.get('ingest', True) else ' sans écritures'}"
+        f"{', clients / EAN tirés en base' if meta.get('sample_db') else ''}"
+        f"{', rollups reconstruits à chaque palier' if meta.get('rebuild') else ''}.",
+        "",
+        "| clients | req/s | p50 ms | p95 ms | p99 ms | erreurs |",
+        "|---:|---:|---:|---:|---:|---:|",
+    ]
+    for s in report["stages"]:
+        if s["requests"]:
+            lines.append(f"| {s['concurrency']} | {s['rps']} | {s['p50_ms']} | {s['p95_ms']} | {s['p99_ms']} "
+                         f"| {s['error_rate']:.2%} |")
+    for s in report["stages"]:
+        lines += [
+            "",
+            f"## {s['concurrency']} client(s)",
+            "",
+            "| route | req | req/s | p50 ms | p95 ms | p99 ms | erreurs |",
+            "|---|---:|---:|---:|---:|---:|---:|",
+        ]
+        for name, r in s["routes"].items():
+            lines.append(f"| {name} | {r['requests']} | {r['rps']} | {r['p50_ms']} | {r['p95_ms']} | {r['p99_ms']} "
+                         f"| {r['error_rate']:.2%} |")
+    return "\n".join(lines) + "\n"
+
+
+def run(args):
+    if args.seed_db:
+        print(f"→ Jeu synthétique chargé : {seed_database(args.facts, args.seed)}")
+
+    entities = sample_entities() if args.sample_db else None
+    workload = Workload(load_mix(args.mix, ingest=not args.no_ingest), args.facts, args.seed,
+                        tag=f"{int(time.time()) % 100_000:05d}", entities=entities)
+    report = {"meta": _meta(args), "stages": []}
+    for concurrency in args.ramp:
+        stage = asyncio.run(run_stage(args.url, workload, concurrency, args.duration, args.warmup,
+                                      args.timeout, args.seed, rebuild=args.rebuild))
+        report["stages"].append(stage)
+        if stage["requests"]:
+            print(f"  • {concurrency:>4} clients  {stage['rps']:>9.1f} req/s  p50 {stage['p50_ms']:>8.1f} ms  "
+                  f"p95 {stage['p95_ms']:>8.1f} ms  p99 {stage['p99_ms']:>8.1f} ms  erreurs {stage['error_rate']:.2%}")
+        else:
+            print(f"  • {concurrency:>4} clients  aucune réponse")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Rapport écrit : {args.output}")
+    if args.markdown:
+        with open(args.markdown, "w", encoding="utf-8") as f:
+            f.write(to_markdown(report))
+        print(f"✅ Rapport Markdown écrit : {args.markdown}")
+
+
+def compare(args):
+    """Pour chaque palier commun : débit et p95 par route, ancien → nouveau."""
+    with open(args.old, encoding="utf-8") as f:
+        old = {s["concurrency"]: s for s in json.load(f)["stages"]}
+    with open(args.new, encoding="utf-8") as f:
+        new = {s["concurrency"]: s for s in json.load(f)["stages"]}
+
+    for concurrency in sorted(old.keys() & new.keys()):
+        print(f"=== {concurrency} client(s)")
+        before, after = old[concurrency], new[concurrency]
+        rows = [("(total)", before, after)]
+        rows += [(name, r, after["routes"].get(name)) for name, r in before["routes"].items()]
+        for name, b, a in rows:
+            if not a or not a.get("requests") or not b.get("requests"):
+                print(f"  {name:<28} absent")
+                continue
+            print(f"  {name:<28} {b['rps']:>9.1f} → {a['rps']:>9.1f} req/s   "
+                  f"p95 {b['p95_ms']:>8.1f} → {a['p95_ms']:>8.1f} ms (x{a['p95_ms'] / b['p95_ms']:.2f})   "
+                  f"erreurs {b['error_rate']:.2%} → {a['error_rate']:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge HTTP concurrent")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="rejoue le mélange de requêtes par paliers de concurrence")
+    p_run.add_argument("--url", default="http://localhost:8001")
+    p_run.add_argument("--ramp", type=int, nargs="+", default=[1, 5, 10, 25, 50],
+                       help="nombre de clients simultanés de chaque palier")
+    p_run.add_argument("--duration", type=float, default=30, help="secondes mesurées par palier")
+    p_run.add_argument("--warmup", type=float, default=3, help="secondes de chauffe non comptées par palier")
+    p_run.add_argument("--timeout", type=float, default=30)
+    p_run.add_argument("--facts", type=int, default=100_000, help="taille du jeu synthétique chargé")
+    p_run.add_argument("--seed", type=int, default=42)
+    p_run.add_argument("--seed-db", action="store_true", help="vide les tables et charge le jeu synthétique")
+    p_run.add_argument("--mix", help="mélange de routes (JSON), sinon DEFAULT_MIX")
+    p_run.add_argument("--sample-db", action="store_true",
+                       help="tire clients et EAN parmi ceux qui ont des ventes (lecture en base)")
+    p_run.add_argument("--no-ingest", action="store_true",
+                       help="retire les écritures (POST /faits/faits/ventes) du mélange")
+    p_run.add_argument("--rebuild", action="store_true",
+                       help="reconstruit les rollups partagés avant chaque palier")
+    p_run.add_argument("--output", default="loadtest-report.json")
+    p_run.add_argument("--markdown", help="rapport Markdown en plus du JSON")
+    p_run.set_defaults(func=run)
+
+    p_cmp = sub.add_parser("compare", help="compare deux rapports JSON")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Banc de mesure des étapes ETL et des endpoints analytics / logs.
+
+Pour chaque échelle demandée :
+  1) vide les tables puis génère un jeu de données synthétique (cf. `generate.py`) ;
+  2) chronomètre `etl_from_excel` (ou le chargement direct par COPY en mode `db`),
+     `load_logs_from_excel` et `POST /logs/apply` ;
+  3) appelle chaque endpoint `/analytics/*` et `/logs/*` `--repeat` fois via
+     le TestClient FastAPI (pile complète : routage, SQL, sérialisation).
+
+Le rapport JSON produit peut être comparé entre deux versions :
+    python -m backend.bench.run run --facts 10000 100000 --output bench-v1.json
+    python -m backend.bench.run compare bench-v1.json bench-v2.json
+
+⚠️ Vide les tables du schéma : à lancer uniquement sur une base PostgreSQL locale.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from backend.bench.generate import (EAN_BASE, EXCEL_MAX_ROWS, scale_for, truncate_all, load_into_db,
+                                    write_workbook, write_logs_workbook)
+
+# (nom, chemin, paramètres) ; {start}/{end}/{id_date}/{ean} sont remplacés par des valeurs du jeu généré
+ENDPOINTS = [
+    ("revenue_by_month", "/analytics/revenue_by_month", {}),
+    ("revenue_by_month_30d", "/analytics/revenue_by_month", {"from": "{start}", "to": "{end}"}),
+    ("monthly_revenue", "/analytics/monthly_revenue", {}),
+    ("revenue_by_date", "/analytics/revenue_by_date/{id_date}", {}),
+    ("top_clients", "/analytics/top_clients", {"limit": 10}),
+    ("revenue_share_by_employee", "/analytics/revenue_share_by_employee", {}),
+    ("distinct_clients_exact", "/analytics/distinct_counts", {"by": "employe"}),
+    ("distinct_clients_approx", "/analytics/distinct_counts", {"by": "employe", "approx": "true"}),
+    ("basket_associations", "/analytics/basket/associations", {"ean": "{ean}"}),
+    ("logs", "/logs/", {"limit": 100}),
+    ("logs_by_table", "/logs/by-table/Produits", {}),
+    ("logs_par_plage", "/logs/par‐plage", {"date_debut": "{start}", "date_fin": "{end}"}),
+    ("logs_prix_produits", "/logs/prix‐produits", {"date_debut": "{start}"}),
+    ("logs_stat_clients", "/logs/stat‐clients‐par‐user", {}),
+    ("logs_corrections_ventes", "/logs/corrections‐ventes", {"date_debut": "{start}"}),
+]
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+def _summary(samples):
+    return {
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "n": len(samples),
+    }
+
+
+def _meta():
+    from sqlalchemy import text
+    from backend.database import engine
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    with engine.connect() as conn:
+        server = conn.execute(text("SHOW server_version")).scalar()
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "postgres": server,
+        "host": platform.node(),
+    }
+
+
+def bench_scale(client, facts: int, mode: str, repeat: int, seed: int, workdir: str) -> dict:
+    from backend.etl.load_olap import etl_from_excel
+    from backend.etl.load_logs import load_logs_from_excel
+
+    scale = scale_for(facts, seed=seed)
+    stages = {}
+    print(f"→ Échelle {facts} faits ({mode})")
+    truncate_all()
+
+    if mode == "xlsx":
+        olap_path = os.path.join(workdir, f"olap-{facts}.xlsx")
+        stages["generate_xlsx"], _ = _timed(write_workbook, olap_path, scale)
+        stages["etl_from_excel"], summary = _timed(etl_from_excel, olap_path)
+        stages.update({f"etl_from_excel.{k}": v for k, v in (summary or {}).get("durees", {}).items()})
+    else:
+        stages["load_db_copy"], _ = _timed(load_into_db, scale)
+
+    logs_path = os.path.join(workdir, f"logs-{facts}.xlsx")
+    stages["generate_logs_xlsx"], _ = _timed(write_logs_workbook, logs_path, scale)
+    stages["load_logs_from_excel"], summary = _timed(load_logs_from_excel, logs_path)
+    stages.update({f"load_logs_from_excel.{k}": v for k, v in (summary or {}).get("durees", {}).items()})
+    stages["apply_logs"], resp = _timed(client.post, "/logs/apply")
+    if resp.status_code != 200:
+        print(f"> [WARN] /logs/apply : HTTP {resp.status_code}")
+
+    start = datetime.date.fromisoformat(scale.start)
+    values = {
+        "start": start.isoformat(),
+        "end": (start + datetime.timedelta(days=31)).isoformat(),
+        "id_date": (start + datetime.timedelta(days=scale.days // 2)).strftime("%Y%m%d"),
+        "ean": EAN_BASE,
+    }
+    endpoints = {}
+    for name, path, params in ENDPOINTS:
+        url = path.format(**values)
+        query = {k: str(v).format(**values) for k, v in params.items()}
+        samples, status, size = [], None, 0
+        for _ in range(repeat):
+            elapsed, resp = _timed(client.get, url, params=query)
+            samples.append(elapsed)
+            status, size = resp.status_code, len(resp.content)
+        endpoints[name] = {**_summary(samples), "status": status, "bytes": size}
+        print(f"  • {name:<28} {endpoints[name]['median_ms']:>10.1f} ms  (HTTP {status})")
+
+    return {
+        "facts": facts,
+        "mode": mode,
+        "scale": scale.__dict__,
+        "stages": {k: round(v * 1000, 3) for k, v in stages.items()},
+        "endpoints": endpoints,
+    }
+
+
+def run(args):
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    client = TestClient(app)
+    report = {"meta": _meta(), "scales": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for facts in args.facts:
+            mode = args.mode
+            if mode == "xlsx" and facts > EXCEL_MAX_ROWS:
+                print(f"> [INFO] {facts} faits > limite Excel : bascule en mode db")
+                mode = "db"
+            report["scales"].append(bench_scale(client, facts, mode, args.repeat, args.seed, workdir))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Rapport écrit : {args.output}")
+
+
+def compare(args):
+    """Affiche, pour chaque échelle commune, le ratio nouveau / ancien des temps (médianes)."""
+    with open(args.old, encoding="utf-8") as f:
+        old = {s["facts"]: s for s in json.load(f)["scales"]}
+    with open(args.new, encoding="utf-8") as f:
+        new = {s["facts"]: s for s in json.load(f)["scales"]}
+
+    for facts in sorted(old.keys() & new.keys()):
+        print(f"=== {facts} faits")
+        rows = [(k, v, new[facts]["stages"].get(k)) for k, v in old[facts]["stages"].items()]
+        rows += [(k, v["median_ms"], new[facts]["endpoints"].get(k, {}).get("median_ms"))
+                 for k, v in old[facts]["endpoints"].items()]
+        for name, before, after in rows:
+            if after is None:
+                print(f"  {name:<28} {before:>10.1f} ms  →        absent")
+                continue
+            ratio = after / before if before else float("inf")
+            print(f"  {name:<28} {before:>10.1f} ms  → {after:>10.1f} ms  (x{ratio:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de mesure ETL + endpoints")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="génère les données et mesure")
+    p_run.add_argument("--facts", type=int, nargs="+", default=[10_000, 100_000])
+    p_run.add_argument("--mode", choices=["xlsx", "db"], default="xlsx",
+                       help="xlsx : passe par etl_from_excel ; db : chargement direct par COPY")
+    p_run.add_argument("--repeat", type=int, default=5)
+    p_run.add_argument("--seed", type=int, default=42)
+    p_run.add_argument("--output", default="bench-report.json")
+    p_run.set_defaults(func=run)
+
+    p_cmp = sub.add_parser("compare", help="compare deux rapports JSON")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Coût de sérialisation des réponses par tranche de 10 000 lignes de logs.
+
+Compare, sur des lignes synthétiques lues depuis une base SQLite en mémoire
+(objets ORM et Row réels, sans PostgreSQL) :
+  - orm_jsonable   : objets Log -> jsonable_encoder -> json (ancien GET /logs/)
+  - rows_jsonable  : liste de Row -> jsonable_encoder -> json (anciennes routes SQL brut)
+  - tuples_rows    : projection Core (tuples) -> orjson, format=rows
+  - tuples_columns : projection Core (tuples) -> orjson, format=columns
+
+    python -m backend.bench.serialization --rows 10000 100000 --repeat 5
+"""
+import argparse
+import datetime
+import json
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from backend.models.logs import Log
+from backend.serialization import result_response
+
+OPERATIONS = ["INSERT", "UPDATE", "DELETE"]
+TABLES = ["Ventes", "Produits", "Client"]
+
+
+def _session(n: int) -> Session:
+    engine = create_engine("sqlite://")
+    Log.__table__.create(engine)
+    start = datetime.datetime(2024, 1, 1)
+    engine.execute(Log.__table__.insert(), [{
+        "log_id": i,
+        "id_user": f"user{i % 50}",
+        "event_time": start + datetime.timedelta(seconds=i),
+        "operation": OPERATIONS[i % 3],
+        "target_table": TABLES[i % 3],
+        "target_id": str(100000 + i),
+        "field_name": "prix",
+        "detail": f"{i % 997}.99",
+    } for i in range(1, n + 1)])
+    return Session(engine)
+
+
+def _orm_jsonable(session: Session) -> bytes:
+    logs = session.query(Log).all()
+    return json.dumps(jsonable_encoder(logs)).encode()
+
+
+def _rows_jsonable(session: Session) -> bytes:
+    rows = session.execute(text("SELECT * FROM logs")).fetchall()
+    return json.dumps(jsonable_encoder(rows)).encode()
+
+
+def _tuples(fmt: str):
+    def run(session: Session) -> bytes:
+        return result_response(session.execute(select(Log.__table__)), fmt).body
+    return run
+
+
+CASES = [
+    ("orm_jsonable", _orm_jsonable),
+    ("rows_jsonable", _rows_jsonable),
+    ("tuples_rows", _tuples("rows")),
+    ("tuples_columns", _tuples("columns")),
+]
+
+
+def measure(n: int, repeat: int) -> dict:
+    session = _session(n)
+    results = {}
+    for name, fn in CASES:
+        durations = []
+        for _ in range(repeat):
+            session.expunge_all()
+            t0 = time.perf_counter()
+            body = fn(session)
+            durations.append(time.perf_counter() - t0)
+        median = statistics.median(durations)
+        results[name] = {
+            "median_s": round(median, 4),
+            "ms_per_10k": round(median * 1000 * 10_000 / n, 1),
+            "bytes": len(body),
+        }
+    session.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report = {n: measure(n, args.repeat) for n in args.rows}
+    print(f"{'lignes':>8} {'cas':<16} {'ms/10k':>8} {'octets':>11}")
+    for n, results in report.items():
+        for name, r in results.items():
+            print(f"{n:>8} {name:<16} {r['ms_per_10k']:>8} {r['bytes']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 # backend/database.py
 
 import os
+import time
 from dotenv import load_dotenv, find_dotenv
+from fastapi import Request
 from sqlalchemy import create_engine, MetaData
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from backend.metrics import instrument_engine
+from backend.slow_queries import capture_slow_queries
+
 # 1) Charge le .env (même si tu lances depuis un sous-dossier)
 load_dotenv(find_dotenv())
 
@@ -25,19 +31,124 @@ DATABASE_URL = (
     f"/{POSTGRES_DB}"
 )
 
-# 4) Crée le moteur SQLAlchemy
-engine = create_engine(DATABASE_URL, echo=True)
+# 4) Moteurs SQLAlchemy (SQL_ECHO=true pour tracer toutes les requêtes)
+#    - engine      : primaire, écritures (ETL, /logs/apply, /faits) et lectures « fraîches »
+#    - read_engine : lectures lourdes (analytics, logs, export), sur la réplique
+#      POSTGRES_READ_HOST si elle est configurée, sinon sur le primaire ; pool distinct
+#      dans tous les cas, pour qu'un ETL ne prive pas les tableaux de bord de connexions.
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+POSTGRES_READ_HOST = os.getenv("POSTGRES_READ_HOST")
+POSTGRES_READ_PORT = os.getenv("POSTGRES_READ_PORT", POSTGRES_PORT)
+READ_DATABASE_URL = (
+    f"postgresql://{os.getenv('POSTGRES_READ_USER', POSTGRES_USER)}"
+    f":{os.getenv('POSTGRES_READ_PASSWORD', POSTGRES_PASSWORD)}"
+    f"@{POSTGRES_READ_HOST}"
+    f":{POSTGRES_READ_PORT}"
+    f"/{os.getenv('POSTGRES_READ_DB', POSTGRES_DB)}"
+) if POSTGRES_READ_HOST else DATABASE_URL
+
+engine = create_engine(
+    DATABASE_URL, echo=SQL_ECHO,
+    pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+)
+read_engine = create_engine(
+    READ_DATABASE_URL, echo=SQL_ECHO,
+    pool_size=int(os.getenv("DB_READ_POOL_SIZE", 10)),
+    max_overflow=int(os.getenv("DB_READ_MAX_OVERFLOW", 20)),
+    pool_pre_ping=True,
+    connect_args={"connect_timeout": int(os.getenv("DB_READ_CONNECT_TIMEOUT", 3))},
+)
+for _engine in (engine, read_engine):
+    instrument_engine(_engine)
+    capture_slow_queries(_engine)
 print(f"🔗 Connexion à la base de données : {DATABASE_URL}")
+if POSTGRES_READ_HOST:
+    print(f"🔗 Lectures sur la réplique : {READ_DATABASE_URL}")
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False)
 metadata = MetaData()
 Base = declarative_base()
 
+# Garde de fraîcheur : après une écriture réussie, les lectures du même client vont au
+# primaire pendant READ_AFTER_WRITE_SECONDS (retard de réplication). Le client est reconnu
+# par le cookie LAST_WRITE_COOKIE ; un client sans cookies (script, service) renvoie la
+# valeur de l'en-tête LAST_WRITE_HEADER de la réponse d'écriture dans ses lectures.
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", 5))
+LAST_WRITE_COOKIE = "olap_last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Réplique injoignable : on reste sur le primaire pendant REPLICA_RETRY_SECONDS
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+_replica_down_until = 0.0
+
 
-# 5) Dépendance FastAPI
+# 5) Dépendances FastAPI
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def _recent_write(request: Request) -> bool:
+    for raw in (request.cookies.get(LAST_WRITE_COOKIE), request.headers.get(LAST_WRITE_HEADER)):
+        try:
+            if time.time() - float(raw or 0) < READ_AFTER_WRITE_SECONDS:
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def _read_session():
+    """Session de lecture sur read_engine, ou sur le primaire si la réplique ne répond pas."""
+    global _replica_down_until
+    if time.time() < _replica_down_until:
+        return SessionLocal()
+    db = ReadSessionLocal()
+    try:
+        db.connection()
+        return db
+    except OperationalError as e:
+        db.close()
+        _replica_down_until = time.time() + REPLICA_RETRY_SECONDS
+        print(f"> [WARN] Réplique injoignable, lectures sur le primaire ({e.orig})")
+        return SessionLocal()
+
+
+def get_read_db(request: Request):
+    db = SessionLocal() if _recent_write(request) else _read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_engine(request: Request):
+    """
+    Moteur des lectures en flux (export, connexions brutes) : mêmes règles que get_read_db,
+    primaire après une écriture récente ou si la réplique ne répond pas.
+    """
+    if _recent_write(request):
+        return engine
+    db = _read_session()
+    try:
+        return db.get_bind()
+    finally:
+        db.close()
+
+
+async def read_after_write_middleware(request: Request, call_next):
+    """Pose le cookie et l'en-tête de dernière écriture sur les requêtes d'écriture réussies."""
+    response = await call_next(request)
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        stamp = f"{time.time():.3f}"
+        response.set_cookie(
+            LAST_WRITE_COOKIE, stamp,
+            max_age=max(1, int(READ_AFTER_WRITE_SECONDS)), httponly=True, samesite="lax",
+        )
+        response.headers[LAST_WRITE_HEADER] = stamp
+    return response
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Application des changements en attente de logs_changes sur le modèle en étoile :
+INSERT Ventes -> faits_ventes, UPDATE Produits.prix -> dim_produit, INSERT Client -> dim_client.
+
+Chaque changement porte déjà tous ses champs (JSONB) : une vente = une ligne,
+sans tri ni regroupement champ par champ. Les changements traités sont marqués
+applied_at dans la même transaction :
+  - ventes insérées (ou déjà présentes), prix et clients appliqués ;
+  - ventes ou prix invalides, écrits dans etl_rejects (source 'logs', run_id du bilan) ;
+une vente incomplète (champ obligatoire encore absent) reste en attente : ses champs
+manquants peuvent arriver dans un micro-lot suivant.
+"""
+import datetime
+from bisect import bisect_right
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.database import SessionLocal
+from backend.etl.load_olap import montant_vente
+from backend.etl.rfm import refresh_rfm
+from backend.etl.validation import Rejects, parse_quantites
+from backend.metrics import StageTimer
+from backend.models.dim import DimClient, DimProduit
+from backend.models.fact import FaitsVentes
+from backend.olap.basket import basket_index
+from backend.olap.hll import update_sketches
+from backend.olap.shared import update_aggregates
+
+# Changements applicables pas encore appliqués (repris par la rétention, cf. backend/etl/retention.py)
+PENDING_FILTER = """
+    applied_at IS NULL
+      AND ((target_table = 'Ventes'   AND operation = 'INSERT')
+        OR (target_table = 'Produits' AND operation = 'UPDATE' AND champs ? 'prix')
+        OR (target_table = 'Client'   AND operation = 'INSERT'))
+"""
+PENDING_SQL = f"""
+    SELECT change_id, target_table, target_id, operation, event_time, champs
+    FROM logs_changes
+    WHERE {PENDING_FILTER}
+    ORDER BY event_time, change_id
+"""
+CHAMPS_VENTE = ("customer_id", "id_employe", "ean", "date")  # sans eux, la vente reste en attente
+
+
+def _id_date(raw) -> int:
+    if str(raw).isdigit():
+        dt = datetime.datetime(1899, 12, 30) + datetime.timedelta(days=int(raw))
+    else:
+        dt = datetime.datetime.fromisoformat(raw)
+    return int(dt.strftime("%Y%m%d"))
+
+
+def _historique_prix(session: Session, eans) -> dict:
+    """
+    Historique des prix issus des logs (par EAN, trié dans le temps), changements déjà
+    appliqués compris : le montant d'une vente est figé au prix en vigueur à la vente.
+    Chaque entrée : (event_time, prix, appliqué, prix_avant), prix_avant étant le prix de
+    dim_produit remplacé lors de l'application (None si pas encore appliqué).
+    """
+    historique = {}
+    if not eans:
+        return historique
+    rows = session.execute(text("""
+        SELECT target_id, event_time, champs ->> 'prix' AS prix, champs ->> 'prix_avant' AS prix_avant,
+               applied_at IS NOT NULL AS applique
+        FROM logs_changes
+        WHERE target_table = 'Produits' AND operation = 'UPDATE' AND target_id = ANY(:eans)
+    """), {"eans": [str(e) for e in eans]}).fetchall()
+    for r in rows:
+        try:
+            prix_avant = float(r.prix_avant) if r.prix_avant is not None else None
+            historique.setdefault(int(r.target_id), []).append(
+                (r.event_time, float(r.prix), r.applique, prix_avant)
+            )
+        except (TypeError, ValueError):
+            continue
+    for hist in historique.values():
+        hist.sort(key=lambda h: h[0])
+    return historique
+
+
+def apply_pending_logs(session: Session = None) -> dict:
+    """
+    Applique les changements non encore appliqués. Retourne les compteurs
+    (changes = 0 : rien à appliquer ; pending_sales : ventes incomplètes laissées en attente).
+    """
+    own_session = session is None
+    session = session or SessionLocal()
+    try:
+        timer = StageTimer("apply_logs")
+        changes = session.execute(text(PENDING_SQL)).fetchall()
+        timer.lap("fetch")
+        result = {"changes": len(changes), "inserted_sales": 0, "updated_products": 0, "inserted_clients": 0,
+                  "rejected": 0, "pending_sales": 0}
+        if not changes:
+            return result
+        rejects = Rejects("logs")
+        rejetes = {}  # (sheet, motif) -> [(référence, champs)]
+
+        # INSERT Ventes (les champs d'une même vente répartis sur plusieurs instants sont fusionnés)
+        ventes = {}
+        for ch in changes:
+            if ch.target_table == 'Ventes':
+                vente = ventes.setdefault(ch.target_id, {"champs": {}, "vendu_le": ch.event_time, "ids": []})
+                vente["champs"].update(ch.champs)
+                vente["vendu_le"] = max(vente["vendu_le"], ch.event_time)
+                vente["ids"].append(ch.change_id)
+        deja_la = {
+            r[0] for r in session.query(FaitsVentes.id_fait).filter(FaitsVentes.id_fait.in_(list(ventes)))
+        } if ventes else set()
+
+        a_inserer = []
+        en_attente = set()  # change_id des ventes incomplètes
+        for id_fait, vente in ventes.items():
+            if id_fait in deja_la:
+                continue
+            m = vente["champs"]
+            if any(m.get(c) in (None, "") for c in CHAMPS_VENTE):
+                en_attente.update(vente["ids"])
+                result["pending_sales"] += 1
+                continue
+            cid, eid = m['customer_id'], m['id_employe']
+            ticket = m.get('id ticket') or m.get('id_ticket')
+            motif = "ean_invalide"
+            try:
+                ean = int(m['ean'])
+                motif = "date_invalide"
+                id_date = _id_date(m['date'])
+                motif = "quantite_invalide"
+                quantite = parse_quantites(pd.Series([m.get('quantite')])).iat[0]
+                if pd.isna(quantite):
+                    raise ValueError(m.get('quantite'))
+                quantite = int(quantite)
+            except (TypeError, ValueError, OverflowError):
+                rejetes.setdefault(("Ventes", motif), []).append((id_fait, m))
+                continue
+            a_inserer.append((id_fait, id_date, cid, eid, ean, ticket, quantite, vente["vendu_le"]))
+
+        # Prix en base (produits sans historique de prix dans les logs), en une seule requête
+        eans = {v[4] for v in a_inserer}
+        historique_prix = _historique_prix(session, eans)
+        prix_courants = dict(
+            session.query(DimProduit.ean, DimProduit.prix).filter(DimProduit.ean.in_(eans)).all()
+        ) if eans else {}
+
+        def prix_a(ean, moment):
+            hist = historique_prix.get(ean, [])
+            i = bisect_right([h[0] for h in hist], moment)
+            if i:
+                return hist[i - 1][1]
+            # vente antérieure à tout changement de prix journalisé : tant qu'aucun n'est
+            # appliqué, dim_produit.prix est encore le prix d'avant ; sinon on reprend le prix
+            # remplacé par le premier changement appliqué
+            appliques = [h for h in hist if h[2]]
+            if not appliques:
+                return prix_courants.get(ean)
+            if appliques[0][3] is not None:
+                return appliques[0][3]
+            return hist[0][1]  # changement appliqué avant l'enregistrement de prix_avant
+
+        for id_fait, id_date, cid, eid, ean, ticket, quantite, vendu_le in a_inserer:
+            session.add(FaitsVentes(
+                id_fait=id_fait,
+                id_date=id_date,
+                id_client=cid,
+                id_employe=eid,
+                ean=ean,
+                id_ticket=ticket,
+                quantite=quantite,
+                montant=montant_vente(prix_a(ean, vendu_le), quantite),
+            ))
+        result["inserted_sales"] = len(a_inserer)
+        timer.lap("ventes")
+
+        # UPDATE Produits.prix : seul le dernier prix du lot compte ; le prix remplacé est
+        # conservé (champs.prix_avant) pour valoriser les ventes antérieures arrivées en retard
+        derniers_prix = {}
+        ids_prix = {}
+        for ch in changes:
+            if ch.target_table == 'Produits':
+                try:
+                    derniers_prix[int(ch.target_id)] = float(ch.champs['prix'])
+                    ids_prix.setdefault(int(ch.target_id), []).append(ch.change_id)
+                except (TypeError, ValueError):
+                    rejetes.setdefault(("Produits", "prix_invalide"), []).append((ch.target_id, ch.champs))
+        prix_remplaces = dict(
+            session.query(DimProduit.ean, DimProduit.prix).filter(DimProduit.ean.in_(list(derniers_prix))).all()
+        ) if derniers_prix else {}
+        for ean, ancien in prix_remplaces.items():
+            if ancien is not None:
+                session.execute(text("""
+                    UPDATE logs_changes SET champs = champs || jsonb_build_object('prix_avant', CAST(:prix AS float8))
+                    WHERE change_id = ANY(:ids)
+                """), {"prix": float(ancien), "ids": ids_prix[ean]})
+        for ean, new_price in derniers_prix.items():
+            res = session.query(DimProduit).filter(DimProduit.ean == ean).update(
+                {DimProduit.prix: new_price}, synchronize_session=False
+            )
+            result["updated_products"] += res
+        timer.lap("produits")
+
+        # INSERT Clients (existence vérifiée en une requête)
+        inscriptions = {}
+        for ch in changes:
+            if ch.target_table == 'Client':
+                raw = ch.champs.get('date_inscription')
+                try:
+                    signup = int(datetime.datetime.fromisoformat(raw).strftime("%Y%m%d"))
+                except (TypeError, ValueError):
+                    signup = None
+                inscriptions.setdefault(ch.target_id, signup)
+        existants = {
+            r[0] for r in session.query(DimClient.id_client).filter(DimClient.id_client.in_(list(inscriptions)))
+        } if inscriptions else set()
+        for cid, signup in inscriptions.items():
+            if cid not in existants:
+                session.add(DimClient(id_client=cid, date_inscription=signup))
+                result["inserted_clients"] += 1
+        timer.lap("clients")
+
+        traites = [ch.change_id for ch in changes if ch.change_id not in en_attente]
+        if not traites:
+            return result  # uniquement des ventes incomplètes : rien n'a été modifié
+
+        for (sheet, motif), lignes in rejetes.items():
+            refs, champs = zip(*lignes)
+            rejects.add(sheet, pd.DataFrame(list(champs)), motif, pd.Series(refs))
+        rejects.write(session)
+        result["rejected"] = rejects.total
+        if rejects.total:
+            result["run_id"] = rejects.run_id
+        session.execute(
+            text("UPDATE logs_changes SET applied_at = :now WHERE change_id = ANY(:ids)"),
+            {"now": datetime.datetime.now(), "ids": traites},
+        )
+        session.flush()
+
+        # Mise à jour incrémentale des index dérivés, dans la transaction des ventes
+        basket_index.update_from_facts(session, [(v[5], v[4]) for v in a_inserer])
+        refresh_rfm(session, {v[2] for v in a_inserer})
+        update_sketches(session, pd.DataFrame(
+            [(v[1], v[2], v[5], v[3], v[4]) for v in a_inserer],
+            columns=["id_date", "id_client", "id_ticket", "id_employe", "ean"],
+        ))
+        session.commit()
+        timer.lap("commit")
+        update_aggregates(session, {v[1] for v in a_inserer})  # jours des ventes insérées
+        timer.lap("derived")
+        return result
+    finally:
+        if own_session:
+            session.close()
+
+
+if __name__ == "__main__":
+    print(apply_pending_logs())
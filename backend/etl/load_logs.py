@@ -3,13 +3,132 @@ import os
 import pandas as pd
 import numpy as np
 import datetime
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from backend.database import SessionLocal
+from backend.etl.validation import Rejects, missing, parse_dates
+from backend.metrics import StageTimer
+from backend.models.logs import LogChange, LogStatJour
+
+INVALIDE = object()  # marqueur de clean_detail pour une valeur illisible
+STATS_KEYS = ["jour", "id_user", "target_table", "operation"]
+CHANGE_KEYS = ["target_table", "target_id", "operation", "id_user", "event_time"]
+CHANGES_BATCH = 10_000
+# Recale la séquence de log_id si des logs ont été insérés avec des identifiants explicites
+# (anciens chargements numérotés 1..n) : sinon le chargement suivant entre en collision.
+SYNC_LOG_ID_SQL = """
+    SELECT setval('logs_log_id_seq', m)
+    FROM (SELECT MAX(log_id) AS m FROM logs) AS x
+    WHERE m > (SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM logs_log_id_seq)
+"""
+
+
+def update_log_stats(session: Session, logs: pd.DataFrame) -> int:
+    """
+    Incrémente logs_stats_jour avec un lot de logs (colonnes event_time, id_user,
+    target_table, operation) : un compteur par jour × utilisateur × table × opération.
+    À appeler dans la transaction qui insère le lot ; commit à la charge de l'appelant.
+    """
+    if logs.empty:
+        return 0
+    counts = (
+        logs.assign(jour=pd.to_datetime(logs["event_time"]).dt.date)
+        .groupby(STATS_KEYS).size().rename("nb").reset_index()
+    )
+    records = [dict(zip(STATS_KEYS + ["nb"], row)) for row in counts.astype(object).itertuples(index=False, name=None)]
+    stmt = insert(LogStatJour.__table__).values(records)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=STATS_KEYS,
+        set_={"nb": LogStatJour.__table__.c.nb + stmt.excluded.nb},
+    )
+    session.execute(stmt)
+    return len(records)
+
+
+def write_log_changes(session: Session, logs: pd.DataFrame) -> int:
+    """
+    Pivote un lot de logs (une ligne par champ) en logs_changes : une ligne par
+    (table, id, opération, utilisateur, instant), champs {nom normalisé: detail}.
+    Commit à la charge de l'appelant.
+    """
+    if logs.empty:
+        return 0
+    codes, changes = pd.factorize(pd.MultiIndex.from_frame(logs[CHANGE_KEYS]))
+    champs = [{} for _ in range(len(changes))]
+    for code, champ, detail in zip(codes, logs["field_name"].str.strip().str.lower(), logs["detail"]):
+        champs[code][champ] = detail
+    records = [dict(zip(CHANGE_KEYS, key), champs=c) for key, c in zip(changes, champs)]
+    for record in records:
+        record["event_time"] = pd.Timestamp(record["event_time"]).to_pydatetime()
+    for i in range(0, len(records), CHANGES_BATCH):
+        session.execute(LogChange.__table__.insert(), records[i:i + CHANGES_BATCH])
+    return len(records)
+
+
+def rebuild_log_stats(session: Session, depuis: datetime.datetime = None):
+    """
+    Recalcul des compteurs depuis la table logs (rattrapage d'une base existante).
+    `depuis` : début de la fenêtre chaude ; les jours antérieurs, archivés hors de logs
+    (cf. backend/etl/retention.py), gardent leurs compteurs.
+    """
+    if depuis is None:
+        session.execute(text("TRUNCATE logs_stats_jour"))
+    else:
+        session.execute(text("DELETE FROM logs_stats_jour WHERE jour >= :depuis"), {"depuis": depuis})
+    session.execute(text("""
+        INSERT INTO logs_stats_jour (jour, id_user, target_table, operation, nb)
+        SELECT event_time::date, COALESCE(id_user, ''), COALESCE(target_table, ''), COALESCE(operation, ''), COUNT(*)
+        FROM logs
+        WHERE event_time >= COALESCE(CAST(:depuis AS timestamp), '-infinity')
+        GROUP BY 1, 2, 3, 4
+    """), {"depuis": depuis})
+
+
+def read_logs_file(path: str) -> pd.DataFrame:
+    """
+    Lit un fichier de logs : feuille "Logs" d'un .xlsx, ou .csv / .ndjson aux mêmes colonnes
+    (id_user, date, action, table_insert, id_ligne, champs, detail).
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".xlsx":
+        #    On force id_user, action, table_insert, id_ligne, champs en str, mais pas 'detail' :
+        #    si Excel a déjà converti la cellule en date, pandas la lira en Timestamp.
+        return pd.read_excel(
+            path,
+            sheet_name="Logs",
+            dtype={
+                "id_user": str,
+                "action": str,
+                "table_insert": str,
+                "id_ligne": str,
+                "champs": str,
+                "detail": object  # On laisse 'detail' en object pour gérer les dates et autres types
+            },
+            keep_default_na=False
+        )
+    if suffix == ".csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False, sep=None, engine="python")
+    if suffix in (".ndjson", ".jsonl"):
+        return pd.read_json(path, lines=True, dtype=False)
+    raise ValueError(f"Format non pris en charge : {path}")
 
 
 def load_logs_from_excel(path_to_excel: str):
     """
     1) Lit backend/data/logs.xlsx (feuille "Logs")
+    2) Charge le lot (cf. load_logs_from_frame)
+    Retourne le résumé du chargement (insertions, rejets par motif, durées des étapes).
+    """
+    timer = StageTimer("logs")
+    df = read_logs_file(path_to_excel)
+    timer.lap("read")
+    return load_logs_from_frame(df, timer)
+
+
+def load_logs_from_frame(df: pd.DataFrame, timer: StageTimer = None, before_commit=None):
+    """
+    Charge un lot de logs déjà lu (fichier complet ou micro-lot du répertoire surveillé) :
     2) Drop toute colonne “Unnamed: …” laissée par Excel
     3) Vérifie que les colonnes restantes sont exactement :
        id_user, date, action, table_insert, id_ligne, champs, detail
@@ -18,25 +137,13 @@ def load_logs_from_excel(path_to_excel: str):
        - si champs == 'prix', force detail en float (recomposition jour + mois si c’est un Timestamp),
          sinon si 'date' dans champs, parse detail en date et renvoie ISO string
        - sinon, garde detail en string brut
-    5) Insère en base, dans la table `logs`, ces colonnes (mêmes noms).
+    5) Valide le lot (clés manquantes, date ou detail illisible) : rejets dans `etl_rejects`
+    6) Insère en base, dans la table `logs`, ces colonnes (mêmes noms) ; log_id vient de la séquence.
+    Retourne le résumé du chargement (insertions, rejets par motif, durées des étapes).
     """
 
-    # 1) Lecture de la feuille “Logs”.
-    #    On force id_user, action, table_insert, id_ligne, champs en str, mais pas 'detail' :
-    #    si Excel a déjà converti la cellule en date, pandas la lira en Timestamp.
-    df = pd.read_excel(
-        path_to_excel,
-        sheet_name="Logs",
-        dtype={
-            "id_user": str,
-            "action": str,
-            "table_insert": str,
-            "id_ligne": str,
-            "champs": str,
-            "detail": object  # On laisse 'detail' en object pour gérer les dates et autres types
-        },
-        keep_default_na=False
-    )
+    timer = timer or StageTimer("logs")
+    rejects = Rejects("logs")
 
     # 2) Drop des colonnes “Unnamed: …” éventuelles
     df = df.loc[:, [col for col in df.columns if not str(col).startswith("Unnamed")]]
@@ -55,51 +162,19 @@ def load_logs_from_excel(path_to_excel: str):
 
     # 4) Vérification des colonnes attendues
     expected = ["id_user", "date", "action", "table_insert", "id_ligne", "champs", "detail"]
-    missing = [c for c in expected if c not in df.columns]
-    if missing:
-        raise ValueError(f"Colonnes manquantes dans le fichier Logs.xlsx : {missing}")
+    absentes = [c for c in expected if c not in df.columns]
+    if absentes:
+        raise ValueError(f"Colonnes manquantes dans le fichier Logs.xlsx : {absentes}")
 
     # 5) Ne garder QUE ces colonnes (dans l’ordre voulu)
     df = df[expected]
 
-    # 6) Parsing de la colonne “date” pour transformer en datetime Python
-    def parse_event_time(raw_date):
-        """
-        - Si raw_date est un entier (Excel serial, ex. 45518), on convertit via origin='1899-12-30'.
-        - Si c’est déjà un Timestamp, on renvoie telle quelle.
-        - Sinon, on tente de parser la chaîne (ISO ou JJ/MM/AAAA).
-        """
-        if pd.isna(raw_date):
-            return None
-
-        # Si pandas a déjà mis un Timestamp (Excel avait converti en date)
-        if isinstance(raw_date, (pd.Timestamp, datetime.datetime, datetime.date)):
-            return pd.to_datetime(raw_date).to_pydatetime()
+    # 6) Parsing vectorisé de la colonne “date” : Timestamp déjà converti par Excel,
+    #    numéro de série Excel (ex. 45518), ISO 'YYYY-MM-DD hh:mm:ss', puis JJ/MM/AAAA
+    event_time = parse_dates(df["date"], dayfirst=False)
+    df["event_time"] = event_time.fillna(parse_dates(df["date"][event_time.isna()], dayfirst=True))
 
-        s = str(raw_date).strip()
-        # Cas “Excel serial” (ex. '45518')
-        if s.isdigit():
-            try:
-                ts = pd.to_datetime(int(s), unit="d", origin="1899-12-30")
-                return ts.to_pydatetime()
-            except Exception:
-                pass
-
-        # Sinon, on essaye d’interpréter la chaîne
-        try:
-            # Tentative ISO ou 'YYYY-MM-DD hh:mm:ss'
-            return pd.to_datetime(s, dayfirst=False).to_pydatetime()
-        except Exception:
-            try:
-                # Puis en format 'DD/MM/YYYY' ou autre
-                return pd.to_datetime(s, dayfirst=True).to_pydatetime()
-            except Exception:
-                print(f"> [WARN] Impossible de parser la date '{raw_date}' dans ‘date’ (ligne...).")
-                return None
-
-    df["event_time"] = df["date"].apply(parse_event_time)
-
-    # 7) Nettoyage et typage du champ “detail”
+    # 7) Nettoyage et typage du champ “detail” (INVALIDE : valeur illisible, ligne rejetée)
     def clean_detail(row):
         champ = str(row["champs"]).lower().strip()
         val = row["detail"]
@@ -131,8 +206,7 @@ def load_logs_from_excel(path_to_excel: str):
                     mois = parsed.month
                     return float(f"{jour}.{mois:02d}")
                 except Exception:
-                    print(f"> [WARN] Impossible de caster '{val}' en float ou date pour 'prix' (id_ligne={row['id_ligne']})")
-                    return None
+                    return INVALIDE
 
         # ─── Si c'est un champ contenant 'date' (par ex. 'date_inscription', 'Date', etc.) ─
         elif "date_inscription" in champ:
@@ -155,8 +229,7 @@ def load_logs_from_excel(path_to_excel: str):
                 parsed = pd.to_datetime(s, dayfirst=True)
                 return parsed.strftime("%Y-%m-%d %H:%M:%S")
             except Exception:
-                print(f"> [WARN] Impossible de caster '{val}' en date pour '{champ}' (id_ligne={row['id_ligne']})")
-                return None
+                return INVALIDE
 
         # ─── Sinon (tout le reste), on garde la chaîne brute ──────────────────────────
         else:
@@ -165,40 +238,53 @@ def load_logs_from_excel(path_to_excel: str):
     df["detail_clean"] = df.apply(clean_detail, axis=1)
 
     # 8) Construire le DataFrame final à insérer dans ‘logs’
+    # valeurs absentes -> '' (et non 'nan') : mêmes clés de compteurs que rebuild_log_stats (COALESCE(..., ''))
     df_to_insert = pd.DataFrame({
-        "log_id": np.arange(1, len(df) + 1),  # log_id auto-incrémenté
-        "id_user": df["id_user"].astype(str),
+        "id_user": df["id_user"].fillna("").astype(str),
         "event_time": df["event_time"],
-        "operation": df["action"].astype(str),
-        "target_table": df["table_insert"].astype(str),
-        "target_id": df["id_ligne"].astype(str),
-        "field_name": df["champs"].astype(str),
+        "operation": df["action"].fillna("").astype(str),
+        "target_table": df["table_insert"].fillna("").astype(str),
+        "target_id": df["id_ligne"].fillna("").astype(str),
+        "field_name": df["champs"].fillna("").astype(str),
         # detail_clean contient soit :
         #  - un float pour 'prix' (ex. 2.08),
         #  - un string ISO pour un champ date (ex. '2024-08-14 00:00:00'),
         #  - soit le texte brut pour tout le reste.
-        "detail": df["detail_clean"].astype(str)
+        "detail": df["detail_clean"].fillna("").astype(str)
     })
 
-    # 9) Filtrer les lignes sans event_time valide
-    n_before = len(df_to_insert)
-    df_to_insert = df_to_insert[df_to_insert["event_time"].notna()]
-    n_after = len(df_to_insert)
-    if n_after < n_before:
-        print(f"> [INFO] {n_before - n_after} ligne(s) ignorée(s) car 'event_time' invalide ou manquant.")
+    # 9) Validation : les lignes écartées partent dans etl_rejects avec leur motif
+    check = rejects.check("Logs", df[expected], ref=df["id_ligne"].astype(str))
+    check.reject(missing(df["action"]) | missing(df["table_insert"]) | missing(df["id_ligne"]) | missing(df["champs"]),
+                 "cle_manquante") \
+        .reject(df["event_time"].isna(), "event_time_invalide") \
+        .reject(df["detail_clean"].map(lambda v: v is INVALIDE), "detail_invalide")
+    df_to_insert = df_to_insert[check.ok]
+
+    timer.lap("transform")
 
     # 10) Insertion en base, table “logs”
     session: Session = SessionLocal()
     try:
-        df_to_insert.to_sql("logs", session.bind, if_exists="append", index=False)
+        # même transaction pour les logs et leurs compteurs ; log_id attribué par la séquence
+        session.execute(text(SYNC_LOG_ID_SQL))
+        df_to_insert.to_sql("logs", session.connection(), if_exists="append", index=False)
+        update_log_stats(session, df_to_insert)
+        write_log_changes(session, df_to_insert)
+        rejects.write(session)
+        if before_commit is not None:
+            # même transaction : un fichier de logs (sans clé naturelle) n'est jamais chargé deux fois
+            before_commit(session, {**rejects.summary(), "inseres": len(df_to_insert), "durees": timer.durations})
         session.commit()
-        print(f"→ {len(df_to_insert)} lignes insérées dans `logs`.")
+        print(f"→ {len(df_to_insert)} lignes insérées dans `logs`, {rejects.total} rejetée(s) (run {rejects.run_id}).")
     except Exception as e:
         session.rollback()
         print(f"> [ERROR] Échec insertion en base : {e}")
         raise
     finally:
         session.close()
+    timer.lap("insert")
+    return {**rejects.summary(), "inseres": len(df_to_insert), "durees": timer.durations}
 
 
 if __name__ == "__main__":
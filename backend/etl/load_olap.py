@@ -1,9 +1,17 @@
 import sys
+from pathlib import Path
+
 import pandas as pd
 from sqlalchemy.orm import Session
 from backend.database import SessionLocal
+from backend.metrics import StageTimer
 from backend.models.dim import DimDate, DimClient, DimEmploye, DimProduit
 from backend.models.fact import FaitsVentes
+from backend.etl.rfm import refresh_rfm
+from backend.etl.validation import Rejects, missing, parse_eans, parse_serials, validate_faits
+from backend.olap.basket import basket_index
+from backend.olap.hll import update_sketches
+from backend.olap.shared import update_aggregates
 
 # Mapping des feuilles Excel vers groupe d’insertion
 SHEET_MAP = {
@@ -13,42 +21,124 @@ SHEET_MAP = {
     "Produits": "prods",
     "Vente Détail": "faits"
 }
+FAITS_BATCH = 10_000
+
+
+def montant_vente(prix, quantite=1):
+    """Montant d'une ligne de vente, figé au prix en vigueur au moment de la vente (None si prix inconnu)."""
+    if prix is None or pd.isna(prix):
+        return None
+    return round(float(prix) * int(quantite or 1), 2)
+
+
+def read_sales_file(path: str) -> dict:
+    """
+    Lit un fichier de ventes -> {feuille: DataFrame (str)}.
+    .xlsx : feuilles de SHEET_MAP présentes dans le classeur ;
+    .csv / .ndjson : lignes au format de la feuille « Vente Détail ».
+    """
+    suffix = Path(path).suffix.lower()
+    if suffix == ".xlsx":
+        sheets = [s for s in pd.ExcelFile(path).sheet_names if s in SHEET_MAP]
+        return pd.read_excel(path, sheet_name=sheets, dtype=str)
+    if suffix == ".csv":
+        df = pd.read_csv(path, dtype=str, sep=None, engine="python")
+    elif suffix in (".ndjson", ".jsonl"):
+        df = pd.read_json(path, lines=True, dtype=False)
+        df = df.where(df.isna(), df.astype(str))
+    else:
+        raise ValueError(f"Format non pris en charge : {path}")
+    return {"Vente Détail": df}
+
+
+def _cles_existantes(session: Session, column, values) -> set:
+    """Clés de `column` déjà en base parmi celles du lot (pas de parcours complet de la table)."""
+    values = pd.Series(values).dropna().unique().tolist()
+    found = set()
+    for i in range(0, len(values), FAITS_BATCH):
+        found.update(r[0] for r in session.query(column).filter(column.in_(values[i:i + FAITS_BATCH])))
+    return found
+
+
+def _faits_existants(session: Session, ids: pd.Series) -> set:
+    """id_fait déjà en base parmi ceux du lot."""
+    return _cles_existantes(session, FaitsVentes.id_fait, ids)
+
+
+def _prix(session: Session, eans) -> dict:
+    """Prix courant des seuls EAN du lot, pour figer le montant des ventes chargées."""
+    eans = pd.Series(eans).dropna().unique().tolist()
+    prix = {}
+    for i in range(0, len(eans), FAITS_BATCH):
+        prix.update(session.query(DimProduit.ean, DimProduit.prix).filter(DimProduit.ean.in_(eans[i:i + FAITS_BATCH])))
+    return prix
 
 
 def etl_from_excel(path: str):
-    # Lire toutes les feuilles du fichier
-    xls = pd.read_excel(path, sheet_name=list(SHEET_MAP.keys()), dtype=str)
+    """
+    Charge le classeur d'extraction dans le modèle en étoile. Les lignes invalides
+    sont écartées par l'étape de validation et écrites dans etl_rejects.
+    Retourne le résumé du chargement (insertions, rejets, durées des étapes).
+    """
+    timer = StageTimer("olap")
+    # Lire les feuilles du fichier
+    xls = read_sales_file(path)
+    timer.lap("read")
+    return etl_from_frames(xls, timer)
+
+
+def etl_from_frames(xls: dict, timer: StageTimer = None, before_commit=None):
+    """
+    Charge un lot de feuilles déjà lues ({nom de feuille SHEET_MAP: DataFrame}) :
+    classeur complet ou micro-lot de ventes déposé dans le répertoire surveillé.
+    `before_commit(session, summary)` : appelé juste avant le commit du chargement, pour
+    écrire dans la même transaction (enregistrement etl_files du watcher).
+    """
     session: Session = SessionLocal()
+    try:
+        return _etl_from_frames(session, xls, timer or StageTimer("olap"), before_commit)
+    finally:
+        session.close()
 
-    # Précharger les clés existantes
-    existing = {
-        "dates": {d.id_date for d in session.query(DimDate.id_date)},
-        "clients": {c.id_client for c in session.query(DimClient.id_client)},
-        "emps": {e.id_employe for e in session.query(DimEmploye.id_employe)},
-        "prods": {p.ean for p in session.query(DimProduit.ean)},
-        "faits": {f.id_fait for f in session.query(FaitsVentes.id_fait)},
-    }
+
+def _etl_from_frames(session: Session, xls: dict, timer: StageTimer, before_commit=None):
+    rejects = Rejects("olap")
+
+    # Clés existantes et prix : seules les clés présentes dans le lot sont lues en base,
+    # feuille par feuille (un micro-lot de quelques ventes ne relit pas les dimensions)
+    existing = {"dates": set(), "clients": set(), "emps": set(), "prods": set(), "faits": set()}
+    colonnes = {"dates": DimDate.id_date, "clients": DimClient.id_client,
+                "emps": DimEmploye.id_employe, "prods": DimProduit.ean}
     to_add = {k: [] for k in existing}
+    prix_par_ean = {}
+
+    def precharger(cles: dict):
+        """Complète `existing` (et les prix) avec les clés du lot pas encore vues."""
+        for grp, values in cles.items():
+            values = pd.Series(values).dropna()
+            if grp in ("dates", "prods"):
+                values = values.astype("int64")
+            if grp == "prods":
+                prix_par_ean.update(_prix(session, values[~values.isin(list(prix_par_ean))]))
+            existing[grp] |= _cles_existantes(session, colonnes[grp], values[~values.isin(list(existing[grp]))])
 
-    for sheet_name, df in xls.items():
-        key = SHEET_MAP[sheet_name]
+    # dimensions avant les faits, quel que soit l'ordre des feuilles dans le fichier
+    for sheet_name in [s for s in SHEET_MAP if s in xls]:
+        df, key = xls[sheet_name], SHEET_MAP[sheet_name]
         df.columns = df.columns.str.strip().str.replace(' ', '_').str.lower()
 
         if key == 'dates':
             if 'date' not in df.columns:
                 print("> Skip 'dates' : colonne 'date' manquante")
                 continue
-            for _, row in df.iterrows():
-                raw = row.get('date')
-                if pd.isna(raw) or not raw:
-                    continue
-                try:
-                    serial = int(raw)
-                    dt = pd.to_datetime(serial, unit='d', origin='1899-12-30')
-                    id_date = int(dt.strftime('%Y%m%d'))
-                except Exception:
-                    print(f"> Ignore date invalide : {raw!r}")
-                    continue
+            dates = rejects.check("dates", df) \
+                .reject(missing(df['date']), "date_manquante") \
+                .reject(parse_serials(df['date']).isna(), "date_invalide") \
+                .valid()
+            serials = parse_serials(dates['date'])
+            precharger({"dates": serials.dt.year * 10000 + serials.dt.month * 100 + serials.dt.day})
+            for dt in parse_serials(dates['date']).drop_duplicates():
+                id_date = int(dt.strftime('%Y%m%d'))
                 if id_date not in existing['dates']:
                     mois_nom = dt.strftime('%B')
                     annee_mois = int(dt.strftime('%Y%m'))
@@ -73,9 +163,11 @@ def etl_from_excel(path: str):
             if not id_col:
                 print("> Skip 'clients' : id_client non trouvé")
                 continue
+            df = rejects.check("clients", df).reject(missing(df[id_col]), "id_manquant").valid()
+            precharger({"clients": df[id_col]})
             for _, row in df.iterrows():
                 cid = row.get(id_col)
-                if pd.isna(cid) or cid in existing['clients']:
+                if cid in existing['clients']:
                     continue
                 di = None
                 if insc_col:
@@ -98,9 +190,11 @@ def etl_from_excel(path: str):
             if not id_col:
                 print("> Skip 'emps' : id_employe non trouvé")
                 continue
+            df = rejects.check("emps", df).reject(missing(df[id_col]), "id_manquant").valid()
+            precharger({"emps": df[id_col]})
             for _, row in df.iterrows():
                 eid = row.get(id_col)
-                if pd.isna(eid) or eid in existing['emps']:
+                if eid in existing['emps']:
                     continue
                 employe = row.get('employe') or None
                 prenom = row.get('prenom') or None
@@ -140,14 +234,13 @@ def etl_from_excel(path: str):
             if not ean_col:
                 print("> Skip 'prods' : ean non trouvé")
                 continue
-            for _, row in df.iterrows():
-                raw = row.get(ean_col)
-                if pd.isna(raw):
-                    continue
-                try:
-                    code = int(raw)
-                except:
-                    continue
+            df = rejects.check("prods", df) \
+                .reject(missing(df[ean_col]), "id_manquant") \
+                .reject(parse_eans(df[ean_col]).isna(), "ean_invalide") \
+                .valid()
+            precharger({"prods": parse_eans(df[ean_col])})
+            for (_, row), code in zip(df.iterrows(), parse_eans(df[ean_col])):
+                code = int(code)
                 if code not in existing['prods']:
                     cat = row.get(cat_col) or None
                     rayon = row.get(rayon_col) or None
@@ -169,6 +262,7 @@ def etl_from_excel(path: str):
                         )
                     )
                     existing['prods'].add(code)
+                    prix_par_ean[code] = prix
 
         elif key == 'faits':
 
@@ -179,57 +273,34 @@ def etl_from_excel(path: str):
             emp_col = next((c for c in df.columns if 'employe' in c), None)
             ean_col = next((c for c in df.columns if 'ean' in c), None)
             ticket_col = next((c for c in df.columns if 'ticket' in c.lower()), None)
+            qte_col = next((c for c in df.columns if 'quantite' in c or 'qte' in c or 'quantity' in c), None)
 
-            missing = [name for name, col in [
+            absentes = [name for name, col in [
                 ('id_bdd', fid_col), ('date', date_col),
                 ('client', client_col), ('employe', emp_col), ('ean', ean_col)
             ] if not col]
-            if missing:
-                print(f"> Skip 'faits': colonnes manquantes {missing}")
+            if absentes:
+                print(f"> Skip 'faits': colonnes manquantes {absentes}")
                 continue
 
-            for _, row in df.iterrows():
-                fid = row.get(fid_col)
-                if pd.isna(fid) or fid in existing['faits']:
-                    continue
-
-                raw_date = row.get(date_col)
-                if pd.isna(raw_date):
-                    print(f"> Skip fait {fid}: date manquante")
-                    continue
-                try:
-                    if isinstance(raw_date, str) and raw_date.isdigit():
-                        dt = pd.to_datetime(int(raw_date), unit='d', origin='1899-12-30')
-                    else:
-                        dt = pd.to_datetime(raw_date, dayfirst=True)
-                    id_date = int(dt.strftime('%Y%m%d'))
-                except Exception as e:
-                    print(f"> Skip fait {fid}: date invalide ({e})")
-                    continue
-
-                cid = row.get(client_col)
-                eid = row.get(emp_col)
-                if pd.isna(cid) or pd.isna(eid):
-                    print(f"> Skip fait {fid}: client ou employé manquant")
-                    continue
-
-                try:
-                    code = int(row.get(ean_col))
-                except Exception:
-                    print(f"> Skip fait {fid}: EAN invalide")
-                    continue
-
-                id_ticket = row.get('id_ticket')
-
+            existing['faits'] |= _faits_existants(session, df[fid_col])
+            cols = {"fid": fid_col, "date": date_col, "client": client_col, "employe": emp_col,
+                    "ean": ean_col, "ticket": ticket_col, "quantite": qte_col}
+            faits = validate_faits(df, cols, existing, rejects, preload=precharger)
+            for f in faits.astype(object).itertuples(index=False):  # types Python pour psycopg2
                 to_add['faits'].append(FaitsVentes(
-                    id_fait=fid,
-                    id_date=id_date,
-                    id_client=cid,
-                    id_employe=eid,
-                    ean=code,
-                    id_ticket=id_ticket,
+                    id_fait=f.id_fait,
+                    id_date=f.id_date,
+                    id_client=f.id_client,
+                    id_employe=f.id_employe,
+                    ean=f.ean,
+                    id_ticket=f.id_ticket,
+                    quantite=f.quantite,
+                    montant=montant_vente(prix_par_ean.get(f.ean), f.quantite),
                 ))
-                existing['faits'].add(fid)
+            existing['faits'].update(faits["id_fait"])
+
+    timer.lap("transform")
 
     # Insertion en base: on utilise add_all pour garantir persistance de tous les champs
     for grp in ['dates', 'clients', 'emps', 'prods', 'faits']:
@@ -237,9 +308,31 @@ def etl_from_excel(path: str):
             session.add_all(to_add[grp])
             print(f" • {len(to_add[grp])} {grp} insérés")
 
+    nouveaux_faits = pd.DataFrame(
+        [(f.id_date, f.id_client, f.id_ticket, f.id_employe, f.ean) for f in to_add['faits']],
+        columns=["id_date", "id_client", "id_ticket", "id_employe", "ean"],
+    )
+    rejects.write(session)
+    session.flush()
+    timer.lap("insert")
+
+    # Mise à jour incrémentale des index dérivés (tickets, clients et jours touchés uniquement),
+    # dans la transaction des ventes : une reconstruction concurrente ne les compte pas deux fois
+    basket_index.update_from_facts(session, zip(nouveaux_faits["id_ticket"], nouveaux_faits["ean"]))
+    refresh_rfm(session, set(nouveaux_faits["id_client"]))
+    update_sketches(session, nouveaux_faits)
+    summary = {
+        **rejects.summary(),
+        "inseres": {grp: len(rows) for grp, rows in to_add.items()},
+        "durees": timer.durations,
+    }
+    if before_commit is not None:
+        before_commit(session, summary)
     session.commit()
-    session.close()
-    print("✅ ETL complet terminé !")
+    update_aggregates(session, nouveaux_faits["id_date"])
+    timer.lap("derived")
+    print(f"✅ ETL complet terminé ! {summary['rejets']} ligne(s) rejetée(s) (run {rejects.run_id})")
+    return summary
 
 
 def main():
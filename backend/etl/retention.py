@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Rétention de la table `logs` : archivage des mois anciens en Parquet compressé.
+
+Un mois de logs (partition logique sur event_time) est archivé quand il est entièrement
+plus ancien que LOGS_RETENTION_DAYS, que chacune de ses lignes a son changement dans
+logs_changes (sinon l'archivage le ferait disparaître de /logs/apply) et qu'aucun de ces
+changements n'attend encore d'être appliqué (cf. PENDING_FILTER).
+
+Une seule exécution à la fois (verrou consultatif tenu pendant tout le passage) ; le
+manifest est relu sous ce verrou avant chaque mois. Pour chaque mois :
+  1) verrou SHARE ROW EXCLUSIVE sur logs (lectures permises, chargements en attente) ;
+  2) lecture par curseur serveur et écriture d'un fichier Parquet zstd dans
+     LOGS_ARCHIVE_DIR (fichier temporaire puis renommage) ;
+  3) suppression des lignes archivées, contrôle du nombre de lignes, ajout au
+     manifest.json, commit.
+logs_changes et logs_stats_jour ne sont pas touchés : /logs/apply, /logs/stats et
+/logs/corrections‐ventes restent complets. /logs/par‐plage relit les archives quand
+la plage demandée remonte avant la fenêtre chaude (cf. read_archive).
+
+    python -m backend.etl.retention                 # archive selon LOGS_RETENTION_DAYS
+    python -m backend.etl.retention --days 30 --dry-run
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import uuid
+
+from sqlalchemy import text
+
+from backend.database import engine
+from backend.etl.apply_logs import PENDING_FILTER
+from backend.metrics import StageTimer
+
+ARCHIVE_DIR = os.getenv("LOGS_ARCHIVE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "archive", "logs"
+)
+RETENTION_DAYS = int(os.getenv("LOGS_RETENTION_DAYS") or 90)
+MANIFEST = "manifest.json"
+COLUMNS = ["log_id", "id_user", "event_time", "operation", "target_table", "target_id", "field_name", "detail"]
+BATCH_ROWS = 50_000
+LOCK_KEY = 74_110_043  # pg_advisory_lock : une seule exécution de l'archivage
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("log_id", pa.int64()),
+        ("id_user", pa.string()),
+        ("event_time", pa.timestamp("us")),
+        ("operation", pa.string()),
+        ("target_table", pa.string()),
+        ("target_id", pa.string()),
+        ("field_name", pa.string()),
+        ("detail", pa.string()),
+    ])
+
+
+def load_manifest(directory: str = ARCHIVE_DIR) -> dict:
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {"fichiers": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(directory: str, manifest: dict):
+    tmp = os.path.join(directory, f".{MANIFEST}.{uuid.uuid4().hex}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+def archived_until(directory: str = ARCHIVE_DIR):
+    """Début de la fenêtre chaude : fin du dernier mois archivé (None si aucune archive)."""
+    fins = [f["fin"] for f in load_manifest(directory)["fichiers"]]
+    return datetime.datetime.fromisoformat(max(fins)) if fins else None
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Contrôles d'un mois [debut, fin), repris sous le verrou de table juste avant l'archivage
+MONTH_PENDING_SQL = f"""
+    SELECT EXISTS (SELECT 1 FROM logs_changes
+                   WHERE event_time >= %(debut)s AND event_time < %(fin)s AND {PENDING_FILTER})
+"""
+MONTH_UNCOVERED_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM logs l
+        WHERE l.event_time >= %(debut)s AND l.event_time < %(fin)s AND l.field_name IS NOT NULL AND NOT EXISTS (
+          SELECT 1 FROM logs_changes c
+           WHERE c.target_table = COALESCE(l.target_table, '') AND c.target_id = COALESCE(l.target_id, '')
+             AND c.operation = COALESCE(l.operation, '') AND c.event_time = l.event_time))
+"""
+
+
+def _month_bounds(limite: datetime.date):
+    """
+    Mois entièrement antérieurs à `limite` ayant des logs, ceux qui ont des changements
+    en attente et ceux dont des logs n'ont pas (encore) de ligne dans logs_changes.
+    """
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT date_trunc('month', event_time) AS mois, COUNT(*) FROM logs "
+            "WHERE event_time < %s GROUP BY 1 ORDER BY 1", (limite,)
+        )
+        mois = cur.fetchall()
+        cur.execute(
+            f"SELECT DISTINCT date_trunc('month', event_time) FROM logs_changes "
+            f"WHERE event_time < %s AND {PENDING_FILTER}", (limite,)
+        )
+        en_attente = {r[0] for r in cur.fetchall()}
+        # même clé que le pivot (cf. load_logs.write_log_changes et la migration de rattrapage)
+        cur.execute(
+            "SELECT DISTINCT date_trunc('month', l.event_time) FROM logs l "
+            "WHERE l.event_time < %s AND l.field_name IS NOT NULL AND NOT EXISTS ("
+            "  SELECT 1 FROM logs_changes c"
+            "   WHERE c.target_table = COALESCE(l.target_table, '') AND c.target_id = COALESCE(l.target_id, '')"
+            "     AND c.operation = COALESCE(l.operation, '') AND c.event_time = l.event_time)", (limite,)
+        )
+        non_couverts = {r[0] for r in cur.fetchall()}
+    finally:
+        conn.close()
+    return mois, en_attente, non_couverts
+
+
+def _archive_month(debut: datetime.datetime, fin: datetime.datetime, directory: str, manifest: dict) -> dict:
+    """
+    Archive puis supprime les logs d'un mois, dans une seule transaction. Retourne l'entrée
+    du manifest, None si le mois est vide, ou {"motif": ...} si, relu sous le verrou de
+    table, il a des logs sans changement ou des changements en attente.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema()
+    name = f"logs-{debut:%Y-%m}-{uuid.uuid4().hex[:8]}.parquet"
+    final = os.path.join(directory, name)
+    tmp = os.path.join(directory, f".{name}.tmp")
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("LOCK TABLE logs IN SHARE ROW EXCLUSIVE MODE")
+        # un chargement de logs (logs + logs_changes) commité depuis _month_bounds est visible ici,
+        # et aucun autre ne peut l'être avant le commit
+        for motif, sql in (("changements_absents", MONTH_UNCOVERED_SQL), ("changements_en_attente", MONTH_PENDING_SQL)):
+            cur.execute(sql, {"debut": debut, "fin": fin})
+            if cur.fetchone()[0]:
+                conn.rollback()
+                return {"motif": motif}
+        read = conn.cursor(name=f"archive_{uuid.uuid4().hex}")
+        read.itersize = BATCH_ROWS
+        read.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM logs "
+            "WHERE event_time >= %s AND event_time < %s ORDER BY event_time, log_id", (debut, fin)
+        )
+        n, ids = 0, []
+        with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+            while True:
+                rows = read.fetchmany(BATCH_ROWS)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                writer.write_table(pa.table(
+                    [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+                ))
+                ids += [min(columns[0]), max(columns[0])]
+                n += len(rows)
+        read.close()
+        if n == 0:
+            os.remove(tmp)
+            conn.rollback()
+            return None
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, final)
+
+        cur.execute("DELETE FROM logs WHERE event_time >= %s AND event_time < %s", (debut, fin))
+        if cur.rowcount != n:
+            raise RuntimeError(f"{cur.rowcount} lignes supprimées pour {n} archivées ({debut:%Y-%m})")
+        entry = {
+            "mois": f"{debut:%Y-%m}",
+            "fichier": name,
+            "debut": debut.isoformat(),
+            "fin": fin.isoformat(),
+            "lignes": n,
+            "log_id_min": min(ids),
+            "log_id_max": max(ids),
+            "octets": os.path.getsize(final),
+            "sha256": _sha256(final),
+            "archive_le": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        _write_manifest(directory, {**manifest, "fichiers": manifest["fichiers"] + [entry]})
+        try:
+            conn.commit()
+        except Exception:
+            _write_manifest(directory, manifest)  # les lignes sont restées en base
+            raise
+        return entry
+    except Exception:
+        conn.rollback()
+        for path in (tmp, final):  # fichier jamais référencé par le manifest
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        conn.close()
+
+
+def archive_logs(retention_days: int = RETENTION_DAYS, directory: str = ARCHIVE_DIR, dry_run: bool = False) -> dict:
+    """
+    Archive les mois de logs plus anciens que `retention_days` entièrement présents dans
+    logs_changes et dont tous les changements sont appliqués. Attend la fin d'une exécution
+    concurrente. Retourne les mois archivés et ceux laissés en base (avec le motif).
+    """
+    seuil = datetime.date.today() - datetime.timedelta(days=retention_days)
+    limite = seuil.replace(day=1)  # seuls les mois entièrement antérieurs au seuil
+    with engine.connect() as lock:
+        lock.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        try:
+            return _archive_months(limite, directory, dry_run)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+
+
+def _archive_months(limite: datetime.date, directory: str, dry_run: bool) -> dict:
+    timer = StageTimer("retention")
+    mois, en_attente, non_couverts = _month_bounds(limite)
+    timer.lap("select")
+
+    result = {"limite": limite.isoformat(), "archives": [], "ignores": []}
+    if not dry_run:
+        os.makedirs(directory, exist_ok=True)
+    for debut, nb in mois:
+        motif = "changements_absents" if debut in non_couverts else \
+            "changements_en_attente" if debut in en_attente else None
+        if motif:
+            result["ignores"].append({"mois": f"{debut:%Y-%m}", "lignes": nb, "motif": motif})
+            continue
+        if dry_run:
+            result["archives"].append({"mois": f"{debut:%Y-%m}", "lignes": nb})
+            continue
+        fin = (debut + datetime.timedelta(days=32)).replace(day=1)
+        # relu sous le verrou : jamais réécrit depuis une copie périmée
+        entry = _archive_month(debut, fin, directory, load_manifest(directory))
+        if entry and "motif" in entry:
+            result["ignores"].append({"mois": f"{debut:%Y-%m}", "lignes": nb, "motif": entry["motif"]})
+        elif entry:
+            result["archives"].append(entry)
+            print(f"→ Logs {entry['mois']} archivés : {entry['lignes']} lignes, {entry['octets']} octets")
+    timer.lap("archive")
+    return result
+
+
+def read_archive(debut: datetime.datetime, fin: datetime.datetime, limit: int = None,
+                 directory: str = ARCHIVE_DIR) -> list:
+    """
+    Logs archivés dont event_time est dans [debut, fin), du plus récent au plus ancien
+    (tuples dans l'ordre de COLUMNS). Seuls les fichiers dont le mois recoupe la plage sont lus.
+    """
+    fichiers = [
+        f for f in load_manifest(directory)["fichiers"]
+        if datetime.datetime.fromisoformat(f["debut"]) < fin and datetime.datetime.fromisoformat(f["fin"]) > debut
+    ]
+    if not fichiers:
+        return []
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filters = [("event_time", ">=", debut), ("event_time", "<", fin)]
+    tables = [pq.read_table(os.path.join(directory, f["fichier"]), filters=filters) for f in fichiers]
+    table = pa.concat_tables(tables).sort_by([("event_time", "descending"), ("log_id", "descending")])
+    if limit is not None:
+        table = table.slice(0, limit)
+    return list(zip(*(table.column(c).to_pylist() for c in COLUMNS)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivage des logs anciens en Parquet")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="âge minimal des mois archivés (jours)")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="répertoire des archives")
+    parser.add_argument("--dry-run", action="store_true", help="liste les mois archivables sans rien modifier")
+    args = parser.parse_args()
+    print(json.dumps(archive_logs(args.days, args.dir, args.dry_run), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Table de features RFM (récence / fréquence / montant) par client.
+
+- Rafraîchissement complet : un GROUP BY sur faits_ventes, puis quintiles et
+  segments calculés en une passe vectorisée (NumPy / pandas).
+- Rafraîchissement incrémental : seuls les clients touchés par le dernier ETL
+  ou /logs/apply sont recalculés, et notés avec les quintiles courants de
+  client_rfm (percentile_cont côté SQL) ; les autres clients gardent leur note
+  jusqu'au prochain rafraîchissement complet.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend.database import SessionLocal
+from backend.models.rfm import ClientRFM
+
+QUANTILES = [0.2, 0.4, 0.6, 0.8]
+UPSERT_BATCH = 10_000
+
+FEATURES_SQL = """
+    SELECT id_client,
+           MAX(id_date)                                   AS derniere_vente,
+           COUNT(DISTINCT COALESCE(id_ticket, id_fait))   AS frequence,
+           COALESCE(SUM(montant), 0)                      AS montant
+    FROM faits_ventes
+    {where}
+    GROUP BY id_client
+"""
+
+
+def _to_date(id_dates) -> pd.Series:
+    return pd.to_datetime(pd.Series(id_dates).astype(str), format="%Y%m%d")
+
+
+def _recence(reference: int, derniere_vente: pd.Series) -> np.ndarray:
+    return (_to_date([reference]).iat[0] - _to_date(derniere_vente.to_numpy())).dt.days.to_numpy()
+
+
+def score_features(df: pd.DataFrame, cuts: dict, reference: int) -> pd.DataFrame:
+    """
+    Ajoute recence_jours, r/f/m_score, rfm et segment à un DataFrame
+    (id_client, derniere_vente, frequence, montant). `cuts` contient les
+    quintiles {recence, frequence, montant} ; notes de 1 (faible) à 5 (fort).
+    """
+    df = df.copy()
+    df["recence_jours"] = _recence(reference, df["derniere_vente"])
+    # récence : plus elle est faible, meilleure est la note
+    df["r_score"] = 5 - np.searchsorted(cuts["recence"], df["recence_jours"].to_numpy(), side="left")
+    df["f_score"] = 1 + np.searchsorted(cuts["frequence"], df["frequence"].to_numpy(), side="right")
+    df["m_score"] = 1 + np.searchsorted(cuts["montant"], df["montant"].to_numpy(), side="right")
+    df["rfm"] = df["r_score"].astype(str) + df["f_score"].astype(str) + df["m_score"].astype(str)
+
+    r, f = df["r_score"].to_numpy(), df["f_score"].to_numpy()
+    df["segment"] = np.select(
+        [
+            (r >= 4) & (f >= 4),
+            (r == 3) & (f >= 4),
+            (r >= 4) & (f >= 2),
+            (r >= 4) & (f == 1),
+            (r <= 2) & (f >= 3),
+            (r <= 2) & (f <= 2),
+        ],
+        ["Champions", "Clients fidèles", "Fidèles potentiels", "Nouveaux clients", "À risque", "À réactiver"],
+        default="À surveiller",
+    )
+    return df
+
+
+def _features(session: Session, clients=None) -> pd.DataFrame:
+    if clients is None:
+        sql, params = FEATURES_SQL.format(where=""), None
+    else:
+        sql, params = FEATURES_SQL.format(where="WHERE id_client = ANY(:clients)"), {"clients": clients}
+    df = pd.read_sql(text(sql), session.connection(), params=params)
+    return df.astype({"derniere_vente": int, "frequence": int, "montant": float})
+
+
+def _current_cuts(session: Session, reference: int):
+    """Quintiles de la table client_rfm actuelle (None si elle est vide)."""
+    row = session.execute(text("""
+        SELECT percentile_cont(CAST(:q AS float8[])) WITHIN GROUP
+                   (ORDER BY (:ref_date - to_date(derniere_vente::text, 'YYYYMMDD'))::float8) AS recence,
+               percentile_cont(CAST(:q AS float8[])) WITHIN GROUP (ORDER BY frequence::float8) AS frequence,
+               percentile_cont(CAST(:q AS float8[])) WITHIN GROUP (ORDER BY montant::float8)   AS montant
+        FROM client_rfm
+    """), {"q": QUANTILES, "ref_date": _to_date([reference]).iat[0].date()}).first()
+    if row is None or row.frequence is None:
+        return None
+    return {k: np.asarray(getattr(row, k), dtype=float) for k in ("recence", "frequence", "montant")}
+
+
+def _reference(session: Session):
+    """Date de référence de la récence : dernière date de vente connue (YYYYMMDD)."""
+    return session.execute(text("SELECT MAX(id_date) FROM faits_ventes")).scalar()
+
+
+def _upsert(session: Session, df: pd.DataFrame):
+    cols = ["id_client", "derniere_vente", "recence_jours", "frequence", "montant",
+            "r_score", "f_score", "m_score", "rfm", "segment"]
+    now = datetime.datetime.now()
+    records = [
+        dict(zip(cols, row), maj_le=now)
+        for row in df[cols].astype(object).itertuples(index=False, name=None)
+    ]
+    for i in range(0, len(records), UPSERT_BATCH):
+        stmt = insert(ClientRFM.__table__).values(records[i:i + UPSERT_BATCH])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id_client"],
+            set_={c: stmt.excluded[c] for c in cols[1:] + ["maj_le"]},
+        )
+        session.execute(stmt)
+
+
+def refresh_rfm(session: Session = None, clients=None) -> dict:
+    """
+    clients=None : recalcul complet ; sinon, recalcul des seuls clients donnés
+    (recalcul complet si client_rfm est encore vide).
+    Le commit est à la charge de l'appelant quand une session est fournie.
+    """
+    own_session = session is None
+    session = session or SessionLocal()
+    try:
+        reference = _reference(session)
+        if reference is None:
+            return {"clients": 0}
+
+        cuts = None
+        if clients is not None:
+            clients = sorted({c for c in clients if c is not None})
+            if not clients:
+                return {"clients": 0}
+            cuts = _current_cuts(session, reference)
+            if cuts is None:
+                clients = None
+
+        feats = _features(session, clients)
+        if feats.empty:
+            return {"clients": 0}
+        if clients is None:
+            cuts = {
+                "recence": np.quantile(_recence(reference, feats["derniere_vente"]), QUANTILES),
+                "frequence": np.quantile(feats["frequence"], QUANTILES),
+                "montant": np.quantile(feats["montant"], QUANTILES),
+            }
+            session.execute(text("TRUNCATE client_rfm"))
+
+        scored = score_features(feats, cuts, reference)
+        _upsert(session, scored)
+        if own_session:
+            session.commit()
+        return {
+            "mode": "complet" if clients is None else "incrémental",
+            "clients": int(len(scored)),
+            "reference": int(reference),
+            "segments": scored["segment"].value_counts().to_dict(),
+        }
+    finally:
+        if own_session:
+            session.close()
+
+
+if __name__ == "__main__":
+    print(refresh_rfm())
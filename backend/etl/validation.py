@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Étape de validation vectorisée commune à etl_from_excel et load_logs_from_excel.
+
+Chaque contrôle porte sur des colonnes entières (masques pandas) au lieu d'un
+print par ligne : une ligne est rejetée au premier motif rencontré, les rejets
+sont écrits en une fois dans etl_rejects (valeurs brutes en JSONB) et le
+chargement renvoie un résumé agrégé par feuille et par motif.
+
+Motifs :
+  id_manquant, date_manquante, date_invalide, client_manquant, employe_manquant,
+  ean_invalide, quantite_invalide, date_inconnue, client_inconnu, employe_inconnu,
+  produit_inconnu, cle_manquante, event_time_invalide, detail_invalide
+  (et pour /logs/apply : date_invalide, ean_invalide, quantite_invalide, prix_invalide)
+"""
+import datetime
+import uuid
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from backend.models.etl import EtlReject
+
+EXCEL_ORIGIN = "1899-12-30"
+INSERT_BATCH = 10_000
+
+
+def missing(values: pd.Series) -> pd.Series:
+    """Valeur absente : NaN / None ou chaîne vide."""
+    return values.isna() | (values.astype(str).str.strip() == "")
+
+
+def parse_serials(values: pd.Series) -> pd.Series:
+    """Numéros de série Excel (entiers, ex. '45518') -> Timestamp ; NaT sinon."""
+    num = pd.to_numeric(values, errors="coerce")
+    num = num.where(num % 1 == 0)
+    return pd.Timestamp(EXCEL_ORIGIN) + pd.to_timedelta(num, unit="D")
+
+
+def parse_dates(values: pd.Series, dayfirst: bool = True) -> pd.Series:
+    """
+    Dates Excel : Timestamp déjà converti, numéro de série ou texte
+    (jour en premier par défaut). NaT si la valeur ne se lit pas.
+    """
+    out = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    is_ts = values.map(lambda v: isinstance(v, (datetime.date, pd.Timestamp)))
+    if is_ts.any():
+        out[is_ts] = pd.to_datetime(values[is_ts])
+    text = values[~is_ts & ~missing(values)].astype(str).str.strip()
+    serials = text.str.fullmatch(r"\d+")
+    if serials.any():
+        out[serials[serials].index] = parse_serials(text[serials])
+    rest = text[~serials]
+    if len(rest):
+        out[rest.index] = pd.to_datetime(rest, dayfirst=dayfirst, errors="coerce")
+        # formats mélangés dans la colonne : seconde passe sur les valeurs restées illisibles
+        retry = rest[out[rest.index].isna()]
+        if len(retry):
+            out[retry.index] = pd.to_datetime(retry, dayfirst=dayfirst, errors="coerce")
+    return out
+
+
+def parse_eans(values: pd.Series) -> pd.Series:
+    """Codes EAN -> Int64 ; <NA> si absent, non numérique ou non entier."""
+    num = pd.to_numeric(values.astype(str).str.strip(), errors="coerce")
+    return num.where(num % 1 == 0).astype("Int64")
+
+
+def parse_quantites(values: pd.Series) -> pd.Series:
+    """
+    Quantités -> float entier ; 1 si absente ; NaN si non numérique, non entière
+    (2.5) ou nulle / négative. Virgule décimale acceptée ('3,0').
+    """
+    num = pd.to_numeric(values.astype(str).str.strip().str.replace(",", ".", regex=False), errors="coerce")
+    num = num.where((num % 1 == 0) & (num > 0))
+    return num.where(~missing(values), 1.0)
+
+
+def unknown(values: pd.Series, known) -> pd.Series:
+    """Clé étrangère absente de la dimension (valeurs manquantes non comptées)."""
+    return values.notna() & ~values.isin(list(known))
+
+
+class Rejects:
+    """Rejets d'un chargement (un run_id), regroupés puis écrits en une fois."""
+
+    def __init__(self, source: str, run_id: str = None):
+        self.source = source
+        self.run_id = run_id or uuid.uuid4().hex
+        self.frames = []
+        self.counts = Counter()
+
+    def check(self, sheet: str, df: pd.DataFrame, ref: pd.Series = None) -> "FrameCheck":
+        return FrameCheck(self, sheet, df, ref)
+
+    def add(self, sheet: str, rows: pd.DataFrame, reason: str, ref: pd.Series):
+        self.counts[(sheet, reason)] += len(rows)
+        raw = rows.astype(str).where(rows.notna(), None)
+        self.frames.append(pd.DataFrame({
+            "sheet": sheet,
+            "row_ref": ref.astype(str).to_numpy(),
+            "reason": reason,
+            "raw": raw.to_dict("records"),
+        }))
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def summary(self) -> dict:
+        par_feuille = {}
+        for (sheet, reason), n in sorted(self.counts.items()):
+            par_feuille.setdefault(sheet, {})[reason] = n
+        return {"run_id": self.run_id, "rejets": self.total, "par_feuille": par_feuille}
+
+    def write(self, session: Session) -> int:
+        """Insertion groupée dans etl_rejects ; commit à la charge de l'appelant."""
+        if not self.frames:
+            return 0
+        records = pd.concat(self.frames, ignore_index=True).assign(run_id=self.run_id, source=self.source)
+        records = records.to_dict("records")
+        for i in range(0, len(records), INSERT_BATCH):
+            session.execute(EtlReject.__table__.insert(), records[i:i + INSERT_BATCH])
+        return len(records)
+
+
+class FrameCheck:
+    """Contrôles successifs sur un DataFrame : chaque ligne est rejetée au premier motif."""
+
+    def __init__(self, rejects: Rejects, sheet: str, df: pd.DataFrame, ref: pd.Series = None):
+        self.rejects = rejects
+        self.sheet = sheet
+        self.df = df
+        # référence de ligne : identifiant métier si connu, sinon numéro de ligne Excel (en-tête = 1)
+        self.ref = ref if ref is not None else pd.Series(
+            [f"ligne {i}" for i in np.arange(len(df)) + 2], index=df.index
+        )
+        self.ok = pd.Series(True, index=df.index)
+
+    def reject(self, bad: pd.Series, reason: str) -> "FrameCheck":
+        bad = self.ok & bad.fillna(False).astype(bool)
+        if bad.any():
+            self.rejects.add(self.sheet, self.df[bad], reason, self.ref[bad])
+            self.ok &= ~bad
+        return self
+
+    def valid(self) -> pd.DataFrame:
+        return self.df[self.ok]
+
+
+def validate_faits(df: pd.DataFrame, cols: dict, known: dict, rejects: Rejects, preload=None) -> pd.DataFrame:
+    """
+    Feuille « Vente Détail » -> DataFrame typé (id_fait, id_date, id_client, id_employe,
+    ean, id_ticket, quantite) des seules lignes valides et nouvelles.
+    `cols` : colonnes détectées (fid, date, client, employe, ean, ticket, quantite) ;
+    `known` : clés des dimensions et faits existants (dates, clients, emps, prods, faits) ;
+    `preload` : appelé avec les clés lues ({dates, clients, emps, prods: Series}) avant les
+    contrôles de clés étrangères, pour compléter `known` avec les seules clés du lot.
+    """
+    fid = df[cols["fid"]]
+    # lignes déjà chargées (rechargement du même fichier) : ignorées, pas rejetées
+    nouveau = ~fid.isin(list(known["faits"])) & ~(fid.duplicated() & fid.notna())
+    df = df[nouveau]
+    fid = fid[nouveau]
+
+    dates = parse_dates(df[cols["date"]])
+    eans = parse_eans(df[cols["ean"]])
+    id_dates = (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype("Int64")
+    clients, employes = df[cols["client"]], df[cols["employe"]]
+    # quantité absente : 1 ; présente mais non numérique, non entière ou <= 0 : rejet
+    quantite = pd.Series(1.0, index=df.index)
+    if cols.get("quantite"):
+        quantite = parse_quantites(df[cols["quantite"]])
+
+    if preload is not None:
+        preload({"dates": id_dates, "clients": clients, "emps": employes, "prods": eans})
+
+    check = rejects.check("faits", df, ref=fid.fillna("").astype(str))
+    check.reject(missing(fid), "id_manquant") \
+        .reject(missing(df[cols["date"]]), "date_manquante") \
+        .reject(dates.isna(), "date_invalide") \
+        .reject(missing(clients), "client_manquant") \
+        .reject(missing(employes), "employe_manquant") \
+        .reject(eans.isna(), "ean_invalide") \
+        .reject(quantite.isna(), "quantite_invalide") \
+        .reject(unknown(id_dates, known["dates"]), "date_inconnue") \
+        .reject(unknown(clients, known["clients"]), "client_inconnu") \
+        .reject(unknown(employes, known["emps"]), "employe_inconnu") \
+        .reject(unknown(eans, known["prods"]), "produit_inconnu")
+    ok = check.ok
+
+    ticket = df[cols["ticket"]] if cols.get("ticket") else pd.Series(None, index=df.index, dtype=object)
+
+    return pd.DataFrame({
+        "id_fait": fid[ok],
+        "id_date": id_dates[ok].astype(int),
+        "id_client": clients[ok],
+        "id_employe": employes[ok],
+        "ean": eans[ok].astype(np.int64),
+        "id_ticket": ticket[ok].where(ticket[ok].notna(), None),
+        "quantite": quantite[ok].astype(int),
+    })
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Ingestion continue par micro-lots depuis un répertoire de dépôt (DROP_DIR).
+
+  DROP_DIR/ventes/  .xlsx (feuilles de l'extraction), .csv ou .ndjson (lignes « Vente Détail »)
+  DROP_DIR/logs/    .xlsx (feuille Logs), .csv ou .ndjson (colonnes du fichier de logs)
+
+Toutes les DROP_POLL_SECONDS secondes, les fichiers nouveaux (empreinte sha256 absente
+de etl_files) et stables (non modifiés depuis DROP_SETTLE_SECONDS) sont chargés, du plus
+ancien au plus récent, par les transformations existantes (etl_from_frames,
+load_logs_from_frame), puis les logs chargés sont appliqués aussitôt (apply_pending_logs).
+Chaque fichier chargé est enregistré dans etl_files, en succès (dans la transaction du
+chargement) comme en erreur de lecture ou de validation : il n'est jamais rechargé, sa
+version corrigée (nouvelle empreinte) l'est.
+Une erreur transitoire (base indisponible, interblocage, délai de verrou dépassé…) n'est
+pas enregistrée : le fichier est repris aux passages suivants, avec un délai croissant
+plafonné à DROP_RETRY_MAX_SECONDS.
+
+Un seul processus traite le dépôt à la fois (verrou consultatif PostgreSQL) : le watcher
+peut être démarré par chaque worker gunicorn.
+
+    python -m backend.etl.watcher --dir backend/data/drop          # boucle
+    python -m backend.etl.watcher --dir backend/data/drop --once   # un seul passage
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import DataError
+
+from backend.database import SessionLocal, engine
+from backend.etl.apply_logs import apply_pending_logs
+from backend.etl.load_logs import load_logs_from_frame, read_logs_file
+from backend.etl.load_olap import etl_from_frames, read_sales_file
+from backend.metrics import StageTimer
+from backend.models.etl import EtlFile
+
+DROP_DIR = os.getenv("DROP_DIR", "")
+POLL_SECONDS = float(os.getenv("DROP_POLL_SECONDS", "5"))
+SETTLE_SECONDS = float(os.getenv("DROP_SETTLE_SECONDS", "2"))
+EXTENSIONS = {".xlsx", ".csv", ".ndjson", ".jsonl"}
+KINDS = ("ventes", "logs")
+LOCK_KEY = 74_110_041  # pg_try_advisory_lock : un seul watcher actif
+RETRY_MAX_SECONDS = float(os.getenv("DROP_RETRY_MAX_SECONDS", "600"))
+# erreurs du fichier lui-même (format, colonnes, valeurs refusées par la base) : définitives ;
+# les autres (base indisponible, mais aussi bug du code) sont retentées
+PERMANENT_ERRORS = (ValueError, UnicodeDecodeError, zipfile.BadZipFile, DataError)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load(kind: str, path: Path, before_commit) -> dict:
+    if kind == "ventes":
+        timer = StageTimer("olap")
+        frames = read_sales_file(str(path))
+        timer.lap("read")
+        return etl_from_frames(frames, timer, before_commit)
+    timer = StageTimer("logs")
+    df = read_logs_file(str(path))
+    timer.lap("read")
+    return load_logs_from_frame(df, timer, before_commit)
+
+
+def _enregistre(sha256: str) -> bool:
+    """Le fichier figure-t-il déjà dans etl_files ? (False si la base ne répond pas : nouvel essai)"""
+    session = SessionLocal()
+    try:
+        return session.query(EtlFile.file_id).filter(EtlFile.sha256 == sha256).first() is not None
+    except Exception:
+        return False
+    finally:
+        session.close()
+
+
+class DropWatcher:
+    """Scrute le répertoire de dépôt dans un thread (démarré par l'application si DROP_DIR est défini)."""
+
+    def __init__(self, root: str = DROP_DIR, interval: float = POLL_SECONDS):
+        self.root = Path(root) if root else None
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._hashes = {}  # chemin -> (taille, mtime_ns, sha256) : pas de re-hachage d'un fichier inchangé
+        self._retries = {}  # sha256 -> (essais, prochain essai) après une erreur transitoire
+        self.last_poll = None
+
+    def candidates(self) -> list:
+        """Fichiers stables du dépôt : [(mtime, kind, chemin, taille, sha256)], du plus ancien au plus récent."""
+        found = []
+        now = time.time()
+        for kind in KINDS:
+            folder = self.root / kind
+            if not folder.is_dir():
+                continue
+            for path in folder.iterdir():
+                if path.suffix.lower() not in EXTENSIONS or path.name.startswith((".", "~$")):
+                    continue
+                st = path.stat()
+                if now - st.st_mtime < SETTLE_SECONDS:
+                    continue  # encore en cours d'écriture
+                cached = self._hashes.get(path)
+                if cached is None or cached[:2] != (st.st_size, st.st_mtime_ns):
+                    cached = (st.st_size, st.st_mtime_ns, _sha256(path))
+                    self._hashes[path] = cached
+                found.append((st.st_mtime, kind, path, st.st_size, cached[2]))
+        return sorted(found)
+
+    def process(self, kind: str, path: Path, size: int, sha256: str) -> dict:
+        """
+        Charge un fichier et l'enregistre dans etl_files : dans la transaction du chargement
+        en cas de succès (pas de rechargement après un arrêt entre les deux), à part en cas
+        d'erreur définitive. Une erreur transitoire n'est pas enregistrée (statut
+        « a_reessayer » : nouvel essai après un délai).
+        """
+        record = {"kind": kind, "path": str(path.relative_to(self.root)), "sha256": sha256, "size": size}
+
+        def enregistrer(session, summary):
+            record.update(status="ok", run_id=summary.get("run_id"), summary=summary)
+            session.add(EtlFile(**record))
+
+        try:
+            _load(kind, path, enregistrer)
+        except Exception as e:
+            if record.get("status") == "ok" and _enregistre(sha256):
+                # chargement validé, échec après commit (mise à jour des rollups…) : rien à refaire
+                print(f"> [WARN] Dépôt {record['path']} chargé, suite interrompue : {type(e).__name__}: {e}")
+                self._retries.pop(sha256, None)
+                return record
+            record.update(run_id=None, summary=None, error=f"{type(e).__name__}: {e}")
+            if not isinstance(e, PERMANENT_ERRORS):
+                essais = self._retries.get(sha256, (0, 0))[0] + 1
+                delai = min(RETRY_MAX_SECONDS, self.interval * 2 ** essais)
+                self._retries[sha256] = (essais, time.time() + delai)
+                print(f"> [WARN] Dépôt {record['path']} : {record['error']} (essai {essais}, reprise dans {delai:g} s)")
+                record.update(status="a_reessayer")
+                return record
+            print(f"> [ERROR] Dépôt {record['path']} : {e}")
+            record.update(status="erreur")
+            session = SessionLocal()
+            try:
+                session.add(EtlFile(**record))
+                session.commit()
+            finally:
+                session.close()
+        self._retries.pop(sha256, None)
+        return record
+
+    def poll(self) -> dict:
+        """Un passage : charge les nouveaux fichiers puis applique les logs. Retourne le bilan."""
+        self.last_poll = time.time()
+        result = {"fichiers": [], "apply": None}
+        if self.root is None or not self.root.is_dir():
+            return result
+        with engine.connect() as conn:
+            if not conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY}).scalar():
+                return result  # un autre processus traite le dépôt
+            try:
+                files = self.candidates()
+                if not files:
+                    return result
+                session = SessionLocal()
+                try:
+                    done = {
+                        r[0] for r in session.query(EtlFile.sha256).filter(EtlFile.sha256.in_([f[4] for f in files]))
+                    }
+                finally:
+                    session.close()
+                for _, kind, path, size, sha256 in files:
+                    if sha256 in done or self._retries.get(sha256, (0, 0))[1] > time.time():
+                        continue
+                    done.add(sha256)  # même contenu déposé deux fois dans le passage
+                    record = self.process(kind, path, size, sha256)
+                    result["fichiers"].append({k: record.get(k) for k in ("kind", "path", "status", "run_id")})
+                if any(f["kind"] == "logs" and f["status"] == "ok" for f in result["fichiers"]):
+                    result["apply"] = apply_pending_logs()
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+        if result["fichiers"]:
+            print(f"→ Dépôt : {len(result['fichiers'])} fichier(s) traité(s), logs appliqués : {result['apply']}")
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:  # base indisponible, etc. : nouvel essai au passage suivant
+                print(f"> [ERROR] Watcher du dépôt : {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="drop-watcher", daemon=True)
+        self._thread.start()
+        print(f"👀 Répertoire de dépôt surveillé : {self.root} (toutes les {self.interval:g} s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+drop_watcher = DropWatcher()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion continue du répertoire de dépôt")
+    parser.add_argument("--dir", default=DROP_DIR, help="répertoire de dépôt (défaut : $DROP_DIR)")
+    parser.add_argument("--interval", type=float, default=POLL_SECONDS)
+    parser.add_argument("--once", action="store_true", help="un seul passage puis sortie")
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("répertoire de dépôt requis (--dir ou DROP_DIR)")
+
+    watcher = DropWatcher(args.dir, args.interval)
+    if args.once:
+        print(watcher.poll())
+        return
+    try:
+        watcher._run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# backend/gunicorn_conf.py
+"""
+Mode production : gunicorn + workers uvicorn pré-forkés.
+
+    gunicorn -c backend/gunicorn_conf.py backend.main:app
+
+- WEB_CONCURRENCY : nombre de workers (défaut : nombre de cœurs).
+- Le maître applique les migrations (backend/migrations.py) puis construit les rollups
+  partagés au démarrage (backend/olap/shared.py) ;
+  les workers les ouvrent en mmap sans copie.
+- PROMETHEUS_MULTIPROC_DIR : si défini, /metrics agrège les métriques de tous les workers.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+# Pas de preload_app : l'application est importée dans chaque worker. Le maître importe
+# quand même backend.database dans on_starting (migrations, rollups) : ses pools sont
+# vidés avant le fork, et post_fork les revide par sécurité, pour qu'aucun worker
+# n'hérite d'une socket psycopg2 ouverte par le maître.
+preload_app = False
+
+
+def _dispose_engines():
+    from backend.database import engine, read_engine
+    engine.dispose()
+    read_engine.dispose()
+
+
+def on_starting(server):
+    prom_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if prom_dir:
+        shutil.rmtree(prom_dir, ignore_errors=True)
+        os.makedirs(prom_dir, exist_ok=True)
+
+    from backend.migrations import run_migrations
+    from backend.olap.shared import build_aggregates
+    try:
+        run_migrations()  # avant les rollups, qui lisent faits_ventes.montant
+        manifest = build_aggregates()
+        server.log.info("Rollups partagés publiés : %s", manifest)
+    except Exception as e:
+        # base vide ou injoignable : les workers liront en SQL jusqu'au prochain ETL
+        server.log.warning("Rollups partagés non construits : %s", e)
+    finally:
+        _dispose_engines()
+
+
+def post_fork(server, worker):
+    if "backend.database" in sys.modules:
+        _dispose_engines()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,27 +1,51 @@
 import uvicorn
 from fastapi import FastAPI
 
-from backend.database import engine, Base
+from backend.database import engine, Base, read_after_write_middleware
+from backend.etl.watcher import drop_watcher
+from backend.metrics import metrics_middleware
+from backend.migrations import run_migrations
 from backend.routers.dim import router as dim_router
 from backend.routers.fact import router as fact_router
 from backend.routers.etl import router as etl_router
+from backend.routers.metrics import router as metrics_router
+from backend.routers.admin import router as admin_router
+from backend.routers.export import router as export_router
 
 # Charge les modèles pour Base.metadata
-import backend.models.dim, backend.models.fact
+import backend.models.dim, backend.models.fact, backend.models.rfm, backend.models.sketch, backend.models.etl, backend.models.basket
 from backend.routers import analytics
 
 # Charger les modèles pour les logs
 from backend.routers import logs
 
-# Création automatique des tables OLAP
+# Création automatique des tables OLAP, puis migration des bases existantes
 Base.metadata.create_all(bind=engine)
+run_migrations()
 
 app = FastAPI(title="OLAP PoC")
+app.middleware("http")(read_after_write_middleware)
+app.middleware("http")(metrics_middleware)
 app.include_router(dim_router, prefix="/dim")
 app.include_router(fact_router, prefix="/faits")
 app.include_router(etl_router, prefix="/etl")
 app.include_router(analytics.router)
 app.include_router(logs.router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
+app.include_router(export_router)
+
+
+@app.on_event("startup")
+def start_drop_watcher():
+    # Ingestion continue si DROP_DIR est défini (un seul processus actif, cf. backend/etl/watcher.py)
+    if drop_watcher.root is not None:
+        drop_watcher.start()
+
+
+@app.on_event("shutdown")
+def stop_drop_watcher():
+    drop_watcher.stop()
 
 if __name__ == "__main__":
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8001, reload=True)
@@ -0,0 +1,161 @@
+# backend/metrics.py
+
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from sqlalchemy import event
+from starlette.responses import Response
+from starlette.routing import Match
+
+# ─── Métriques exposées sur /metrics ──────────────────────────────────────────
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latence des requêtes HTTP par route",
+    ["method", "route", "status"],
+)
+HTTP_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Nombre de requêtes SQL exécutées par requête HTTP (détecte les N+1)",
+    ["method", "route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000),
+)
+HTTP_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Temps passé en base par requête HTTP",
+    ["method", "route"],
+)
+SQL_QUERIES = Counter(
+    "sql_queries_total",
+    "Requêtes SQL exécutées, par route d'origine ('-' hors requête HTTP) et type d'instruction",
+    ["route", "statement"],
+)
+SQL_LATENCY = Histogram(
+    "sql_query_duration_seconds",
+    "Durée des requêtes SQL par type d'instruction",
+    ["statement"],
+)
+ETL_STAGE = Histogram(
+    "etl_stage_duration_seconds",
+    "Durée des étapes ETL",
+    ["etl", "stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+
+
+class RequestStats:
+    """Compteurs SQL de la requête HTTP en cours (partagés avec le threadpool via le contexte)."""
+    __slots__ = ("route", "queries", "db_seconds")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+def _statement_kind(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "?"
+
+
+def instrument_engine(engine):
+    """
+    Branche les hooks before/after_cursor_execute qui chronomètrent chaque requête SQL ;
+    handle_error retire le départ d'une requête en échec.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        push_start(conn, context, "query_start")
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        kind = _statement_kind(statement)
+        stats = current_request.get()
+        SQL_LATENCY.labels(kind).observe(elapsed)
+        SQL_QUERIES.labels(stats.route if stats else "-", kind).inc()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        pop_start(context, "query_start")
+
+
+def push_start(conn, context, key: str):
+    """before_cursor_execute : empile le départ de la requête et le note sur son contexte d'exécution."""
+    conn.info.setdefault(key, []).append(time.perf_counter())
+    if context is not None:
+        setattr(context, f"_{key}_pushed", True)
+
+
+def pop_start(error_context, key: str):
+    """handle_error : retire le départ empilé pour la requête en échec (after_cursor_execute n'est pas appelé)."""
+    execution = error_context.execution_context
+    if execution is None or not getattr(execution, f"_{key}_pushed", False):
+        return  # échec avant l'exécution (connexion, paramètres) : rien n'a été empilé
+    starts = error_context.connection.info.get(key)
+    if starts:
+        starts.pop()
+
+
+def route_template(request) -> str:
+    """Chemin déclaré de la route (ex. /analytics/revenue_by_date/{id_date}) pour limiter la cardinalité."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+async def metrics_middleware(request, call_next):
+    route = route_template(request)
+    stats = RequestStats(route)
+    token = current_request.set(stats)
+    status = 500
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_LATENCY.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+        HTTP_DB_QUERIES.labels(request.method, route).observe(stats.queries)
+        HTTP_DB_SECONDS.labels(request.method, route).observe(stats.db_seconds)
+        current_request.reset(token)
+
+
+class StageTimer:
+    """
+    Chronomètre les étapes successives d'un traitement : chaque `lap(stage)`
+    clôt l'étape en cours, l'enregistre dans `etl_stage_duration_seconds`
+    et démarre la suivante.
+    """
+
+    def __init__(self, etl: str):
+        self.etl = etl
+        self.durations = {}
+        self._start = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._start
+        ETL_STAGE.labels(self.etl, stage).observe(elapsed)
+        self.durations[stage] = elapsed
+        self._start = now
+        return elapsed
+
+
+def metrics_response() -> Response:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # mode gunicorn : agrégation des fichiers de métriques de tous les workers
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
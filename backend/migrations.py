@@ -0,0 +1,71 @@
+# backend/migrations.py
+"""
+Migrations idempotentes des bases existantes, appliquées au démarrage de l'application
+(et par `python -m backend.migrations`).
+
+db/init.sql ne s'exécute qu'à la création du volume PostgreSQL, et Base.metadata.create_all
+crée les tables manquantes sans modifier les tables existantes. Chaque migration est
+rejouable ; celles déjà passées sont notées dans schema_migrations et sautées. Un verrou
+consultatif sérialise les workers qui démarrent en même temps.
+"""
+from sqlalchemy import text
+
+from backend.database import engine
+
+LOCK_KEY = 74_110_030  # pg_advisory_xact_lock
+
+# (nom, instructions SQL), dans l'ordre d'application
+MIGRATIONS = [
+    ("faits_ventes_quantite_montant", [
+        "ALTER TABLE faits_ventes ADD COLUMN IF NOT EXISTS quantite INT NOT NULL DEFAULT 1",
+        "ALTER TABLE faits_ventes ADD COLUMN IF NOT EXISTS montant NUMERIC(12,2)",
+        # reprise des ventes déjà chargées au prix courant (faute de prix historique)
+        """
+        UPDATE faits_ventes f
+           SET montant = p.prix * f.quantite
+          FROM dim_produit p
+         WHERE p.ean = f.ean
+           AND f.montant IS NULL
+        """,
+    ]),
+    # logs pivotés par changement : rattrapage des logs chargés avant logs_changes
+    # (sans effet si des changements existent déjà, cf. backend/etl/load_logs.py)
+    ("logs_changes_rattrapage", [
+        """
+        INSERT INTO logs_changes (target_table, target_id, operation, event_time, id_user, champs)
+        SELECT COALESCE(target_table, ''), COALESCE(target_id, ''), COALESCE(operation, ''), event_time, id_user,
+               jsonb_object_agg(lower(trim(field_name)), detail)
+          FROM logs
+         WHERE field_name IS NOT NULL AND NOT EXISTS (SELECT 1 FROM logs_changes)
+         GROUP BY 1, 2, 3, 4, 5
+        """,
+    ]),
+]
+
+
+def run_migrations(bind=engine) -> list:
+    """Applique les migrations pas encore passées ; retourne leurs noms."""
+    applied = []
+    with bind.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_KEY})
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+              name        VARCHAR(100) PRIMARY KEY,
+              applied_at  TIMESTAMP    NOT NULL DEFAULT now()
+            )
+        """))
+        done = {r[0] for r in conn.execute(text("SELECT name FROM schema_migrations"))}
+        for name, statements in MIGRATIONS:
+            if name in done:
+                continue
+            for sql in statements:
+                conn.execute(text(sql))
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            applied.append(name)
+    if applied:
+        print(f"→ Migrations appliquées : {', '.join(applied)}")
+    return applied
+
+
+if __name__ == "__main__":
+    run_migrations()
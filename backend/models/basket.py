@@ -0,0 +1,21 @@
+from sqlalchemy import Column, BigInteger, String
+from backend.database import Base
+
+
+class BasketPair(Base):
+    __tablename__ = "basket_pairs"
+    ean_a = Column(BigInteger, primary_key=True)                # ean_a < ean_b
+    ean_b = Column(BigInteger, primary_key=True, index=True)
+    tickets = Column(BigInteger, nullable=False)                # tickets contenant les deux produits
+
+
+class BasketItem(Base):
+    __tablename__ = "basket_items"
+    ean = Column(BigInteger, primary_key=True)
+    tickets = Column(BigInteger, nullable=False)                # tickets contenant le produit
+
+
+class BasketMeta(Base):
+    __tablename__ = "basket_meta"
+    cle = Column(String(30), primary_key=True)                  # 'tickets', 'tickets.N' : nombre de tickets (somme)
+    valeur = Column(BigInteger, nullable=False)
@@ -0,0 +1,31 @@
+from sqlalchemy import BigInteger, Column, String, Text, TIMESTAMP, func
+from sqlalchemy.dialects.postgresql import JSONB
+from backend.database import Base
+
+
+class EtlReject(Base):
+    """Lignes écartées par l'étape de validation des ETL (cf. backend/etl/validation.py)."""
+    __tablename__ = "etl_rejects"
+    reject_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    run_id = Column(String(32), nullable=False, index=True)
+    source = Column(String(20), nullable=False)     # olap | logs
+    sheet = Column(String(50), nullable=False)      # feuille ou groupe (faits, dates, Logs…)
+    row_ref = Column(String(100))                   # identifiant de la ligne ou 'ligne N'
+    reason = Column(String(50), nullable=False, index=True)
+    raw = Column(JSONB)                             # valeurs brutes de la ligne
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+
+
+class EtlFile(Base):
+    """Fichiers du répertoire de dépôt traités par le watcher (cf. backend/etl/watcher.py)."""
+    __tablename__ = "etl_files"
+    file_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind = Column(String(20), nullable=False)        # ventes | logs
+    path = Column(Text, nullable=False)              # chemin relatif au répertoire de dépôt
+    sha256 = Column(String(64), nullable=False, unique=True)
+    size = Column(BigInteger, nullable=False)
+    status = Column(String(20), nullable=False)      # ok | erreur
+    run_id = Column(String(32))                      # chargement associé (etl_rejects)
+    summary = Column(JSONB)                          # résumé du chargement et de l'application des logs
+    error = Column(Text)
+    processed_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
@@ -1,6 +1,7 @@
 
 
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP
+from sqlalchemy import BigInteger, Column, Date, Index, Integer, String, Text, TIMESTAMP
+from sqlalchemy.dialects.postgresql import JSONB
 from backend.database import Base
 
 
@@ -14,3 +15,35 @@ class Log(Base):
     target_id = Column(String(50))
     field_name = Column(String(100))
     detail = Column(Text, nullable=True)
+
+
+class LogStatJour(Base):
+    """Compteurs de modifications par jour × utilisateur × table × opération (alimentés à l'ingestion)."""
+    __tablename__ = "logs_stats_jour"
+    jour = Column(Date, primary_key=True)
+    id_user = Column(String(50), primary_key=True)
+    target_table = Column(String(50), primary_key=True)
+    operation = Column(String(10), primary_key=True)
+    nb = Column(BigInteger, nullable=False, default=0)
+
+
+class LogChange(Base):
+    """
+    Représentation pivotée de logs : une ligne par changement (table, id, opération,
+    utilisateur, instant) avec tous les champs modifiés dans `champs` (JSONB).
+    """
+    __tablename__ = "logs_changes"
+    change_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    target_table = Column(String(50), nullable=False)
+    target_id = Column(String(50), nullable=False)
+    operation = Column(String(10), nullable=False)
+    event_time = Column(TIMESTAMP, nullable=False)
+    id_user = Column(String(50))
+    champs = Column(JSONB, nullable=False)
+    applied_at = Column(TIMESTAMP, nullable=True)  # renseigné par /logs/apply
+
+    __table_args__ = (
+        Index("ix_logs_changes_target", "target_table", "target_id"),
+        Index("ix_logs_changes_pending", "target_table", "operation",
+              postgresql_where=applied_at.is_(None)),
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, SmallInteger, String, Numeric, TIMESTAMP
+from backend.database import Base
+
+
+class ClientRFM(Base):
+    __tablename__ = "client_rfm"
+    id_client = Column(String, primary_key=True, index=True)
+    derniere_vente = Column(Integer, nullable=False)   # id_date YYYYMMDD du dernier achat
+    recence_jours = Column(Integer, nullable=False)
+    frequence = Column(Integer, nullable=False)        # nombre de tickets
+    montant = Column(Numeric(14, 2), nullable=False)
+    r_score = Column(SmallInteger, nullable=False)
+    f_score = Column(SmallInteger, nullable=False)
+    m_score = Column(SmallInteger, nullable=False)
+    rfm = Column(String(3), nullable=False)            # ex. '545'
+    segment = Column(String(30), nullable=False, index=True)
+    maj_le = Column(TIMESTAMP, nullable=False)
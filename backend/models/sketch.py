@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, LargeBinary
+from backend.database import Base
+
+
+class HllSketch(Base):
+    __tablename__ = "hll_sketches"
+    metric = Column(String(20), primary_key=True)      # clients | tickets
+    dimension = Column(String(20), primary_key=True)   # all | employe | rayon
+    valeur = Column(String(100), primary_key=True)     # '' pour la dimension 'all'
+    id_date = Column(Integer, primary_key=True)
+    registres = Column(LargeBinary, nullable=False)    # registres HLL encodés (cf. backend/olap/hll.py)
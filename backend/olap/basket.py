@@ -0,0 +1,332 @@
+# backend/olap/basket.py
+"""
+Moteur d'association « panier » : matrice creuse de co-occurrence EAN × EAN
+construite à partir des tickets (faits_ventes.id_ticket).
+
+- Les paires (a, b), a < b, sont encodées sur un int64 `(a << 32) | b` et
+  comptées de manière vectorisée (NumPy), sans auto-jointure SQL.
+- Les comptes sont stockés en base (basket_pairs, basket_items, basket_meta) :
+  tous les workers et processus (API, ETL, watcher) lisent et écrivent le même
+  index, sans copie en mémoire par worker.
+- Le comptage est maintenu incrémentalement : les nouvelles lignes de vente
+  (ETL, /faits/faits/ventes, /logs/apply) ne recalculent que les tickets touchés, et
+  les écarts sont ajoutés aux comptes en base (upsert) dans la transaction même
+  qui insère les ventes.
+- Verrous consultatifs : la reconstruction prend LOCK_KEY en exclusif, chaque mise
+  à jour en partagé plus un verrou par ticket touché. Une mise à jour ne peut ni se
+  perdre dans un TRUNCATE, ni être comptée deux fois, et deux ventes d'un même
+  ticket ne calculent pas leur écart sur le même panier ; les ventes de tickets
+  différents ne s'attendent pas.
+
+support(a, b)    = tickets(a et b) / tickets
+confidence(a→b) = tickets(a et b) / tickets(a)
+lift(a, b)       = confidence(a→b) / (tickets(b) / tickets)
+"""
+import random
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from backend.database import SessionLocal
+
+CHUNK_SIZE = 1_000_000
+WRITE_BATCH = 100_000
+LOCK_KEY = 74_110_035  # pg_advisory_xact_lock : reconstruction (exclusif) / mises à jour (partagé)
+# pg_advisory_xact_lock(TICKET_LOCK_CLASS, hashtext(id_ticket)) : mises à jour d'un même ticket
+TICKET_LOCK_CLASS = 74_110_035
+
+UPSERT_PAIRS = text("""
+    INSERT INTO basket_pairs (ean_a, ean_b, tickets)
+    SELECT * FROM unnest(CAST(:a AS BIGINT[]), CAST(:b AS BIGINT[]), CAST(:n AS BIGINT[]))
+    ON CONFLICT (ean_a, ean_b) DO UPDATE SET tickets = basket_pairs.tickets + EXCLUDED.tickets
+""")
+PURGE_PAIRS = text("""
+    DELETE FROM basket_pairs p
+     USING unnest(CAST(:a AS BIGINT[]), CAST(:b AS BIGINT[])) AS k(ean_a, ean_b)
+     WHERE p.ean_a = k.ean_a AND p.ean_b = k.ean_b AND p.tickets <= 0
+""")
+UPSERT_ITEMS = text("""
+    INSERT INTO basket_items (ean, tickets)
+    SELECT * FROM unnest(CAST(:e AS BIGINT[]), CAST(:n AS BIGINT[]))
+    ON CONFLICT (ean) DO UPDATE SET tickets = basket_items.tickets + EXCLUDED.tickets
+""")
+PURGE_ITEMS = text("DELETE FROM basket_items WHERE ean = ANY(CAST(:e AS BIGINT[])) AND tickets <= 0")
+UPSERT_TICKETS = text("""
+    INSERT INTO basket_meta (cle, valeur) VALUES (:cle, :n)
+    ON CONFLICT (cle) DO UPDATE SET valeur = basket_meta.valeur + EXCLUDED.valeur
+""")
+# nombre de tickets : 'tickets' (reconstruction) + écarts des mises à jour répartis sur
+# TICKET_SHARDS lignes 'tickets.N', pour que les ventes concurrentes ne se sérialisent pas sur une ligne
+TICKET_SHARDS = 16
+N_TICKETS = text("SELECT SUM(valeur) FROM basket_meta WHERE cle = 'tickets' OR cle LIKE 'tickets.%'")
+
+
+def _dedupe(tickets: np.ndarray, items: np.ndarray):
+    """Trie par (ticket, item) et supprime les doublons (un produit compte une fois par ticket)."""
+    order = np.lexsort((items, tickets))
+    tickets, items = tickets[order], items[order]
+    keep = np.r_[True, (tickets[1:] != tickets[:-1]) | (items[1:] != items[:-1])]
+    return tickets[keep], items[keep]
+
+
+def _ticket_pairs(tickets: np.ndarray, items: np.ndarray) -> np.ndarray:
+    """
+    Clés de toutes les paires d'items au sein de chaque ticket.
+    `tickets` doit être trié et dédoublonné avec `items` (cf. `_dedupe`).
+    """
+    if len(tickets) < 2:
+        return np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, tickets[1:] != tickets[:-1]])
+    lengths = np.diff(np.r_[starts, len(tickets)])
+    pos = np.arange(len(tickets))
+    # nombre de partenaires situés après chaque ligne dans son ticket
+    partners = np.repeat(starts + lengths, lengths) - pos - 1
+    total = int(partners.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    left = np.repeat(pos, partners)
+    first_out = np.cumsum(partners) - partners
+    right = np.arange(total) - np.repeat(first_out, partners) + np.repeat(pos + 1, partners)
+    a, b = items[left].astype(np.int64), items[right].astype(np.int64)
+    return (np.minimum(a, b) << 32) | np.maximum(a, b)
+
+
+class _Counts:
+    """Comptes d'un ensemble de paniers, en mémoire (codes d'items denses)."""
+
+    def __init__(self):
+        self.eans = np.empty(0, dtype=np.int64)          # indice -> EAN
+        self._pos = {}                                    # EAN -> indice
+        self.item_tickets = np.zeros(0, dtype=np.int64)   # tickets contenant chaque item
+        self.n_tickets = 0
+        self.pair_keys = np.empty(0, dtype=np.int64)      # clés triées (a << 32) | b
+        self.pair_counts = np.empty(0, dtype=np.int64)
+
+    def _encode(self, eans) -> np.ndarray:
+        eans = np.asarray(eans, dtype=np.int64)
+        uniq, inverse = np.unique(eans, return_inverse=True)
+        new = [e for e in uniq.tolist() if e not in self._pos]
+        if new:
+            for e in new:
+                self._pos[e] = len(self._pos)
+            self.eans = np.concatenate([self.eans, np.asarray(new, dtype=np.int64)])
+            self.item_tickets = np.concatenate([self.item_tickets, np.zeros(len(new), dtype=np.int64)])
+        codes = np.fromiter((self._pos[e] for e in uniq.tolist()), dtype=np.int64, count=len(uniq))
+        return codes[inverse]
+
+    def add(self, tickets, eans, sign: int = 1):
+        """Ajoute (sign=1) ou retire (sign=-1) des paniers (id_ticket, ean), doublons compris."""
+        if len(tickets) == 0:
+            return
+        tickets, items = _dedupe(pd.factorize(pd.Series(tickets))[0], self._encode(eans))
+        self.n_tickets += sign * (int(np.count_nonzero(tickets[1:] != tickets[:-1])) + 1)
+        self.item_tickets += sign * np.bincount(items, minlength=len(self.item_tickets))
+        keys = _ticket_pairs(tickets, items)
+        if len(keys):
+            uniq, counts = np.unique(keys, return_counts=True)
+            self._merge(uniq, sign * counts)
+
+    def _merge(self, keys: np.ndarray, counts: np.ndarray):
+        """
+        Fusionne des clés triées et uniques dans l'index trié : recherche dichotomique des
+        seules nouvelles clés (O(k log P)) puis insertion par copie, sans re-trier les P
+        paires existantes. Les comptes peuvent devenir négatifs ou nuls (écarts).
+        """
+        pos = np.searchsorted(self.pair_keys, keys)
+        found = pos < len(self.pair_keys)
+        found[found] = self.pair_keys[pos[found]] == keys[found]
+        self.pair_counts[pos[found]] += counts[found]
+        new = ~found
+        if new.any():
+            self.pair_keys = np.insert(self.pair_keys, pos[new], keys[new])
+            self.pair_counts = np.insert(self.pair_counts, pos[new], counts[new])
+
+    def pairs(self):
+        """(ean_a, ean_b, tickets) des paires de compte non nul, ean_a < ean_b."""
+        keep = self.pair_counts != 0
+        a = self.eans[self.pair_keys[keep] >> 32]
+        b = self.eans[self.pair_keys[keep] & 0xFFFFFFFF]
+        return np.minimum(a, b), np.maximum(a, b), self.pair_counts[keep]
+
+    def items(self):
+        """(ean, tickets) des items de compte non nul."""
+        keep = self.item_tickets != 0
+        return self.eans[keep], self.item_tickets[keep]
+
+
+def _batches(*arrays):
+    for start in range(0, len(arrays[0]), WRITE_BATCH):
+        yield [a[start:start + WRITE_BATCH].tolist() for a in arrays]
+
+
+def _write(db, counts: _Counts, cle_tickets: str = "tickets"):
+    """
+    Ajoute des comptes (ou des écarts) aux tables de l'index, puis purge les lignes tombées à zéro.
+    Lignes écrites dans l'ordre des clés : deux transactions concurrentes ne s'interbloquent pas.
+    """
+    a, b, n = counts.pairs()
+    for ka, kb, kn in _batches(a, b, n):
+        db.execute(UPSERT_PAIRS, {"a": ka, "b": kb, "n": kn})
+        if min(kn) < 0:
+            db.execute(PURGE_PAIRS, {"a": ka, "b": kb})
+    e, n = counts.items()
+    for ke, kn in _batches(e, n):
+        db.execute(UPSERT_ITEMS, {"e": ke, "n": kn})
+        if min(kn) < 0:
+            db.execute(PURGE_ITEMS, {"e": ke})
+    if counts.n_tickets:
+        db.execute(UPSERT_TICKETS, {"cle": cle_tickets, "n": counts.n_tickets})
+
+
+class BasketIndex:
+    """Accès à l'index panier stocké en base ; sans état, partagé par tous les workers."""
+
+    @staticmethod
+    def _lock(db):
+        db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_KEY})
+
+    @staticmethod
+    def is_built(db) -> bool:
+        return db.execute(text("SELECT 1 FROM basket_meta WHERE cle = 'tickets'")).first() is not None
+
+    def reset(self, db):
+        """Vide l'index (il sera reconstruit au prochain appel de get_basket_index). Commit inclus."""
+        self._lock(db)
+        db.execute(text("TRUNCATE basket_pairs, basket_items, basket_meta"))
+        db.commit()
+
+    def build(self, db, if_missing: bool = False):
+        """
+        Reconstruction complète, par paquets de lignes triées par ticket, comptée en
+        mémoire puis écrite en une transaction (commit inclus). Avec `if_missing`, ne
+        fait rien si un autre processus a construit l'index pendant l'attente du verrou.
+        """
+        self._lock(db)
+        if if_missing and self.is_built(db):
+            db.commit()
+            return
+        counts = _Counts()
+        conn = db.connection().execution_options(stream_results=True)
+        sql = text("SELECT id_ticket, ean FROM faits_ventes WHERE id_ticket IS NOT NULL ORDER BY id_ticket")
+        carry = None
+        for chunk in pd.read_sql(sql, conn, chunksize=CHUNK_SIZE):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            # le dernier ticket peut se poursuivre dans le paquet suivant
+            last = chunk["id_ticket"].iat[-1]
+            tail = chunk["id_ticket"] == last
+            carry, chunk = chunk[tail], chunk[~tail]
+            counts.add(chunk["id_ticket"].to_numpy(), chunk["ean"].to_numpy())
+        if carry is not None:
+            counts.add(carry["id_ticket"].to_numpy(), carry["ean"].to_numpy())
+        db.execute(text("TRUNCATE basket_pairs, basket_items, basket_meta"))
+        _write(db, counts)
+        db.execute(text("INSERT INTO basket_meta (cle, valeur) VALUES ('tickets', :n) ON CONFLICT DO NOTHING"),
+                   {"n": counts.n_tickets})
+        db.commit()
+
+    def update_from_facts(self, db, facts):
+        """
+        Mise à jour incrémentale, à appeler dans la transaction qui insère les lignes
+        (après flush, avant commit) : les verrous (partagé global, un par ticket touché)
+        sont tenus jusqu'au commit de l'appelant.
+        `facts` : itérable de (id_ticket, ean). Pour chaque ticket touché on retire
+        l'ancien panier et on ajoute le nouveau ; les autres tickets ne sont pas relus.
+        """
+        facts = [(t, int(e)) for t, e in facts if t is not None and e is not None]
+        if not facts:
+            return
+        touched = sorted({t for t, _ in facts})
+        db.execute(text("SELECT pg_advisory_xact_lock_shared(:k)"), {"k": LOCK_KEY})
+        # tickets dans un ordre fixe : deux lots qui se recouvrent ne s'interbloquent pas
+        db.execute(text("""
+            SELECT pg_advisory_xact_lock(:c, h)
+            FROM (SELECT DISTINCT hashtext(t) AS h FROM unnest(CAST(:tickets AS TEXT[])) AS t ORDER BY 1) AS k
+        """), {"c": TICKET_LOCK_CLASS, "tickets": [str(t) for t in touched]})
+        if not self.is_built(db):
+            return  # index non construit : la construction complète inclura ces lignes
+        rows = db.execute(
+            text("SELECT id_ticket, ean FROM faits_ventes WHERE id_ticket = ANY(:tickets)"),
+            {"tickets": touched},
+        ).fetchall()
+        current = [(r.id_ticket, int(r.ean)) for r in rows]
+        old = Counter(current)
+        old.subtract(Counter(facts))
+        before = [k for k, n in old.items() if n > 0]
+
+        delta = _Counts()
+        for lines, sign in ((before, -1), (current, 1)):
+            if lines:
+                delta.add([t for t, _ in lines], [e for _, e in lines], sign=sign)
+        _write(db, delta, cle_tickets=f"tickets.{random.randrange(TICKET_SHARDS)}")
+
+    # ─── Requêtes ───────────────────────────────────────────────────────────────
+    def associations(self, db, ean: int, limit: int = 10, sort: str = "count", min_count: int = 1):
+        """Produits co-achetés avec `ean`, triés par nombre de tickets communs ou par lift."""
+        ean = int(ean)
+        n_tickets = db.execute(N_TICKETS).scalar()
+        tickets_ean = db.execute(text("SELECT tickets FROM basket_items WHERE ean = :ean"), {"ean": ean}).scalar()
+        if not n_tickets or not tickets_ean:
+            return None
+        rows = db.execute(text("""
+            SELECT p.autre, p.tickets, i.tickets
+              FROM (SELECT ean_b AS autre, tickets FROM basket_pairs WHERE ean_a = :ean AND tickets >= :min
+                    UNION ALL
+                    SELECT ean_a, tickets FROM basket_pairs WHERE ean_b = :ean AND tickets >= :min) p
+              JOIN basket_items i ON i.ean = p.autre
+        """), {"ean": ean, "min": min_count}).fetchall()
+        cols = np.array([r[0] for r in rows], dtype=np.int64)
+        cnt = np.array([r[1] for r in rows], dtype=np.int64)
+        item_tickets = np.array([r[2] for r in rows], dtype=np.int64)
+
+        support = cnt / n_tickets
+        confidence = cnt / tickets_ean
+        lift = confidence / (item_tickets / n_tickets)
+        score = lift if sort == "lift" else cnt
+        k = min(limit, len(cols))
+        top = np.argpartition(-score, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(-score[top], kind="stable")]
+
+        return {
+            "ean": ean,
+            "tickets_with_ean": int(tickets_ean),
+            "n_tickets": int(n_tickets),
+            "associations": [
+                {
+                    "ean": int(cols[j]),
+                    "count": int(cnt[j]),
+                    "support": round(float(support[j]), 6),
+                    "confidence": round(float(confidence[j]), 6),
+                    "lift": round(float(lift[j]), 4),
+                }
+                for j in top
+            ],
+        }
+
+    def stats(self, db) -> dict:
+        tickets = db.execute(N_TICKETS).scalar()
+        return {
+            "built": tickets is not None,
+            "products": db.execute(text("SELECT COUNT(*) FROM basket_items")).scalar(),
+            "tickets": int(tickets or 0),
+            "pairs": db.execute(text("SELECT COUNT(*) FROM basket_pairs")).scalar(),
+        }
+
+
+basket_index = BasketIndex()
+
+
+def get_basket_index(db) -> BasketIndex:
+    """
+    Index partagé, construit au premier appel (par un seul processus, les autres attendent
+    le verrou). `db` peut être une session de lecture : la construction lit toujours le primaire.
+    """
+    if not basket_index.is_built(db):
+        session = SessionLocal()  # jamais la réplique : elle peut être en retard
+        try:
+            basket_index.build(session, if_missing=True)
+        finally:
+            session.close()
+    return basket_index
@@ -0,0 +1,324 @@
+# backend/olap/shared.py
+"""
+Agrégats analytiques en lecture seule partagés entre les workers (mode gunicorn).
+
+- Un processus (le maître gunicorn au démarrage, puis celui qui vient de
+  terminer un ETL, /logs/apply ou /faits/faits/ventes) calcule les rollups journaliers et les écrit
+  en .npy dans une nouvelle génération de SHARED_AGGREGATES_DIR (/dev/shm par
+  défaut, donc en mémoire), avec un manifest.json.
+- Le lien symbolique `current` est basculé atomiquement vers la nouvelle
+  génération : un lecteur voit toujours une génération complète.
+- Chaque worker ouvre les tableaux avec np.load(mmap_mode="r") : les pages sont
+  celles du cache du noyau, partagées sans copie entre tous les workers. Le
+  changement de génération est détecté par un readlink à chaque accès.
+- Un compteur d'écritures (fichier `writes`, incrémenté par invalidate() sous
+  flock) est relevé avant la lecture de faits_ventes : un build dont la lecture a
+  pu précéder un invalidate n'est pas publié.
+- Les générations remplacées sont supprimées après SHARED_AGGREGATES_GRACE_SECONDS,
+  jamais celle qu'un autre processus est en train d'écrire.
+- Après un chargement, update_aggregates ne relit que les jours touchés et les fusionne
+  dans une copie de la génération courante ; les calculs sont sérialisés par flock, la
+  mise à jour suivante part donc toujours de la dernière génération publiée.
+
+Contenu d'une génération :
+  days.npy             id_date (YYYYMMDD) ayant au moins une vente, triés
+  revenue.npy          CA par jour
+  lines.npy            lignes de vente par jour
+  employes.npy         identifiants employés, triés
+  revenue_employe.npy  CA jour × employé (days × employes)
+  lines_employe.npy    lignes jour × employé
+"""
+import datetime
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from backend.database import SessionLocal
+
+SHARED_DIR = os.getenv(
+    "SHARED_AGGREGATES_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "olap_aggregates"),
+)
+CURRENT = "current"
+WRITES = "writes"
+BUILD_LOCK = ".build.lock"
+GRACE_SECONDS = float(os.getenv("SHARED_AGGREGATES_GRACE_SECONDS", "300"))
+ARRAYS = ["days", "revenue", "lines", "employes", "revenue_employe", "lines_employe"]
+
+DAILY_SQL = """
+    SELECT id_date, id_employe, COALESCE(SUM(montant), 0) AS revenue, COUNT(*) AS lines
+    FROM faits_ventes
+    GROUP BY id_date, id_employe
+"""
+DAILY_DAYS_SQL = """
+    SELECT id_date, id_employe, COALESCE(SUM(montant), 0) AS revenue, COUNT(*) AS lines
+    FROM faits_ventes
+    WHERE id_date = ANY(:days)
+    GROUP BY id_date, id_employe
+"""
+
+
+class Rollup:
+    """Vue sur une génération (tableaux mmap en lecture seule)."""
+
+    def __init__(self, path: str, manifest: dict):
+        self.path = path
+        self.manifest = manifest
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def mask(self, date_from=None, date_to=None, dates=None) -> np.ndarray:
+        """Masque des jours retenus (mêmes règles que analytics.DateFilter)."""
+        keep = np.ones(len(self.days), dtype=bool)
+        if date_from is not None:
+            keep &= self.days >= date_from
+        if date_to is not None:
+            keep &= self.days <= date_to
+        if dates:
+            keep &= np.isin(self.days, dates)
+        return keep
+
+    def by_day(self, date_from=None, date_to=None, dates=None):
+        """(days, revenue, lines) de la période."""
+        keep = self.mask(date_from, date_to, dates)
+        return self.days[keep], self.revenue[keep], self.lines[keep]
+
+    def by_month(self, date_from=None, date_to=None, dates=None):
+        """(annee_mois YYYYMM, revenue) de la période, triés."""
+        days, revenue, _ = self.by_day(date_from, date_to, dates)
+        months, inverse = np.unique(days // 100, return_inverse=True)
+        return months, np.bincount(inverse, weights=revenue, minlength=len(months))
+
+    def by_employee(self, date_from=None, date_to=None, dates=None):
+        """(employes, revenue) des employés ayant au moins une vente sur la période."""
+        keep = self.mask(date_from, date_to, dates)
+        revenue = self.revenue_employe[keep].sum(axis=0)
+        active = self.lines_employe[keep].sum(axis=0) > 0
+        return self.employes[active], revenue[active]
+
+
+@contextmanager
+def _writes_lock(directory: str):
+    """Verrou inter-processus sur le compteur d'écritures ; fournit sa valeur courante."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, WRITES), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            yield f, int(f.read() or 0)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_sequence(directory: str = SHARED_DIR) -> int:
+    with _writes_lock(directory) as (_, seq):
+        return seq
+
+
+@contextmanager
+def _build_lock(directory: str):
+    """Un seul calcul de rollups à la fois sur la machine (les mises à jour partent de `current`)."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, BUILD_LOCK), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_daily(session, sql: str, params: dict = None) -> pd.DataFrame:
+    own_session = session is None
+    session = session or SessionLocal()
+    try:
+        df = pd.read_sql(text(sql), session.connection(), params=params)
+    finally:
+        if own_session:
+            session.close()
+    return df.astype({"id_date": np.int32, "id_employe": str, "revenue": np.float64, "lines": np.int64})
+
+
+def _arrays(days, employes, revenue_employe, lines_employe) -> dict:
+    return {
+        "days": days,
+        "revenue": revenue_employe.sum(axis=1),
+        "lines": lines_employe.sum(axis=1, dtype=np.int64),
+        "employes": employes,
+        "revenue_employe": revenue_employe,
+        "lines_employe": lines_employe,
+    }
+
+
+def _matrices(df: pd.DataFrame) -> dict:
+    """Tableaux d'une génération à partir des lignes (id_date, id_employe, revenue, lines)."""
+    days, day_idx = np.unique(df["id_date"].to_numpy(), return_inverse=True)
+    employes, emp_idx = np.unique(df["id_employe"].to_numpy(dtype=str), return_inverse=True)
+    revenue_employe = np.zeros((len(days), len(employes)), dtype=np.float64)
+    lines_employe = np.zeros((len(days), len(employes)), dtype=np.int32)
+    np.add.at(revenue_employe, (day_idx, emp_idx), df["revenue"].to_numpy())
+    np.add.at(lines_employe, (day_idx, emp_idx), df["lines"].to_numpy())
+    return _arrays(days, employes, revenue_employe, lines_employe)
+
+
+def _merge_days(base: Rollup, fresh: dict, touched) -> dict:
+    """Génération `base` dont les jours `touched` sont remplacés par `fresh` (jours sans vente retirés)."""
+    keep = ~np.isin(base.days, touched)
+    employes = np.union1d(np.asarray(base.employes), fresh["employes"])
+    n_old = int(keep.sum())
+    days = np.concatenate([base.days[keep], fresh["days"]]).astype(np.int32)
+    revenue_employe = np.zeros((len(days), len(employes)), dtype=np.float64)
+    lines_employe = np.zeros((len(days), len(employes)), dtype=np.int32)
+    old_cols = np.searchsorted(employes, base.employes)
+    new_cols = np.searchsorted(employes, fresh["employes"])
+    revenue_employe[:n_old, old_cols] = base.revenue_employe[keep]
+    lines_employe[:n_old, old_cols] = base.lines_employe[keep]
+    revenue_employe[np.ix_(np.arange(n_old, len(days)), new_cols)] = fresh["revenue_employe"]
+    lines_employe[np.ix_(np.arange(n_old, len(days)), new_cols)] = fresh["lines_employe"]
+    order = np.argsort(days, kind="stable")
+    return _arrays(days[order], employes, revenue_employe[order], lines_employe[order])
+
+
+def _save(directory: str, arrays: dict, seq: int, **extra) -> dict:
+    """Écrit une génération et la publie si aucun invalidate n'est survenu depuis `seq`."""
+    generation = f"gen-{datetime.datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, generation)
+    os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array, allow_pickle=False)
+    manifest = {
+        "generation": generation,
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "pid": os.getpid(),
+        "days": int(len(arrays["days"])),
+        "employes": int(len(arrays["employes"])),
+        "lines": int(arrays["lines"].sum()),
+        "bytes": int(sum(a.nbytes for a in arrays.values())),
+        "write_sequence": seq,
+        **extra,
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    manifest["published"] = _publish(directory, generation, seq)
+    if not manifest["published"]:
+        shutil.rmtree(path, ignore_errors=True)
+        print(f"> [WARN] Rollups {generation} périmés (écriture pendant le calcul) : non publiés")
+    return manifest
+
+
+def build_aggregates(session=None, directory: str = SHARED_DIR) -> dict:
+    """
+    Calcule les rollups depuis faits_ventes et publie une nouvelle génération, sauf si
+    un invalidate est survenu depuis le début du calcul :
+    manifest["published"] vaut alors False et les lectures restent en SQL.
+    """
+    with _build_lock(directory):
+        seq = write_sequence(directory)
+        return _save(directory, _matrices(_read_daily(session, DAILY_SQL)), seq, mode="complet")
+
+
+def update_aggregates(session, days, directory: str = SHARED_DIR, rebuild_missing: bool = True) -> dict:
+    """
+    Après insertion de ventes (ETL, micro-lot, /logs/apply, /faits/faits/ventes) : relit les
+    seuls jours touchés et publie la génération courante mise à jour. Si aucune génération
+    n'est publiée (démarrage, invalidate) : reconstruction complète, ou rien avec
+    `rebuild_missing=False` (écriture unitaire). None si rien n'est publié.
+    """
+    days = sorted({int(d) for d in days})
+    if not days:
+        return None
+    with _build_lock(directory):
+        seq = write_sequence(directory)
+        base = SharedAggregates(directory).get()
+        if base is None:
+            if not rebuild_missing:
+                return None
+            return _save(directory, _matrices(_read_daily(session, DAILY_SQL)), seq, mode="complet")
+        fresh = _matrices(_read_daily(session, DAILY_DAYS_SQL, {"days": days}))
+        return _save(directory, _merge_days(base, fresh, days), seq, mode="jours", jours_maj=len(days))
+
+
+def _publish(directory: str, generation: str, seq: int) -> bool:
+    """
+    Bascule atomique de `current` si aucune écriture n'a eu lieu depuis `seq`, puis purge
+    des générations remplacées depuis plus de GRACE_SECONDS. Retourne True si publiée.
+    """
+    link = os.path.join(directory, CURRENT)
+    with _writes_lock(directory) as (_, current_seq):
+        if current_seq != seq:
+            return False
+        previous = os.readlink(link) if os.path.islink(link) else None
+        tmp = os.path.join(directory, f".{CURRENT}-{uuid.uuid4().hex}")
+        os.symlink(generation, tmp)
+        os.replace(tmp, link)
+    # les workers qui ont encore une ancienne génération mappée gardent leurs pages après suppression ;
+    # une génération récente peut être en cours d'écriture par un autre processus
+    limite = time.time() - GRACE_SECONDS
+    for name in os.listdir(directory):
+        if not name.startswith("gen-") or name in (generation, previous):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.stat(path).st_mtime < limite:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+    return True
+
+
+def invalidate(directory: str = SHARED_DIR):
+    """
+    Retire la génération courante (rollups périmés, non mis à jour) et incrémente le
+    compteur d'écritures : retour au SQL jusqu'au prochain build commencé après cet appel.
+    """
+    with _writes_lock(directory) as (f, seq):
+        f.seek(0)
+        f.truncate()
+        f.write(str(seq + 1))
+        f.flush()
+        try:
+            os.unlink(os.path.join(directory, CURRENT))
+        except FileNotFoundError:
+            pass
+
+
+class SharedAggregates:
+    """Accès par processus à la génération courante, rechargée quand `current` change."""
+
+    def __init__(self, directory: str = SHARED_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._generation = None
+        self._rollup = None
+
+    def get(self):
+        """Rollup courant, ou None si aucun n'est publié (les appelants passent alors par SQL)."""
+        try:
+            generation = os.readlink(os.path.join(self.directory, CURRENT))
+        except OSError:
+            return None
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    path = os.path.join(self.directory, generation)
+                    try:
+                        with open(os.path.join(path, "manifest.json")) as f:
+                            manifest = json.load(f)
+                        self._rollup = Rollup(path, manifest)
+                    except OSError:
+                        return None
+                    self._generation = generation
+        return self._rollup
+
+
+shared_aggregates = SharedAggregates()
@@ -0,0 +1,32 @@
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from backend.slow_queries import (SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN_SAMPLE, SLOW_QUERY_ROUTES,
+                                  recent_slow_queries, clear_slow_queries)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    # Si ADMIN_TOKEN est défini, l'en-tête X-Admin-Token doit le reprendre
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Jeton d'administration invalide")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/slow-queries", summary="Dernières requêtes SQL lentes capturées (avec plan EXPLAIN échantillonné)")
+def get_slow_queries(limit: int = 50):
+    return {
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain_sample": SLOW_QUERY_EXPLAIN_SAMPLE,
+        "routes": list(SLOW_QUERY_ROUTES),
+        "queries": recent_slow_queries(limit),
+    }
+
+
+@router.delete("/slow-queries", summary="Vide le tampon des requêtes lentes")
+def delete_slow_queries():
+    return {"cleared": clear_slow_queries()}
@@ -1,77 +1,151 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import text
+import os
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, text
 from sqlalchemy.orm import Session
-from backend.database import SessionLocal
+from backend.database import get_db, get_read_db
+from backend.etl.rfm import refresh_rfm
+from backend.models.dim import DimProduit
+from backend.models.rfm import ClientRFM
+from backend.olap import hll
+from backend.olap.basket import basket_index, get_basket_index
+from backend.olap.shared import build_aggregates, shared_aggregates
+from backend.serialization import ORJSONResponse, format_query, records_response, result_response
+
+router = APIRouter(prefix="/analytics", tags=["analytics"], default_response_class=ORJSONResponse)
+
+
+def to_id_date(raw: str) -> int:
+    """'2024-03-01' ou '20240301' -> 20240301 (clé entière de dim_date)."""
+    s = str(raw).strip().replace("-", "")
+    if len(s) != 8 or not s.isdigit():
+        raise HTTPException(status_code=400, detail=f"Date invalide : {raw!r} (YYYYMMDD ou YYYY-MM-DD)")
+    return int(s)
 
-router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+class DateFilter:
+    """
+    Filtre de dates commun aux endpoints analytics, traduit en prédicats entiers
+    sur faits_ventes.id_date (sargables : index et élagage de partitions utilisables).
+      - from / to : bornes incluses
+      - dates     : liste de dates précises (lot)
+    """
+
+    def __init__(
+            self,
+            date_from: str = Query(None, alias="from", description="Date de début incluse (YYYYMMDD ou YYYY-MM-DD)"),
+            date_to: str = Query(None, alias="to", description="Date de fin incluse (YYYYMMDD ou YYYY-MM-DD)"),
+            dates: List[str] = Query(None, description="Dates précises, paramètre répétable"),
+    ):
+        self.date_from = to_id_date(date_from) if date_from else None
+        self.date_to = to_id_date(date_to) if date_to else None
+        self.dates = sorted({to_id_date(d) for d in dates}) if dates else None
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    def where(self, column: str = "f.id_date"):
+        """Retourne (clause SQL, paramètres)."""
+        clauses, params = [], {}
+        if self.date_from is not None:
+            clauses.append(f"{column} >= :date_from")
+            params["date_from"] = self.date_from
+        if self.date_to is not None:
+            clauses.append(f"{column} <= :date_to")
+            params["date_to"] = self.date_to
+        if self.dates:
+            clauses.append(f"{column} = ANY(:dates)")
+            params["dates"] = self.dates
+        return (" AND ".join(clauses) or "TRUE"), params
 
 
 @router.get("/revenue_by_month")
-def revenue_by_month(db: Session = Depends(get_db)):
+def revenue_by_month(
+        period: DateFilter = Depends(),
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
+):
     """
     Calcule le CA par mois :
-      - on transforme id_date YYYYMMDD en 'YYYY-MM'
-      - on somme prix * quantité (ici quantité=1 si vous n’en avez pas)
+      - id_date / 100 donne annee_mois (YYYYMM) sans jointure, formaté 'YYYY-MM' en sortie
+      - on somme faits_ventes.montant (prix en vigueur à la vente * quantité)
+    Lu dans les rollups partagés (backend/olap/shared.py) quand ils sont publiés.
     """
-    sql = text("""
+    rollup = shared_aggregates.get()
+    if rollup is not None:
+        months, revenue = rollup.by_month(period.date_from, period.date_to, period.dates)
+        return records_response([
+            {"month": f"{m // 100}-{m % 100:02d}", "revenue": float(r)}
+            for m, r in zip(months.tolist(), revenue.tolist())
+        ], format)
+
+    where, params = period.where()
+    sql = text(f"""
         SELECT
-           to_char(to_date(d.id_date::text, 'YYYYMMDD'), 'YYYY-MM') AS month,
-           SUM(p.prix)                                          AS revenue
+           f.id_date / 100  AS annee_mois,
+           SUM(f.montant)   AS revenue
         FROM faits_ventes f
-        JOIN dim_date    d ON f.id_date    = d.id_date
-        JOIN dim_produit p ON f.ean        = p.ean
+        WHERE {where}
         GROUP BY 1
         ORDER BY 1
     """)
-    rows = db.execute(sql).fetchall()
-    return [
-        {"month": r["month"], "revenue": float(r["revenue"] or 0)}
+    rows = db.execute(sql, params).fetchall()
+    return records_response([
+        {"month": f"{r.annee_mois // 100}-{r.annee_mois % 100:02d}", "revenue": float(r.revenue or 0)}
         for r in rows
-    ]
+    ], format)
 
 
 @router.get("/monthly_revenue")
-def monthly_revenue(db: Session = Depends(get_db)):
+def monthly_revenue(
+        period: DateFilter = Depends(),
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
+):
     """
     Retourne le chiffre d'affaires par mois (année + mois).
     """
+    rollup = shared_aggregates.get()
+    if rollup is not None:
+        months, revenue = rollup.by_month(period.date_from, period.date_to, period.dates)
+        return records_response([
+            {"year": m // 100, "month": m % 100, "revenue": float(r)}
+            for m, r in zip(months.tolist(), revenue.tolist())
+        ], format)
+
+    where, params = period.where()
     query = text(
-        """
-        SELECT d.annee AS year,
-               d.mois  AS month,
-               SUM(p.prix) AS revenue
+        f"""
+        SELECT f.id_date / 10000         AS year,
+               f.id_date / 100 % 100     AS month,
+               SUM(f.montant)            AS revenue
         FROM faits_ventes f
-        JOIN dim_date d     ON f.id_date    = d.id_date
-        JOIN dim_produit p  ON f.ean        = p.ean
-        GROUP BY d.annee, d.mois
-        ORDER BY d.annee, d.mois;
+        WHERE {where}
+        GROUP BY 1, 2
+        ORDER BY 1, 2;
         """
     )
-    rows = db.execute(query).fetchall()
-    return [
-        {"year": r.year, "month": r.month, "revenue": float(r.revenue)}
+    rows = db.execute(query, params).fetchall()
+    return records_response([
+        {"year": r.year, "month": r.month, "revenue": float(r.revenue or 0)}
         for r in rows
-    ]
+    ], format)
 
 
 @router.get("/revenue_by_date/{id_date}")
-def revenue_by_date(id_date: int, db: Session = Depends(get_db)):
+def revenue_by_date(id_date: int, db: Session = Depends(get_read_db)):
     """
     Retourne le chiffre d'affaires total pour une date donnée (format YYYYMMDD).
     """
+    rollup = shared_aggregates.get()
+    if rollup is not None:
+        days, revenue, _ = rollup.by_day(dates=[id_date])
+        if not len(days):
+            raise HTTPException(status_code=404, detail=f"Aucune vente pour la date {id_date}")
+        return {"id_date": id_date, "revenue": float(revenue[0])}
+
     query = text(
         """
-        SELECT SUM(p.prix) AS revenue
+        SELECT SUM(f.montant) AS revenue
         FROM faits_ventes f
-        JOIN dim_produit p ON f.ean = p.ean
         WHERE f.id_date = :id_date;
         """
     )
@@ -81,64 +155,102 @@ def revenue_by_date(id_date: int, db: Session = Depends(get_db)):
     return {"id_date": id_date, "revenue": float(result)}
 
 
+@router.get("/revenue_by_dates")
+def revenue_by_dates(
+        period: DateFilter = Depends(),
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Version par lot de revenue_by_date : CA par jour pour une liste de dates
+    (?dates=20240301&dates=20240302) et/ou un intervalle from/to, en une seule requête.
+    """
+    if period.date_from is None and period.date_to is None and not period.dates:
+        raise HTTPException(status_code=400, detail="Préciser dates, from ou to")
+    rollup = shared_aggregates.get()
+    if rollup is not None:
+        days, revenue, _ = rollup.by_day(period.date_from, period.date_to, period.dates)
+        return records_response([
+            {"id_date": d, "revenue": float(r)} for d, r in zip(days.tolist(), revenue.tolist())
+        ], format)
+
+    where, params = period.where()
+    query = text(
+        f"""
+        SELECT f.id_date      AS id_date,
+               SUM(f.montant) AS revenue
+        FROM faits_ventes f
+        WHERE {where}
+        GROUP BY f.id_date
+        ORDER BY f.id_date;
+        """
+    )
+    rows = db.execute(query, params).fetchall()
+    return records_response([{"id_date": r.id_date, "revenue": float(r.revenue or 0)} for r in rows], format)
+
+
 @router.get("/top_clients")
-def top_clients(limit: int = 10, db: Session = Depends(get_db)):
+def top_clients(
+        limit: int = 10,
+        period: DateFilter = Depends(),
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
+):
     """
     Retourne le top N clients par chiffre d'affaires.
     """
+    where, params = period.where()
     query = text(
-        """
+        f"""
         SELECT f.id_client AS client,
                COUNT(*)       AS tickets,
-               SUM(p.prix)    AS revenue
+               SUM(f.montant) AS revenue
         FROM faits_ventes f
-        JOIN dim_produit p ON f.ean = p.ean
+        WHERE {where}
         GROUP BY f.id_client
         ORDER BY revenue DESC
         LIMIT :limit;
         """
     )
-    result = db.execute(query, {"limit": limit}).fetchall()
-    return [
-        {"client": row.client, "tickets": row.tickets, "revenue": float(row.revenue)}
+    result = db.execute(query, {**params, "limit": limit}).fetchall()
+    return records_response([
+        {"client": row.client, "tickets": row.tickets, "revenue": float(row.revenue or 0)}
         for row in result
-    ]
+    ], format)
 
 @router.get("/revenue_share_by_employee")
-def revenue_share_by_employee(db: Session = Depends(get_db)):
+def revenue_share_by_employee(period: DateFilter = Depends(), db: Session = Depends(get_read_db)):
     """
     Calcule la part de chiffre d'affaires encaissé par employé.
+    Le total est la somme des CA par employé : un seul parcours de faits_ventes
+    (ou des rollups partagés jour × employé quand ils sont publiés).
     """
-    # Chiffre d'affaires total
-    total_query = text(
-        "SELECT SUM(p.prix) AS total "
-        "FROM faits_ventes f "
-        "JOIN dim_produit p ON f.ean = p.ean"
-    )
-    total_result = db.execute(total_query).scalar()
-    if total_result is None:
+    rollup = shared_aggregates.get()
+    if rollup is not None:
+        employes, revenue = rollup.by_employee(period.date_from, period.date_to, period.dates)
+        rows = [(e, float(r)) for e, r in zip(employes.tolist(), revenue.tolist())]
+    else:
+        where, params = period.where()
+        emp_query = text(
+            f"""
+            SELECT f.id_employe   AS employee,
+                   SUM(f.montant) AS revenue
+            FROM faits_ventes f
+            WHERE {where}
+            GROUP BY f.id_employe;
+            """
+        )
+        rows = [(r.employee, float(r.revenue or 0)) for r in db.execute(emp_query, params).fetchall()]
+    total_revenue = float(sum(revenue for _, revenue in rows))
+    if not rows or not total_revenue:
         raise HTTPException(status_code=404, detail="Aucune donnée de ventes trouvée")
-    total_revenue = float(total_result)
-
-    # Chiffre d'affaires par employé
-    emp_query = text(
-        """
-        SELECT f.id_employe AS employee,
-               SUM(p.prix)    AS revenue
-        FROM faits_ventes f
-        JOIN dim_produit p ON f.ean = p.ean
-        GROUP BY f.id_employe;
-        """
-    )
-    rows = db.execute(emp_query).fetchall()
 
     # Construction du résultat avec part en pourcentage
     output = []
-    for row in rows:
-        emp_revenue = float(row.revenue)
+    for employee, emp_revenue in rows:
         share_pct = round((emp_revenue / total_revenue) * 100, 2)
         output.append({
-            "employe": row.employee,
+            "employe": employee,
             "revenue": emp_revenue,
             "share_pct": share_pct
         })
@@ -147,3 +259,127 @@ def revenue_share_by_employee(db: Session = Depends(get_db)):
         "by_employee": output
     }
 
+
+@router.get("/basket/associations")
+def basket_associations(
+        ean: int,
+        limit: int = Query(10, ge=1, le=500),
+        sort: str = Query("count", regex="^(count|lift)$", description="count : tickets communs ; lift"),
+        min_count: int = Query(1, ge=1, description="Nombre minimal de tickets communs"),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Produits les plus souvent achetés avec `ean` (même ticket), avec support,
+    confiance et lift, lus dans la matrice de co-occurrence (basket_pairs).
+    """
+    result = get_basket_index(db).associations(db, ean, limit=limit, sort=sort, min_count=min_count)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"EAN {ean} absent des tickets")
+    eans = [ean] + [a["ean"] for a in result["associations"]]
+    libelles = dict(db.query(DimProduit.ean, DimProduit.libelle).filter(DimProduit.ean.in_(eans)).all())
+    result["libelle"] = libelles.get(ean)
+    for a in result["associations"]:
+        a["libelle"] = libelles.get(a["ean"])
+    return result
+
+
+@router.post("/basket/rebuild")
+def basket_rebuild(db: Session = Depends(get_db)):
+    """Reconstruit entièrement la matrice de co-occurrence depuis faits_ventes."""
+    basket_index.build(db)
+    return basket_index.stats(db)
+
+
+@router.get("/rfm/{id_client}")
+def rfm_client(id_client: str, db: Session = Depends(get_read_db)):
+    """Scores RFM et segment d'un client (lecture par clé primaire dans client_rfm)."""
+    row = db.query(ClientRFM).filter(ClientRFM.id_client == id_client).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Pas de features RFM pour le client {id_client}")
+    return row
+
+
+@router.get("/rfm")
+def rfm_segment(
+        segment: str = Query(..., description="ex. Champions, À risque, À réactiver"),
+        limit: int = Query(100, ge=1, le=10000),
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
+):
+    """Clients d'un segment RFM, du plus gros montant au plus petit."""
+    stmt = select(ClientRFM.__table__).where(ClientRFM.segment == segment) \
+        .order_by(ClientRFM.montant.desc()).limit(limit)
+    return result_response(db.execute(stmt), format)
+
+
+@router.post("/rfm/refresh")
+def rfm_refresh(db: Session = Depends(get_db)):
+    """Recalcul complet de la table client_rfm (quintiles recalculés sur tous les clients)."""
+    summary = refresh_rfm(db)
+    db.commit()
+    return summary
+
+
+@router.get("/distinct_counts")
+def distinct_counts(
+        metric: str = Query("clients", regex="^(clients|tickets)$"),
+        by: str = Query("all", regex="^(all|employe|rayon)$", description="Dimension de ventilation"),
+        grain: str = Query("total", regex="^(total|month)$"),
+        approx: bool = Query(False, description="true : fusion des sketches HyperLogLog journaliers"),
+        period: DateFilter = Depends(),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Nombre de clients ou de tickets distincts sur la période, par employé / rayon.
+    approx=true lit hll_sketches au lieu de faire un COUNT(DISTINCT) sur faits_ventes :
+    erreur relative type ≈ 0,8 % (≈ 1,6 % dans 95 % des cas) par valeur retournée.
+    """
+    if approx:
+        counts = hll.distinct_counts(db, metric, by, period.date_from, period.date_to, period.dates, grain)
+        return {"approx": True, "relative_error": round(float(hll.RELATIVE_ERROR), 4), "counts": counts}
+
+    where, params = period.where()
+    column = hll.METRICS[metric]
+    valeur = {"all": "''", "employe": "f.id_employe", "rayon": "p.rayon"}[by]
+    join = "JOIN dim_produit p ON p.ean = f.ean" if by == "rayon" else ""
+    month = "f.id_date / 100" if grain == "month" else "NULL::int"
+    query = text(
+        f"""
+        SELECT {month} AS annee_mois,
+               {valeur} AS valeur,
+               COUNT(DISTINCT f.{column}) AS n
+        FROM faits_ventes f
+        {join}
+        WHERE {where}
+        GROUP BY 1, 2
+        ORDER BY 1, 2;
+        """
+    )
+    counts = []
+    for r in db.execute(query, params).fetchall():
+        item = {"valeur": r.valeur or None, "distinct": r.n}
+        if grain == "month":
+            item["month"] = f"{r.annee_mois // 100}-{r.annee_mois % 100:02d}"
+        counts.append(item)
+    return {"approx": False, "counts": counts}
+
+
+@router.post("/distinct_counts/rebuild")
+def distinct_counts_rebuild(db: Session = Depends(get_db)):
+    """Reconstruit tous les sketches HyperLogLog depuis faits_ventes."""
+    written = hll.rebuild_sketches(db)
+    db.commit()
+    return {"sketches": written}
+
+
+@router.post("/aggregates/rebuild")
+def aggregates_rebuild(db: Session = Depends(get_db)):
+    """Recalcule et publie les rollups partagés (CA et lignes par jour, par jour × employé)."""
+    return build_aggregates(db)
+
+
+@router.get("/aggregates")
+def aggregates_status():
+    """Manifest de la génération de rollups vue par ce worker (null : lecture SQL directe)."""
+    rollup = shared_aggregates.get()
+    return {"pid": os.getpid(), "manifest": rollup.manifest if rollup is not None else None}
@@ -1,9 +1,13 @@
 # backend/routers/etl.py
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from pathlib import Path
+from sqlalchemy import text
+from sqlalchemy.orm import Session
 
+from backend.database import get_read_db
 from backend.etl.load_olap import etl_from_excel
+from backend.etl.watcher import drop_watcher
 
 router = APIRouter(prefix="/etl", tags=["ETL"])
 
@@ -25,3 +29,80 @@ def run_etl(background_tasks: BackgroundTasks):
         "message": "ETL lancé avec le fichier par défaut",
         "file_used": str(EXCEL_PATH)
     }
+
+
+@router.get("/rejects", summary="Lignes rejetées par la validation des ETL, avec comptage par motif")
+def list_rejects(
+        run_id: str = Query(None, description="Identifiant de chargement (dernier chargement si absent)"),
+        source: str = Query(None, regex="^(olap|logs)$"),
+        reason: str = Query(None, description="Motif, ex. date_invalide, client_inconnu"),
+        limit: int = Query(100, ge=0, le=10000),
+        db: Session = Depends(get_read_db)
+):
+    clauses, params = [], {}
+    if source:
+        clauses.append("source = :source")
+        params["source"] = source
+    if run_id is None:
+        run_id = db.execute(text(
+            f"SELECT run_id FROM etl_rejects WHERE {' AND '.join(clauses) or 'TRUE'} "
+            "ORDER BY created_at DESC, reject_id DESC LIMIT 1"
+        ), params).scalar()
+        if run_id is None:
+            return {"run_id": None, "rejets": 0, "par_motif": [], "lignes": []}
+    clauses.append("run_id = :run_id")
+    params["run_id"] = run_id
+    where = " AND ".join(clauses)
+
+    par_motif = db.execute(text(f"""
+        SELECT source, sheet, reason, COUNT(*) AS nb
+        FROM etl_rejects
+        WHERE {where}
+        GROUP BY source, sheet, reason
+        ORDER BY nb DESC
+    """), params).fetchall()
+    if reason:
+        where += " AND reason = :reason"
+        params["reason"] = reason
+    lignes = db.execute(text(f"""
+        SELECT sheet, row_ref, reason, raw, created_at
+        FROM etl_rejects
+        WHERE {where}
+        ORDER BY reject_id
+        LIMIT :limit
+    """), {**params, "limit": limit}).fetchall()
+    return {
+        "run_id": run_id,
+        "rejets": sum(r.nb for r in par_motif),
+        "par_motif": par_motif,
+        "lignes": lignes,
+    }
+
+
+@router.get("/files", summary="Fichiers du répertoire de dépôt traités par le watcher")
+def list_files(
+        status: str = Query(None, regex="^(ok|erreur)$"),
+        kind: str = Query(None, regex="^(ventes|logs)$"),
+        limit: int = Query(100, ge=0, le=10000),
+        db: Session = Depends(get_read_db)
+):
+    clauses, params = [], {"limit": limit}
+    if status:
+        clauses.append("status = :status")
+        params["status"] = status
+    if kind:
+        clauses.append("kind = :kind")
+        params["kind"] = kind
+    fichiers = db.execute(text(f"""
+        SELECT file_id, kind, path, size, status, run_id, summary, error, processed_at
+        FROM etl_files
+        WHERE {' AND '.join(clauses) or 'TRUE'}
+        ORDER BY processed_at DESC, file_id DESC
+        LIMIT :limit
+    """), params).fetchall()
+    return {
+        "drop_dir": str(drop_watcher.root) if drop_watcher.root else None,
+        "actif": drop_watcher.running,
+        "dernier_passage": drop_watcher.last_poll,
+        "fichiers": fichiers,
+    }
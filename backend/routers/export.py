@@ -0,0 +1,222 @@
+import queue
+import threading
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from backend.database import get_read_engine
+from backend.routers.analytics import DateFilter
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+# Colonnes exportables (hash_mdp n'est jamais exporté)
+DIMENSIONS = {
+    "date": ("dim_date", ["id_date", "jour", "mois", "annee", "jour_semaine", "mois_nom", "annee_mois", "trimestre"]),
+    "client": ("dim_client", ["id_client", "date_inscription"]),
+    "employe": ("dim_employe", ["id_employe", "employe", "prenom", "nom", "date_debut", "mail"]),
+    "produit": ("dim_produit", ["ean", "category", "rayon", "libelle", "prix"]),
+}
+FAITS_COLUMNS = ["id_fait", "id_date", "id_client", "id_employe", "ean", "id_ticket", "quantite", "montant"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXTENSIONS = {"csv": "csv", "arrow": "arrows", "parquet": "parquet"}
+BATCH_ROWS = 50_000
+
+
+# ─── CSV : COPY ... TO STDOUT, relayé par une file bornée ────────────────────────
+class _QueueWriter:
+    """Objet fichier passé à copy_expert : chaque écriture part dans la file (mémoire bornée)."""
+
+    def __init__(self, q: queue.Queue, cancelled: threading.Event):
+        self.q = q
+        self.cancelled = cancelled
+
+    def write(self, data):
+        while True:
+            if self.cancelled.is_set():
+                raise IOError("export interrompu par le client")
+            try:
+                self.q.put(data.encode() if isinstance(data, str) else bytes(data), timeout=1)
+                return len(data)
+            except queue.Full:
+                continue
+
+
+def _stream_copy(bind, sql: str, params: dict):
+    q = queue.Queue(maxsize=64)
+    cancelled = threading.Event()
+    done = object()
+
+    def worker():
+        conn = bind.raw_connection()
+        try:
+            cur = conn.cursor()
+            query = cur.mogrify(sql, params).decode()
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", _QueueWriter(q, cancelled))
+            conn.rollback()
+        except Exception as e:
+            if not cancelled.is_set():
+                q.put(e)
+        finally:
+            conn.close()
+            q.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+
+
+# ─── Arrow IPC / Parquet : curseur côté serveur, un RecordBatch par paquet ───────
+class _ChunkSink:
+    """Sortie en écriture seule dont on vide les octets produits après chaque paquet."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _arrow_type(pa, type_code):
+    # OID PostgreSQL -> type Arrow ; NUMERIC est converti en float par le curseur
+    return {
+        16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(), 1700: pa.float64(),
+        1082: pa.date32(), 1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+    }.get(type_code, pa.string())
+
+
+def _stream_arrow(bind, sql: str, params: dict, fmt: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise HTTPException(status_code=501, detail="pyarrow n'est pas installé : utiliser format=csv")
+    from psycopg2 import extensions
+
+    def generate():
+        conn = bind.raw_connection()
+        try:
+            dbapi_conn = conn.connection if hasattr(conn, "connection") else conn
+            cur = dbapi_conn.cursor(name=f"export_{uuid.uuid4().hex}")
+            # NUMERIC lu directement en float, pour ce curseur seulement
+            as_float = extensions.new_type(extensions.DECIMAL.values, "EXPORT_DEC2FLOAT",
+                                           lambda v, c: float(v) if v is not None else None)
+            extensions.register_type(as_float, cur)
+            cur.itersize = BATCH_ROWS
+            cur.execute(sql, params)
+
+            sink, writer, schema = _ChunkSink(), None, None
+            while True:
+                rows = cur.fetchmany(BATCH_ROWS)
+                if schema is None:
+                    schema = pa.schema([(d.name, _arrow_type(pa, d.type_code)) for d in cur.description])
+                    out = pa.PythonFile(sink, mode="w")
+                    writer = pq.ParquetWriter(out, schema, compression="zstd") if fmt == "parquet" \
+                        else pa.ipc.new_stream(out, schema)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                arrays = [
+                    pa.array(col if field.type != pa.string() else [None if v is None else str(v) for v in col],
+                             type=field.type)
+                    for col, field in zip(columns, schema)
+                ]
+                if fmt == "parquet":
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                else:
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                yield sink.drain()
+            writer.close()
+            yield sink.drain()
+            cur.close()
+            conn.rollback()
+        finally:
+            conn.close()
+
+    return generate()
+
+
+def _response(bind, sql: str, params: dict, fmt: str, filename: str):
+    """`bind` : moteur choisi par get_read_engine (réplique, ou primaire si elle est indisponible ou en retard)."""
+    body = _stream_copy(bind, sql, params) if fmt == "csv" else _stream_arrow(bind, sql, params, fmt)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{EXTENSIONS[fmt]}"'},
+    )
+
+
+@router.get("/faits", summary="Export en flux de faits_ventes (CSV, Arrow IPC ou Parquet)")
+def export_faits(
+        format: str = Query("csv", regex="^(csv|arrow|parquet)$"),
+        rayon: str = Query(None),
+        id_employe: str = Query(None),
+        period: DateFilter = Depends(),
+        bind=Depends(get_read_engine),
+):
+    """
+    Tranche de faits_ventes filtrée par période (from / to / dates), rayon et employé,
+    écrite par paquets : mémoire constante quel que soit le volume exporté.
+    """
+    clauses, params = [], {}
+    if period.date_from is not None:
+        clauses.append("f.id_date >= %(date_from)s")
+        params["date_from"] = period.date_from
+    if period.date_to is not None:
+        clauses.append("f.id_date <= %(date_to)s")
+        params["date_to"] = period.date_to
+    if period.dates:
+        clauses.append("f.id_date = ANY(%(dates)s)")
+        params["dates"] = period.dates
+    if rayon:
+        clauses.append("f.ean IN (SELECT ean FROM dim_produit WHERE rayon = %(rayon)s)")
+        params["rayon"] = rayon
+    if id_employe:
+        clauses.append("f.id_employe = %(id_employe)s")
+        params["id_employe"] = id_employe
+
+    sql = (
+        f"SELECT {', '.join('f.' + c for c in FAITS_COLUMNS)} FROM faits_ventes f "
+        f"WHERE {' AND '.join(clauses) or 'TRUE'}"
+    )
+    return _response(bind, sql, params, format, "faits_ventes")
+
+
+@router.get("/dim/{name}", summary="Export en flux d'une dimension (date, client, employe, produit)")
+def export_dim(name: str, format: str = Query("csv", regex="^(csv|arrow|parquet)$"),
+               bind=Depends(get_read_engine)):
+    if name not in DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Dimension inconnue : {name} ({', '.join(DIMENSIONS)})")
+    table, columns = DIMENSIONS[name]
+    return _response(bind, f"SELECT {', '.join(columns)} FROM {table}", {}, format, table)
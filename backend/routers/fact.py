@@ -1,7 +1,13 @@
+import pandas as pd
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from backend.database import get_db
+from backend.etl.load_olap import montant_vente
+from backend.models.dim import DimProduit
 from backend.models.fact import FaitsVentes
+from backend.olap.basket import basket_index
+from backend.olap.hll import update_sketches
+from backend.olap.shared import invalidate, update_aggregates
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/faits", tags=["Faits"])
@@ -10,10 +16,29 @@ router = APIRouter(prefix="/faits", tags=["Faits"])
 class FaitIn(BaseModel):
     id_fait: str; id_date: int; id_client: str; id_employe: str; ean: int
     id_ticket: str = None
+    quantite: int = 1
+    montant: float = None  # calculé depuis dim_produit.prix si absent
 
 
 @router.post("/ventes", response_model=FaitIn)
 def create_fait(fait: FaitIn, db: Session = Depends(get_db)):
-    obj = FaitsVentes(**fait.dict())
-    db.add(obj); db.commit(); db.refresh(obj)
+    data = fait.dict()
+    if data["montant"] is None:
+        prix = db.query(DimProduit.prix).filter(DimProduit.ean == fait.ean).scalar()
+        data["montant"] = montant_vente(prix, fait.quantite)
+    obj = FaitsVentes(**data)
+    db.add(obj); db.flush()
+    # index dérivés dans la même transaction que la vente
+    basket_index.update_from_facts(db, [(obj.id_ticket, obj.ean)])
+    update_sketches(db, pd.DataFrame([{
+        "id_date": obj.id_date, "id_client": obj.id_client, "id_ticket": obj.id_ticket,
+        "id_employe": obj.id_employe, "ean": obj.ean,
+    }]))
+    db.commit(); db.refresh(obj)
+    # rollups partagés : seul le jour de la vente est recalculé (pas de reconstruction complète ici)
+    try:
+        update_aggregates(db, [obj.id_date], rebuild_missing=False)
+    except Exception as e:
+        print(f"> [WARN] Rollups partagés non mis à jour, retirés : {e}")
+        invalidate()
     return obj
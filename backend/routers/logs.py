@@ -2,19 +2,19 @@ from datetime import datetime, timedelta
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func, desc, text
+from sqlalchemy import func, desc, select, text
 from sqlalchemy.orm import Session
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models.logs import Log
 import os
-from backend.models.dim import DimProduit, DimClient
-import datetime
-from itertools import groupby
+from backend.etl.apply_logs import apply_pending_logs
+from backend.etl.load_logs import load_logs_from_excel, rebuild_log_stats
+from backend.etl.retention import (COLUMNS as ARCHIVE_COLUMNS, RETENTION_DAYS, archive_logs, archived_until,
+                                   load_manifest, read_archive)
+from backend.serialization import ORJSONResponse, format_query, result_response, tabular
 
-from backend.etl.load_logs import load_logs_from_excel
-from backend.models.fact import FaitsVentes
-
-router = APIRouter(prefix="/logs", tags=["logs"])
+router = APIRouter(prefix="/logs", tags=["logs"], default_response_class=ORJSONResponse)
+PAR_PLAGE_LIMIT = 1000
 
 
 @router.post("/load", summary="Charge et nettoie data/logs.xlsx dans la table logs")
@@ -25,47 +25,75 @@ def load_logs_from_file(db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail=f"Fichier introuvable: {file_path}")
 
     try:
-        load_logs_from_excel(file_path)
+        summary = load_logs_from_excel(file_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur ETL logs: {e}")
 
     return {
         "status": "success",
-        "message": f"Le fichier {file_path} a bien été chargé (colonnes inchangées)."
+        "message": f"Le fichier {file_path} a bien été chargé (colonnes inchangées).",
+        "inseres": summary["inseres"],
+        "rejets": summary["rejets"],
+        "run_id": summary["run_id"],
+        "par_feuille": summary["par_feuille"],
     }
 
 
+# Projection Core des colonnes de logs : tuples, sans instanciation d'objets Log
+LOG_COLUMNS = select(Log.__table__)
+
+
 @router.get("/")
-def read_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Log).order_by(Log.event_time.desc()).offset(skip).limit(limit).all()
+def read_logs(skip: int = 0, limit: int = 100, format: str = format_query(), db: Session = Depends(get_read_db)):
+    stmt = LOG_COLUMNS.order_by(Log.event_time.desc()).offset(skip).limit(limit)
+    return result_response(db.execute(stmt), format)
 
 
 @router.get("/by-table/{table_name}")
-def read_logs_by_table(table_name: str, db: Session = Depends(get_db)):
-    return db.query(Log).filter(Log.target_table == table_name).all()
+def read_logs_by_table(table_name: str, format: str = format_query(), db: Session = Depends(get_read_db)):
+    return result_response(db.execute(LOG_COLUMNS.where(Log.target_table == table_name)), format)
 
 
 @router.get("/par‐plage", summary="Retourne les logs entre deux dates")
 def get_logs_par_plage(
         date_debut: str = Query(..., description="Date de début au format YYYY‐MM‐DD"),
         date_fin: str = Query(..., description="Date de fin au format YYYY‐MM‐DD"),
-        db: Session = Depends(get_db)
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
 ):
-    sql = """
-      SELECT *
+    """
+    Table logs (fenêtre chaude), complétée par les archives Parquet quand la plage
+    commence avant la fin du dernier mois archivé (cf. backend/etl/retention.py).
+    """
+    sql = f"""
+      SELECT {', '.join(ARCHIVE_COLUMNS)}
       FROM logs
       WHERE event_time >= :debut
         AND event_time <  :fin
       ORDER BY event_time DESC
-      LIMIT 1000;
+      LIMIT {PAR_PLAGE_LIMIT};
     """
-    return db.execute(text(sql), {"debut": date_debut, "fin": date_fin}).fetchall()
+    rows = [tuple(r) for r in db.execute(text(sql), {"debut": date_debut, "fin": date_fin}).fetchall()]
+    fenetre_chaude = archived_until()
+    if fenetre_chaude is not None:
+        try:
+            debut, fin = datetime.fromisoformat(date_debut), datetime.fromisoformat(date_fin)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates attendues au format YYYY‐MM‐DD")
+        if debut < fenetre_chaude:
+            try:
+                archives = read_archive(debut, fin, limit=PAR_PLAGE_LIMIT)
+            except ImportError:
+                raise HTTPException(status_code=501, detail="pyarrow n'est pas installé : archives illisibles")
+            rows = sorted(rows + archives, key=lambda r: r[2], reverse=True)[:PAR_PLAGE_LIMIT]
+    return tabular(ARCHIVE_COLUMNS, rows, format)
 
 
 @router.get("/prix‐produits", summary="Liste des changements de prix sur Produits")
 def get_logs_prix_produits(
         date_debut: str = Query(..., description="Date début (YYYY‐MM‐DD)"),
-        db: Session = Depends(get_db)
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
 ):
     sql = """
       SELECT
@@ -79,129 +107,136 @@ def get_logs_prix_produits(
         AND l.event_time >= :debut
       ORDER BY l.event_time DESC;
     """
-    return db.execute(text(sql), {"debut": date_debut}).fetchall()
+    return result_response(db.execute(text(sql), {"debut": date_debut}), format)
 
 
 @router.get("/stat‐clients‐par‐user", summary="Nombre de modifications Client par utilisateur")
-def stats_modifs_clients(db: Session = Depends(get_db)):
+def stats_modifs_clients(format: str = format_query(), db: Session = Depends(get_read_db)):
     sql = """
       SELECT
-        l.id_user,
-        COUNT(*) AS nb_modifs_clients
-      FROM logs AS l
-      WHERE l.target_table = 'Client'
-      GROUP BY l.id_user
+        s.id_user,
+        SUM(s.nb)::bigint AS nb_modifs_clients
+      FROM logs_stats_jour AS s
+      WHERE s.target_table = 'Client'
+      GROUP BY s.id_user
       ORDER BY nb_modifs_clients DESC
       LIMIT 20;
     """
-    return db.execute(text(sql)).fetchall()
+    return result_response(db.execute(text(sql)), format)
+
+
+# Axes de ventilation de /logs/stats -> expression SQL sur logs_stats_jour
+STATS_AXES = {
+    "jour": "s.jour",
+    "mois": "to_char(s.jour, 'YYYY-MM')",
+    "id_user": "s.id_user",
+    "target_table": "s.target_table",
+    "operation": "s.operation",
+}
+
+
+@router.get("/stats", summary="Nombre de modifications ventilé par jour, mois, utilisateur, table, opération")
+def logs_stats(
+        by: List[str] = Query(["id_user"], description=f"Axes de ventilation, répétable : {', '.join(STATS_AXES)}"),
+        date_debut: str = Query(None, description="Date début incluse (YYYY‐MM‐DD)"),
+        date_fin: str = Query(None, description="Date fin exclue (YYYY‐MM‐DD)"),
+        id_user: str = Query(None),
+        target_table: str = Query(None),
+        operation: str = Query(None),
+        limit: int = Query(1000, ge=1, le=100000),
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Lu dans les compteurs logs_stats_jour (maintenus à l'ingestion des logs) :
+    coût proportionnel au nombre de jours × utilisateurs × tables, pas à la taille de logs.
+    """
+    unknown = [b for b in by if b not in STATS_AXES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Axes inconnus : {unknown} ({', '.join(STATS_AXES)})")
+    axes = list(dict.fromkeys(by))
+
+    clauses, params = [], {}
+    for name, value, op in [("date_debut", date_debut, ">="), ("date_fin", date_fin, "<")]:
+        if value:
+            clauses.append(f"s.jour {op} :{name}")
+            params[name] = value
+    for name, value in [("id_user", id_user), ("target_table", target_table), ("operation", operation)]:
+        if value:
+            clauses.append(f"s.{name} = :{name}")
+            params[name] = value
+
+    select = ", ".join(f"{STATS_AXES[a]} AS {a}" for a in axes)
+    group = ", ".join(str(i) for i in range(1, len(axes) + 1))
+    sql = f"""
+      SELECT {select}, SUM(s.nb)::bigint AS nb
+      FROM logs_stats_jour AS s
+      WHERE {" AND ".join(clauses) or "TRUE"}
+      GROUP BY {group}
+      ORDER BY nb DESC, {group}
+      LIMIT :limit;
+    """
+    return result_response(db.execute(text(sql), {**params, "limit": limit}), format)
+
+
+@router.post("/stats/rebuild", summary="Recalcule logs_stats_jour depuis la table logs")
+def logs_stats_rebuild(db: Session = Depends(get_db)):
+    # les jours archivés ne sont plus dans logs : leurs compteurs sont conservés
+    rebuild_log_stats(db, depuis=archived_until())
+    db.commit()
+    return {"lignes": db.execute(text("SELECT COUNT(*) FROM logs_stats_jour")).scalar()}
 
 
-@router.get("/corrections‐ventes", summary="Logs sur la table Ventes (fait_ventes)")
+@router.get("/corrections‐ventes", summary="Changements sur la table Ventes (une ligne par vente, champs en JSON)")
 def get_logs_ventes(
         date_debut: str = Query(..., description="Date début (YYYY‐MM‐DD)"),
-        db: Session = Depends(get_db)
+        format: str = format_query(),
+        db: Session = Depends(get_read_db)
 ):
+    # les champs d'une vente journalisés à des instants différents sont fusionnés, comme dans
+    # apply_logs (le plus récent l'emporte) ; applied_at reste NULL tant qu'un fragment est en attente
     sql = """
       SELECT
-        l.event_time,
-        l.id_user,
-        l.operation,
-        l.target_id   AS id_fait,
-        l.field_name,
-        l.detail 
-      FROM logs AS l
-      WHERE l.target_table = 'Ventes'
-        AND l.event_time >= :debut
-      ORDER BY l.event_time DESC;
+        MAX(c.event_time)                                   AS event_time,
+        string_agg(DISTINCT c.id_user, ',')                 AS id_user,
+        string_agg(DISTINCT c.operation, ',')               AS operation,
+        c.target_id                                         AS id_fait,
+        COALESCE(jsonb_object_agg(f.key, f.value ORDER BY c.event_time, c.change_id)
+                   FILTER (WHERE f.key IS NOT NULL), '{}')  AS champs,
+        CASE WHEN bool_and(c.applied_at IS NOT NULL) THEN MAX(c.applied_at) END AS applied_at
+      FROM logs_changes AS c
+      LEFT JOIN LATERAL jsonb_each(c.champs) AS f ON TRUE
+      WHERE c.target_table = 'Ventes'
+        AND c.target_id IN (SELECT target_id FROM logs_changes
+                            WHERE target_table = 'Ventes' AND event_time >= :debut)
+      GROUP BY c.target_id
+      ORDER BY MAX(c.event_time) DESC;
     """
-    return db.execute(text(sql), {"debut": date_debut}).fetchall()
+    return result_response(db.execute(text(sql), {"debut": date_debut}), format)
 
 
 @router.post("/apply", summary="Applique les logs sur Ventes, Produits et Clients")
 def apply_logs(db: Session = Depends(get_db)):
-    # Récupérer les logs d'insertion Ventes, mise à jour Produits.prix et insertion Clients
-    logs = db.query(Log).filter(
-        ((Log.target_table == 'Ventes') & (Log.operation == 'INSERT')) |
-        ((Log.target_table == 'Produits') & (Log.operation == 'UPDATE') & (Log.field_name == 'prix')) |
-        ((Log.target_table == 'Client')  & (Log.operation == 'INSERT'))
-    ).order_by(Log.target_table, Log.target_id, Log.field_name).all()
-
-    if not logs:
+    """Applique les changements de logs_changes pas encore appliqués (applied_at IS NULL)."""
+    result = apply_pending_logs(db)
+    if not result["changes"]:
         raise HTTPException(404, "Aucun log à appliquer")
+    return result
 
-    inserted_sales = 0
-    updated_products = 0
-    inserted_clients = 0
 
-    # INSERT Ventes
-    ventes = [lg for lg in logs if lg.target_table == 'Ventes' and lg.operation == 'INSERT']
-    for id_fait, group in groupby(ventes, key=lambda lg: lg.target_id):
-        m = { log.field_name.lower().strip(): log.detail for log in group }
-        try:
-            # reconstituer chaque vente
-            cid = m['customer_id']
-            eid = m['id_employe']
-            ean = int(m['ean'])
-            rawd = m['date']
-            if str(rawd).isdigit():
-                dt = datetime.datetime(1899,12,30) + datetime.timedelta(days=int(rawd))
-            else:
-                dt = datetime.datetime.fromisoformat(rawd)
-            id_date = int(dt.strftime("%Y%m%d"))
-            ticket = m.get('id ticket') or m.get('id_ticket')
-        except Exception:
-            continue
-        db.add(FaitsVentes(
-            id_fait=id_fait,
-            id_date=id_date,
-            id_client=cid,
-            id_employe=eid,
-            ean=ean,
-            id_ticket=ticket
-        ))
-        inserted_sales += 1
-
-    # UPDATE Produits.prix
-    prods = [lg for lg in logs if lg.target_table == 'Produits' and lg.operation == 'UPDATE' and lg.field_name == 'prix']
-    for lg in prods:
-        try:
-            new_price = float(lg.detail)
-            ean = int(lg.target_id)
-        except Exception:
-            continue
-        res = db.query(DimProduit).filter(DimProduit.ean == ean).update(
-            {DimProduit.prix: new_price}, synchronize_session=False
-        )
-        if res:
-            updated_products += 1
-
-    # INSERT Clients
-    clients = [lg for lg in logs if lg.target_table == 'Client' and lg.operation == 'INSERT']
-    for lg in clients:
-        cid = lg.target_id
-        raw = lg.detail
-        try:
-            # detail est ISO string ou timestamp
-            if isinstance(raw, str) and raw:
-                dt = datetime.datetime.fromisoformat(raw)
-            else:
-                dt = raw  # assume datetime
-            signup = int(dt.strftime("%Y%m%d"))
-        except Exception:
-            signup = None
-
-        # Vérifier si le client existe déjà
-        existing_client = db.query(DimClient).filter(DimClient.id_client == cid).first()
-        if not existing_client:  # Si le client n'existe pas, on l'insère
-            db.add(DimClient(id_client=cid, date_inscription=signup))
-            inserted_clients += 1
-
-    # Commit
-    db.commit()
+@router.get("/archive", summary="Manifest des mois de logs archivés en Parquet")
+def get_logs_archive():
+    manifest = load_manifest()
+    fenetre_chaude = archived_until()
+    return {**manifest, "fenetre_chaude": fenetre_chaude.isoformat() if fenetre_chaude else None}
 
-    return {
-        "inserted_sales": inserted_sales,
-        "updated_products": updated_products,
-        "inserted_clients": inserted_clients
-    }
+
+@router.post("/archive", summary="Archive les mois de logs anciens et entièrement appliqués")
+def post_logs_archive(
+        days: int = Query(None, ge=0, description="Âge minimal en jours (défaut : LOGS_RETENTION_DAYS)"),
+        dry_run: bool = False
+):
+    try:
+        return archive_logs(RETENTION_DAYS if days is None else days, dry_run=dry_run)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="pyarrow n'est pas installé : archivage impossible")
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from backend.metrics import metrics_response
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", summary="Métriques au format texte Prometheus")
+def metrics():
+    return metrics_response()
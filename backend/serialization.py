@@ -0,0 +1,65 @@
+# backend/serialization.py
+"""
+Sérialisation rapide des grands résultats.
+
+- ORJSONResponse : rendu par orjson (Decimal -> float, dates ISO, tableaux NumPy).
+- Les routes renvoient directement une réponse construite à partir de tuples
+  (projections Core, Row SQL) : FastAPI ne repasse pas chaque attribut dans
+  jsonable_encoder.
+- format=columns : {"columns": [...], "data": {col: [...]}} au lieu d'une liste
+  d'objets, plus compact et directement chargeable en DataFrame.
+"""
+import decimal
+
+import orjson
+from fastapi import Query
+from fastapi.responses import JSONResponse
+
+FORMATS = "^(rows|columns)$"
+
+
+def _default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if hasattr(obj, "_asdict"):  # Row SQLAlchemy, namedtuple
+        return obj._asdict()
+    if hasattr(obj, "tolist"):   # scalaires NumPy hors OPT_SERIALIZE_NUMPY
+        return obj.tolist()
+    raise TypeError(f"Type non sérialisable : {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def format_query(default: str = "rows"):
+    return Query(default, regex=FORMATS, description="rows : liste d'objets ; columns : {columns, data: {col: [...]}}")
+
+
+def tabular(columns, rows, fmt: str = "rows") -> ORJSONResponse:
+    """Réponse à partir de noms de colonnes et de tuples (rows ou columns)."""
+    columns = list(columns)
+    if fmt == "columns":
+        data = list(zip(*rows)) if rows else [()] * len(columns)
+        return ORJSONResponse({"columns": columns, "data": {c: list(v) for c, v in zip(columns, data)}})
+    return ORJSONResponse([dict(zip(columns, row)) for row in rows])
+
+
+def result_response(result, fmt: str = "rows") -> ORJSONResponse:
+    """Réponse à partir d'un résultat SQL (db.execute(...)) : clés et tuples, sans ORM."""
+    return tabular(result.keys(), [tuple(row) for row in result.fetchall()], fmt)
+
+
+def records_response(records: list, fmt: str = "rows") -> ORJSONResponse:
+    """Réponse à partir d'une liste de dicts déjà construits (endpoints analytics)."""
+    if fmt == "columns":
+        columns = list(records[0]) if records else []
+        return tabular(columns, [tuple(r[c] for c in columns) for r in records], fmt)
+    return ORJSONResponse(records)
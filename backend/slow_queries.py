@@ -0,0 +1,132 @@
+# backend/slow_queries.py
+
+import datetime
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+
+from backend.metrics import current_request, pop_start, push_start
+
+# Seuil (ms) au-delà duquel une requête est capturée
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+# Proportion des requêtes lentes ré-exécutées sous EXPLAIN (ANALYZE, BUFFERS) : 0 = jamais, 1 = toujours
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.2"))
+# Taille du tampon circulaire (les plus anciennes entrées sont écrasées)
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+# Préfixes de routes surveillées
+SLOW_QUERY_ROUTES = tuple(
+    p.strip() for p in os.getenv("SLOW_QUERY_ROUTES", "/analytics,/logs").split(",") if p.strip()
+)
+
+_buffer = deque(maxlen=SLOW_QUERY_BUFFER)
+_lock = threading.Lock()
+
+
+def _jsonable(parameters):
+    def conv(v):
+        return v if isinstance(v, (int, float, str, bool, type(None))) else str(v)
+
+    if isinstance(parameters, dict):
+        return {k: conv(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [conv(v) for v in parameters]
+    return conv(parameters)
+
+
+def _explain_prefix(statement: str):
+    """
+    SELECT simple : EXPLAIN (ANALYZE, BUFFERS), la requête est ré-exécutée.
+    WITH / INSERT / UPDATE / DELETE : EXPLAIN seul (un CTE peut modifier des données,
+    ANALYZE l'exécuterait une seconde fois). Autres instructions : pas de plan.
+    """
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if verb == "SELECT":
+        return "EXPLAIN (ANALYZE, BUFFERS) "
+    if verb in ("WITH", "INSERT", "UPDATE", "DELETE"):
+        return "EXPLAIN "
+    return None
+
+
+def _explain(cursor, prefix, statement, parameters):
+    """
+    Exécute la requête sous EXPLAIN sur la même connexion DBAPI (pas d'événement
+    SQLAlchemy, donc pas de récursion). Un SAVEPOINT protège la transaction en cours
+    si l'EXPLAIN échoue ; aucune erreur ne remonte jusqu'à la requête de l'utilisateur.
+    """
+    try:
+        cur = cursor.connection.cursor()
+    except Exception as e:
+        return None, str(e)
+    try:
+        cur.execute("SAVEPOINT slow_query_explain")
+        try:
+            cur.execute(prefix + statement, parameters)
+            plan = "\n".join(row[0] for row in cur.fetchall())
+            cur.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan, None
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return None, str(e)
+    except Exception as e:  # SAVEPOINT impossible (transaction interrompue, connexion perdue…)
+        return None, str(e)
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+
+
+def capture_slow_queries(engine):
+    """Branche la capture des requêtes lentes sur un moteur SQLAlchemy."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        push_start(conn, context, "slow_query_start")
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        pop_start(context, "slow_query_start")
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["slow_query_start"].pop()) * 1000
+        if duration_ms < SLOW_QUERY_MS:
+            return
+        stats = current_request.get()
+        if stats is None or not stats.route.startswith(SLOW_QUERY_ROUTES):
+            return
+
+        plan, plan_error = None, None
+        prefix = _explain_prefix(statement)
+        if prefix and not executemany and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE:
+            plan, plan_error = _explain(cursor, prefix, statement, parameters)
+
+        entry = {
+            "captured_at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "route": stats.route,
+            "duration_ms": round(duration_ms, 3),
+            "statement": statement.strip(),
+            "parameters": _jsonable(parameters),
+            "plan": plan,
+            "plan_error": plan_error,
+        }
+        with _lock:
+            _buffer.append(entry)
+
+
+def recent_slow_queries(limit: int = 50) -> list:
+    """Entrées les plus récentes d'abord."""
+    with _lock:
+        entries = list(_buffer)
+    return entries[::-1][:limit]
+
+
+def clear_slow_queries() -> int:
+    with _lock:
+        n = len(_buffer)
+        _buffer.clear()
+    return n
@@ -0,0 +1,65 @@
+# backend/tests/test_hll.py
+"""Estimateur HyperLogLog et encodage des registres (sans base de données)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.olap.hll import M, RELATIVE_ERROR, build_registers, decode, encode, estimate, positions
+
+# 4 écarts types : ne doit pas échouer par malchance, échoue si l'estimateur est faux
+TOLERANCE = 4 * RELATIVE_ERROR
+
+
+def _registers(values) -> np.ndarray:
+    idx, rho = positions(values)
+    registers = np.zeros(M, dtype=np.uint8)
+    np.maximum.at(registers, idx, rho)
+    return registers
+
+
+@pytest.mark.parametrize("n", [100, 1_000, 20_000, 200_000])
+def test_estimate_borne_erreur(n):
+    values = [f"C{i:08d}" for i in range(n)]
+    assert abs(estimate(_registers(values)) - n) <= TOLERANCE * n
+
+
+def test_doublons_ignores():
+    values = [f"T{i}" for i in range(5_000)]
+    assert estimate(_registers(values * 3)) == estimate(_registers(values))
+
+
+def test_fusion_egale_union():
+    a = _registers([f"C{i}" for i in range(0, 60_000)])
+    b = _registers([f"C{i}" for i in range(40_000, 100_000)])
+    union = _registers([f"C{i}" for i in range(100_000)])
+    assert np.array_equal(np.maximum(a, b), union)
+    assert abs(estimate(union) - 100_000) <= TOLERANCE * 100_000
+
+
+def test_encodage_creux_aller_retour():
+    registers = _registers([f"E{i}" for i in range(200)])
+    blob = encode(registers)
+    assert blob[:1] == b"\x01" and len(blob) < M
+    assert np.array_equal(decode(blob), registers)
+
+
+def test_encodage_dense_aller_retour():
+    registers = _registers([f"E{i}" for i in range(50_000)])
+    blob = encode(registers)
+    assert blob[:1] == b"\x00" and len(blob) == M + 1
+    assert np.array_equal(decode(blob), registers)
+
+
+def test_encodage_vide():
+    registers = np.zeros(M, dtype=np.uint8)
+    assert np.array_equal(decode(encode(registers)), registers)
+    assert estimate(registers) == 0
+
+
+def test_build_registers_par_groupe():
+    keys = pd.DataFrame({"id_date": [1] * 3_000 + [2] * 1_000, "valeur": ["all"] * 4_000})
+    values = [f"C{i}" for i in range(3_000)] + [f"C{i}" for i in range(1_000)]
+    out = build_registers(keys, values)
+    assert set(out) == {(1, "all"), (2, "all")}
+    assert np.array_equal(out[(2, "all")], _registers(values[3_000:]))
+    assert abs(estimate(out[(1, "all")]) - 3_000) <= TOLERANCE * 3_000
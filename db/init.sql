@@ -47,9 +47,25 @@ CREATE TABLE IF NOT EXISTS faits_ventes (
     id_client      VARCHAR(50),                    -- référent à dim_client.id_client
     id_employe     VARCHAR(50),                    -- référent à dim_employe.id_employe
     ean            BIGINT,                         -- référent à dim_produit.ean
-    id_ticket      VARCHAR(50)                     -- ID_TICKET
+    id_ticket      VARCHAR(50),                    -- ID_TICKET
+    quantite       INT           NOT NULL DEFAULT 1, -- quantité vendue
+    montant        NUMERIC(12,2)                   -- prix en vigueur à la vente * quantité
 );
 
+-- Migration d'une base existante : ajout des colonnes puis reprise au prix courant
+ALTER TABLE faits_ventes ADD COLUMN IF NOT EXISTS quantite INT NOT NULL DEFAULT 1;
+ALTER TABLE faits_ventes ADD COLUMN IF NOT EXISTS montant NUMERIC(12,2);
+UPDATE faits_ventes f
+   SET montant = p.prix * f.quantite
+  FROM dim_produit p
+ WHERE p.ean = f.ean
+   AND f.montant IS NULL;
+
+-- Filtres de période des endpoints analytics : prédicats entiers sur id_date
+CREATE INDEX IF NOT EXISTS ix_faits_ventes_id_date ON faits_ventes (id_date);
+-- Recalcul RFM incrémental des clients touchés
+CREATE INDEX IF NOT EXISTS ix_faits_ventes_id_client ON faits_ventes (id_client);
+
 -- table de pré-chargement brute (tout en TEXT pour accepter n’importe quoi)
 CREATE TABLE IF NOT EXISTS logs_stage (
   id_user      TEXT,
@@ -71,4 +87,113 @@ CREATE TABLE IF NOT EXISTS logs (
   field_name   VARCHAR(100),
   detail    TEXT
 
-);
\ No newline at end of file
+);
+
+-- Logs pivotés : une ligne par changement (table, id, opération, utilisateur, instant),
+-- champs modifiés en JSONB (cf. backend/etl/load_logs.py, backend/etl/apply_logs.py)
+CREATE TABLE IF NOT EXISTS logs_changes (
+  change_id    BIGSERIAL    PRIMARY KEY,
+  target_table VARCHAR(50)  NOT NULL,
+  target_id    VARCHAR(50)  NOT NULL,
+  operation    VARCHAR(10)  NOT NULL,
+  event_time   TIMESTAMP    NOT NULL,
+  id_user      VARCHAR(50),
+  champs       JSONB        NOT NULL,
+  applied_at   TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_logs_changes_target ON logs_changes (target_table, target_id);
+CREATE INDEX IF NOT EXISTS ix_logs_changes_pending ON logs_changes (target_table, operation) WHERE applied_at IS NULL;
+
+-- Rattrapage depuis les logs existants : migration logs_changes_rattrapage (backend/migrations.py)
+
+-- Compteurs de modifications par jour × utilisateur × table × opération,
+-- incrémentés à l'ingestion (cf. backend/etl/load_logs.py, GET /logs/stats)
+CREATE TABLE IF NOT EXISTS logs_stats_jour (
+  jour         DATE         NOT NULL,
+  id_user      VARCHAR(50)  NOT NULL,
+  target_table VARCHAR(50)  NOT NULL,
+  operation    VARCHAR(10)  NOT NULL,
+  nb           BIGINT       NOT NULL DEFAULT 0,
+  PRIMARY KEY (jour, id_user, target_table, operation)
+);
+
+-- Rattrapage depuis les logs existants
+INSERT INTO logs_stats_jour (jour, id_user, target_table, operation, nb)
+SELECT event_time::date, COALESCE(id_user, ''), COALESCE(target_table, ''), COALESCE(operation, ''), COUNT(*)
+FROM logs
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
+
+-- Features RFM par client (cf. backend/etl/rfm.py)
+CREATE TABLE IF NOT EXISTS client_rfm (
+  id_client      VARCHAR      PRIMARY KEY,
+  derniere_vente INT          NOT NULL,          -- id_date du dernier achat
+  recence_jours  INT          NOT NULL,
+  frequence      INT          NOT NULL,          -- nombre de tickets
+  montant        NUMERIC(14,2) NOT NULL,
+  r_score        SMALLINT     NOT NULL,
+  f_score        SMALLINT     NOT NULL,
+  m_score        SMALLINT     NOT NULL,
+  rfm            VARCHAR(3)   NOT NULL,
+  segment        VARCHAR(30)  NOT NULL,
+  maj_le         TIMESTAMP    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_client_rfm_segment ON client_rfm (segment);
+
+-- Sketches HyperLogLog par jour × dimension (cf. backend/olap/hll.py)
+CREATE TABLE IF NOT EXISTS hll_sketches (
+  metric     VARCHAR(20)  NOT NULL,               -- clients | tickets
+  dimension  VARCHAR(20)  NOT NULL,               -- all | employe | rayon
+  valeur     VARCHAR(100) NOT NULL,               -- '' pour 'all'
+  id_date    INT          NOT NULL,
+  registres  BYTEA        NOT NULL,
+  PRIMARY KEY (metric, dimension, valeur, id_date)
+);
+
+-- Index panier partagé par tous les workers (cf. backend/olap/basket.py)
+CREATE TABLE IF NOT EXISTS basket_pairs (
+  ean_a    BIGINT NOT NULL,                        -- ean_a < ean_b
+  ean_b    BIGINT NOT NULL,
+  tickets  BIGINT NOT NULL,                        -- tickets contenant les deux produits
+  PRIMARY KEY (ean_a, ean_b)
+);
+CREATE INDEX IF NOT EXISTS ix_basket_pairs_ean_b ON basket_pairs (ean_b);
+CREATE TABLE IF NOT EXISTS basket_items (
+  ean      BIGINT PRIMARY KEY,
+  tickets  BIGINT NOT NULL                         -- tickets contenant le produit
+);
+CREATE TABLE IF NOT EXISTS basket_meta (
+  cle      VARCHAR(30) PRIMARY KEY,                -- 'tickets', 'tickets.N' : nombre de tickets (somme)
+  valeur   BIGINT      NOT NULL
+);
+
+-- Lignes écartées par la validation des ETL (cf. backend/etl/validation.py, GET /etl/rejects)
+CREATE TABLE IF NOT EXISTS etl_rejects (
+  reject_id    BIGSERIAL    PRIMARY KEY,
+  run_id       VARCHAR(32)  NOT NULL,
+  source       VARCHAR(20)  NOT NULL,
+  sheet        VARCHAR(50)  NOT NULL,
+  row_ref      VARCHAR(100),
+  reason       VARCHAR(50)  NOT NULL,
+  raw          JSONB,
+  created_at   TIMESTAMP    NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_etl_rejects_run_id ON etl_rejects (run_id);
+CREATE INDEX IF NOT EXISTS ix_etl_rejects_reason ON etl_rejects (reason);
+
+-- Fichiers du répertoire de dépôt traités par l'ingestion continue (cf. backend/etl/watcher.py, GET /etl/files)
+CREATE TABLE IF NOT EXISTS etl_files (
+  file_id      BIGSERIAL    PRIMARY KEY,
+  kind         VARCHAR(20)  NOT NULL,
+  path         TEXT         NOT NULL,
+  sha256       VARCHAR(64)  NOT NULL UNIQUE,
+  size         BIGINT       NOT NULL,
+  status       VARCHAR(20)  NOT NULL,
+  run_id       VARCHAR(32),
+  summary      JSONB,
+  error        TEXT,
+  processed_at TIMESTAMP    NOT NULL DEFAULT now()
+);
+
+-- log_id était numéroté 1..n par le chargement : recale la séquence sur les identifiants existants
+SELECT setval('logs_log_id_seq', MAX(log_id)) FROM logs HAVING MAX(log_id) IS NOT NULL;